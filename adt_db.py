@@ -0,0 +1,149 @@
+"""
+Acceso a la tabla ADT_MESSAGES (esquema SEGMENTOS_HL7) mediante DB-API.
+Las funciones reciben una conexión DB-API cualquiera: Oracle (cx_Oracle) en producción
+o SQLite con el mismo esquema para pruebas locales sin Oracle Instant Client.
+Las filas se leen con una sola consulta y fetchmany(), sin cargar la tabla en memoria.
+"""
+# Importación de librerías estándar
+import sqlite3  # Base de datos local con el mismo esquema que Oracle
+import time  # Para las fechas de los datos de prueba
+
+# Configuración de conexión a Oracle
+ORACLE_USER = 'SEGMENTOS_HL7'
+ORACLE_PASSWORD = 'SEGMENTOS_HL7'
+ORACLE_HOST = '172.16.60.21'
+ORACLE_PORT = 1521
+ORACLE_SID = 'prdsgh2'
+
+FETCH_SIZE = 1000  # Filas por viaje de red (arraysize/prefetchrows y fetchmany)
+
+# Columnas de ADT_MESSAGES en el orden en que se seleccionan
+ADT_COLUMNS = (
+    'ADT_MESSAGE_ID', 'HL7_RAW_MESSAGE', 'MESSAGE_SENT_FLAG', 'CREATED_AT',
+    'MSH_FIELD_SEPARATOR', 'MSH_ENCODING_CHARACTERS', 'MSH_SENDING_APPLICATION',
+    'MSH_SENDING_FACILITY', 'MSH_RECEIVING_APPLICATION', 'MSH_RECEIVING_FACILITY',
+    'MSH_DATETIME_OF_MESSAGE', 'MSH_MESSAGE_TYPE', 'MSH_MESSAGE_CONTROL_ID',
+    'MSH_PROCESSING_ID', 'MSH_VERSION_ID', 'EVN_EVENT_TYPE_CODE', 'EVN_DATE_TIME_OF_EVENT',
+    'PID_SET_ID', 'PID_PATIENT_IDENTIFIER_LIST', 'PID_PATIENT_NAME_FAMILY',
+    'PID_PATIENT_NAME_GIVEN', 'PID_DATE_OF_BIRTH', 'PID_ADMIN_SEX', 'PV1_SET_ID',
+    'PV1_PATIENT_CLASS', 'PV1_ASSIGNED_PATIENT_LOCATION', 'PV1_ADMISSION_TYPE',
+    'PV1_ATTENDING_DOCTOR_ID',
+)
+
+# Consulta única con todas las columnas MSH/EVN/PID/PV1 (antes: una consulta extra por fila)
+ADT_SELECT = f"SELECT {', '.join(ADT_COLUMNS)} FROM ADT_MESSAGES"
+
+# Esquema equivalente en SQLite para pruebas
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ADT_MESSAGES (
+    ADT_MESSAGE_ID INTEGER PRIMARY KEY,
+    HL7_RAW_MESSAGE TEXT,
+    MESSAGE_SENT_FLAG CHAR(1) DEFAULT 'N',
+    CREATED_AT TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    MSH_FIELD_SEPARATOR TEXT, MSH_ENCODING_CHARACTERS TEXT, MSH_SENDING_APPLICATION TEXT,
+    MSH_SENDING_FACILITY TEXT, MSH_RECEIVING_APPLICATION TEXT, MSH_RECEIVING_FACILITY TEXT,
+    MSH_DATETIME_OF_MESSAGE TEXT, MSH_MESSAGE_TYPE TEXT, MSH_MESSAGE_CONTROL_ID TEXT,
+    MSH_PROCESSING_ID TEXT, MSH_VERSION_ID TEXT, EVN_EVENT_TYPE_CODE TEXT,
+    EVN_DATE_TIME_OF_EVENT TEXT, PID_SET_ID TEXT, PID_PATIENT_IDENTIFIER_LIST TEXT,
+    PID_PATIENT_NAME_FAMILY TEXT, PID_PATIENT_NAME_GIVEN TEXT, PID_DATE_OF_BIRTH TEXT,
+    PID_ADMIN_SEX TEXT, PV1_SET_ID TEXT, PV1_PATIENT_CLASS TEXT,
+    PV1_ASSIGNED_PATIENT_LOCATION TEXT, PV1_ADMISSION_TYPE TEXT, PV1_ATTENDING_DOCTOR_ID TEXT
+)
+"""
+
+
+# Función para conectarse a Oracle
+# Los CLOB (HL7_RAW_MESSAGE) se reciben como texto para no pedir cada LOB por separado
+def connect_oracle(user=ORACLE_USER, password=ORACLE_PASSWORD, host=ORACLE_HOST,
+                   port=ORACLE_PORT, sid=ORACLE_SID):
+    import cx_Oracle  # Solo es necesario con Oracle
+
+    def output_type_handler(cursor, name, default_type, size, precision, scale):
+        if default_type == cx_Oracle.DB_TYPE_CLOB:
+            return cursor.var(cx_Oracle.DB_TYPE_LONG, arraysize=cursor.arraysize)
+
+    dsn = cx_Oracle.makedsn(host, port, sid=sid)
+    conn = cx_Oracle.connect(user=user, password=password, dsn=dsn)
+    conn.outputtypehandler = output_type_handler
+    return conn
+
+
+# Función para abrir (o crear) una base SQLite con el esquema de ADT_MESSAGES
+def connect_sqlite(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute(SQLITE_SCHEMA)
+    conn.commit()
+    return conn
+
+
+# Excepciones de base de datos de los drivers disponibles (sqlite3 y, si está instalado, cx_Oracle)
+def database_errors():
+    errors = [sqlite3.DatabaseError]
+    try:
+        import cx_Oracle
+        errors.append(cx_Oracle.DatabaseError)
+    except ImportError:
+        pass
+    return tuple(errors)
+
+
+# Devuelve True si la conexión es SQLite (cambia el diccionario de tablas y los parámetros)
+def is_sqlite(conn):
+    return isinstance(conn, sqlite3.Connection)
+
+
+# Marcador del parámetro posicional n (1..N) según el paramstyle de la conexión
+def param(conn, n):
+    return '?' if is_sqlite(conn) else f':{n}'
+
+
+# Función para listar las tablas del esquema
+def list_tables(conn):
+    cur = conn.cursor()
+    if is_sqlite(conn):
+        cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")
+    else:
+        cur.execute("SELECT table_name FROM user_tables ORDER BY table_name")
+    tablas = [tabla for (tabla,) in cur.fetchall()]
+    cur.close()
+    return tablas
+
+
+# Generador de filas de ADT_MESSAGES como dict {columna: valor}
+# where: condición SQL opcional (con marcadores de param()), params: sus valores
+# Una sola consulta; las filas llegan en bloques de fetch_size con fetchmany()
+def iter_adt_rows(conn, where=None, params=(), fetch_size=FETCH_SIZE):
+    cur = conn.cursor()
+    cur.arraysize = fetch_size
+    if hasattr(cur, 'prefetchrows'):
+        cur.prefetchrows = fetch_size + 1  # cx_Oracle 8+: primer bloque en la misma ida y vuelta
+    sql = ADT_SELECT + (f" WHERE {where}" if where else '') + " ORDER BY ADT_MESSAGE_ID"
+    try:
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(fetch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(zip(ADT_COLUMNS, row))
+    finally:
+        cur.close()
+
+
+# Función para poblar una base SQLite con n mensajes ADT^A01 sintéticos (para pruebas)
+def populate_sqlite(conn, n, start_id=1):
+    now = time.strftime('%Y%m%d%H%M%S')
+    rows = []
+    for i in range(start_id, start_id + n):
+        ctrl_id = f'ADT{i:08d}'
+        rows.append((
+            i, f'MSH|^~\\&|HIS|HOSP|RIS|RAD|{now}||ADT^A01|{ctrl_id}|P|2.5', 'N',
+            '|', '^~\\&', 'HIS', 'HOSP', 'RIS', 'RAD', now, 'ADT^A01', ctrl_id, 'P', '2.5',
+            'A01', now, '1', f'{100000 + i}', f'APELLIDO{i % 97}', f'NOMBRE{i % 89}',
+            '19850315', 'MF'[i % 2], '1', 'I', 'RAD^101^1', 'R', f'MED{i % 13:03d}',
+        ))
+    columns = [c for c in ADT_COLUMNS if c != 'CREATED_AT']
+    conn.executemany(
+        f"INSERT INTO ADT_MESSAGES ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+        rows)
+    conn.commit()
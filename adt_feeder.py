@@ -0,0 +1,161 @@
+"""
+Alimentador de ADT pendientes hacia el RIS.
+Lee de ADT_MESSAGES solo las filas con MESSAGE_SENT_FLAG = 'N' por encima de una marca
+de agua sobre ADT_MESSAGE_ID, las envía por MLLP con la misma plantilla ADT^A01 del
+pipeline y marca el flag con un único executemany + commit por lote, solo tras el ACK.
+Funciona contra Oracle o contra SQLite (--sqlite RUTA --demo N) para pruebas locales.
+"""
+# Importación de librerías estándar
+import argparse  # Parámetros de línea de comandos
+import threading  # Evento de parada del bucle
+from itertools import islice  # Para limitar cada lote
+import adt_db  # Acceso a ADT_MESSAGES
+import adt_pipeline  # Conversión fila -> ER7
+import mllp  # Cliente MLLP con pool de conexiones
+from hl7_lazy import parse_header  # Lectura del MSA-1 del ACK
+
+# Destino por defecto: servidor MLLP del RIS (ris_simulator.py)
+RIS_HOST = 'localhost'
+RIS_PORT = 6662
+
+BATCH_SIZE = 500  # Filas por lote (un commit por lote)
+POLL_INTERVAL = 2.0  # Segundos de espera cuando no hay filas pendientes
+
+# Valores de MESSAGE_SENT_FLAG
+FLAG_PENDING = 'N'  # Pendiente de envío (valor por defecto de la tabla)
+FLAG_SENT = 'Y'  # Aceptado por el RIS (ACK AA)
+FLAG_REJECTED = 'E'  # Rechazado por el RIS (ACK AE/AR); no se reintenta
+
+
+# Alimentador de ADT_MESSAGES -> RIS
+# high_water: último ADT_MESSAGE_ID ya resuelto; cada consulta empieza por encima de él.
+# Las filas sin respuesta (timeout o conexión caída) siguen en 'N' y la marca de agua no
+# las supera, de modo que se reintentan en la siguiente pasada.
+class ADTFeeder:
+    def __init__(self, conn, host=RIS_HOST, port=RIS_PORT, batch_size=BATCH_SIZE,
+                 poll_interval=POLL_INTERVAL, pool=None):
+        self.conn = conn
+        self.host = host
+        self.port = port
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.pool = pool or mllp.pool
+        self.high_water = 0
+        self.sent = 0  # Filas marcadas como enviadas
+        self.rejected = 0  # Filas con ACK AE/AR
+        self.failed = 0  # Envíos sin respuesta (se reintentan)
+        self._stop = threading.Event()
+        p1, p2 = adt_db.param(conn, 1), adt_db.param(conn, 2)
+        self._where = f"MESSAGE_SENT_FLAG = {p1} AND ADT_MESSAGE_ID > {p2}"
+        self._update = f"UPDATE ADT_MESSAGES SET MESSAGE_SENT_FLAG = {p1} WHERE ADT_MESSAGE_ID = {p2}"
+
+    # Lee el siguiente lote de filas pendientes (como mucho batch_size)
+    def _next_batch(self):
+        rows = adt_db.iter_adt_rows(self.conn, where=self._where,
+                                    params=(FLAG_PENDING, self.high_water),
+                                    fetch_size=self.batch_size)
+        try:
+            return list(islice(rows, self.batch_size))
+        finally:
+            rows.close()
+
+    # Envía un lote y marca las filas con ACK; devuelve el número de filas procesadas
+    # Todos los mensajes del lote se envían en pipeline y después se recogen los ACK
+    def poll_once(self):
+        rows = self._next_batch()
+        if not rows:
+            return 0
+        futures = []
+        first_failed = None
+        for row in rows:
+            er7 = adt_pipeline.fields_er7(adt_pipeline.row_fields(row))
+            try:
+                client = self.pool.get(self.host, self.port)
+                futures.append((row['ADT_MESSAGE_ID'], client, client.send_async(er7)))
+            except (OSError, mllp.MLLPConnectionClosed) as e:
+                # RIS caído o conexión cerrada: la fila cuenta como fallida y el resto del
+                # lote no se envía; la marca de agua se queda antes de ella y run() espera
+                self.failed += 1
+                first_failed = row['ADT_MESSAGE_ID']
+                print(f"[FEEDER] No se pudo enviar a {self.host}:{self.port}: {e}; "
+                      f"se reintenta en {self.poll_interval} s")
+                break
+        updates = []
+        for message_id, client, future in futures:
+            try:
+                code = parse_header(future.result(self.pool.timeout)).segment_field('MSA', 1)
+            except TimeoutError:
+                client.abandon(future)  # Sale de los pendientes de la conexión; un ACK tardío se descarta
+                code = None
+            except Exception:
+                code = None
+            if code in ('AA', 'CA'):
+                updates.append((FLAG_SENT, message_id))
+                self.sent += 1
+            elif code in ('AE', 'AR', 'CE', 'CR'):
+                updates.append((FLAG_REJECTED, message_id))
+                self.rejected += 1
+            else:
+                self.failed += 1
+                if first_failed is None or message_id < first_failed:
+                    first_failed = message_id
+        if updates:
+            cur = self.conn.cursor()
+            cur.executemany(self._update, updates)
+            cur.close()
+            self.conn.commit()
+        last_id = rows[-1]['ADT_MESSAGE_ID']
+        self.high_water = first_failed - 1 if first_failed is not None else last_id
+        return len(rows)
+
+    # Bucle principal: lotes seguidos mientras haya pendientes; si no, espera poll_interval
+    # Un lote con fallos también espera, para no reintentar en bucle contra un RIS caído
+    def run(self, once=False):
+        while not self._stop.is_set():
+            failed = self.failed
+            n = self.poll_once()
+            idle = n < self.batch_size or self.failed != failed
+            if once and idle:
+                break
+            if idle:
+                self._stop.wait(self.poll_interval)
+
+    def stop(self):
+        self._stop.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sqlite', metavar='RUTA', help='Usar una base SQLite local en lugar de Oracle')
+    parser.add_argument('--demo', type=int, default=0, metavar='N',
+                        help='Insertar N mensajes de prueba en la base SQLite')
+    parser.add_argument('--host', default=RIS_HOST, help='Host MLLP del RIS')
+    parser.add_argument('--port', type=int, default=RIS_PORT, help='Puerto MLLP del RIS')
+    parser.add_argument('--lote', type=int, default=BATCH_SIZE, metavar='FILAS',
+                        help='Filas por lote (un commit por lote)')
+    parser.add_argument('--intervalo', type=float, default=POLL_INTERVAL, metavar='SEG',
+                        help='Segundos de espera cuando no hay filas pendientes')
+    parser.add_argument('--una-vez', action='store_true',
+                        help='Enviar los pendientes actuales y salir')
+    args = parser.parse_args(argv)
+
+    if args.sqlite:
+        conn = adt_db.connect_sqlite(args.sqlite)
+        if args.demo:
+            adt_db.populate_sqlite(conn, args.demo)
+    else:
+        conn = adt_db.connect_oracle()
+    feeder = ADTFeeder(conn, args.host, args.port, args.lote, args.intervalo)
+    print(f"[FEEDER] Enviando ADT pendientes a {args.host}:{args.port} en lotes de {args.lote}")
+    try:
+        feeder.run(once=args.una_vez)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
+        print(f"[FEEDER] Enviados: {feeder.sent} | Rechazados: {feeder.rejected} | "
+              f"Sin respuesta: {feeder.failed}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+"""
+Pipeline de reconstrucción de mensajes ADT desde ADT_MESSAGES.
+Cada etapa es un generador (filas -> dict de campos -> ER7 -> destino), de modo que la
+memoria es constante sea cual sea el tamaño de la tabla. Los destinos disponibles son
+stdout, un fichero rotativo y un servidor MLLP; el avance se informa en filas/s y bytes/s.
+"""
+# Importación de librerías estándar y de terceros
+import os  # Para rotar ficheros
+import sys  # Para stdout/stderr
+import time  # Para medir el rendimiento
+from collections import deque  # Ventanas de envíos MLLP y de bloques en vuelo
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait  # Modo multiproceso
+from itertools import islice  # Para trocear las filas en bloques
+from hl7apy.core import Message  # Camino lento para separadores no estándar
+import hl7_templates  # Plantilla ER7 de ADT^A01
+from hl7_lazy import parse_header  # Lectura del MSA-1 del ACK
+import mllp  # Cliente MLLP con pool de conexiones
+
+REPORT_INTERVAL = 5  # Segundos entre informes de avance
+ROTATE_BYTES = 64 * 1024 * 1024  # Tamaño máximo de cada fichero de salida
+ROTATE_BACKUPS = 5  # Ficheros rotados que se conservan
+MLLP_WINDOW = 100  # Mensajes MLLP en vuelo como máximo
+CHUNK_SIZE = 500  # Filas por bloque enviado a cada proceso
+CHUNKS_PER_WORKER = 2  # Bloques en vuelo por proceso (acota la memoria)
+
+# Correspondencia campo HL7 -> columna de ADT_MESSAGES
+FIELD_COLUMNS = {
+    'msh_1': 'MSH_FIELD_SEPARATOR', 'msh_2': 'MSH_ENCODING_CHARACTERS',
+    'msh_3': 'MSH_SENDING_APPLICATION', 'msh_4': 'MSH_SENDING_FACILITY',
+    'msh_5': 'MSH_RECEIVING_APPLICATION', 'msh_6': 'MSH_RECEIVING_FACILITY',
+    'msh_7': 'MSH_DATETIME_OF_MESSAGE', 'msh_9': 'MSH_MESSAGE_TYPE',
+    'msh_10': 'MSH_MESSAGE_CONTROL_ID', 'msh_11': 'MSH_PROCESSING_ID',
+    'msh_12': 'MSH_VERSION_ID',
+    'evn_1': 'EVN_EVENT_TYPE_CODE', 'evn_2': 'EVN_DATE_TIME_OF_EVENT',
+    'pid_1': 'PID_SET_ID', 'pid_3': 'PID_PATIENT_IDENTIFIER_LIST',
+    'pid_5': 'PID_PATIENT_NAME_FAMILY', 'pid_6': 'PID_PATIENT_NAME_GIVEN',
+    'pid_7': 'PID_DATE_OF_BIRTH', 'pid_8': 'PID_ADMIN_SEX',
+    'pv1_1': 'PV1_SET_ID', 'pv1_2': 'PV1_PATIENT_CLASS',
+    'pv1_3': 'PV1_ASSIGNED_PATIENT_LOCATION', 'pv1_4': 'PV1_ADMISSION_TYPE',
+    'pv1_7': 'PV1_ATTENDING_DOCTOR_ID',
+}
+
+
+# Función para pasar una fila de ADT_MESSAGES a un dict {campo HL7: valor}
+def row_fields(row):
+    fields = {name: row.get(column) or '' for name, column in FIELD_COLUMNS.items()}
+    fields['msh_1'] = fields['msh_1'] or '|'
+    fields['msh_2'] = fields['msh_2'] or '^~\\&'
+    return fields
+
+
+# Función para construir un mensaje HL7 ADT_A01 con hl7apy desde un dict de campos
+def build_adt_a01(fields):
+    msg = Message("ADT_A01", version="2.5")
+    for name, value in fields.items():
+        segment = getattr(msg, name.split('_')[0])
+        setattr(segment, name, value)
+    return msg
+
+
+# Función para generar el ER7 de un dict de campos
+# Con los separadores estándar se usa la plantilla (misma salida que hl7apy); si la fila
+# trae otros separadores se construye con hl7apy
+def fields_er7(fields):
+    if fields['msh_1'] == '|' and fields['msh_2'] == '^~\\&':
+        return hl7_templates.ADT_A01.render(fields)
+    return build_adt_a01(fields).to_er7()
+
+
+# Etapas del pipeline
+def rows_to_fields(rows):
+    for row in rows:
+        yield row_fields(row)
+
+
+def fields_to_er7(fields_iter):
+    for fields in fields_iter:
+        yield fields_er7(fields)
+
+
+# Función que ejecuta cada proceso: convierte un bloque de filas en una lista de ER7
+def _render_chunk(rows):
+    return [fields_er7(row_fields(row)) for row in rows]
+
+
+# Generador que trocea las filas en listas de chunk_size
+def _chunks(rows, chunk_size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Etapa filas -> ER7 repartida entre workers procesos
+# El proceso principal sigue leyendo de la base y envía bloques de chunk_size filas; como
+# mucho hay workers * CHUNKS_PER_WORKER bloques en vuelo, así la memoria no crece con la
+# tabla. ordered=True entrega los mensajes en el orden de las filas; con False se entregan
+# según terminan los bloques (más rendimiento si algún bloque es lento).
+def rows_to_er7_parallel(rows, workers, chunk_size=CHUNK_SIZE, ordered=True):
+    window = max(workers * CHUNKS_PER_WORKER, 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque() if ordered else set()
+        for chunk in _chunks(rows, chunk_size):
+            if len(pending) >= window:
+                yield from _collect(pending, ordered)
+            future = executor.submit(_render_chunk, chunk)
+            if ordered:
+                pending.append(future)
+            else:
+                pending.add(future)
+        while pending:
+            yield from _collect(pending, ordered)
+
+
+# Entrega los mensajes de los bloques terminados (el más antiguo si ordered)
+def _collect(pending, ordered):
+    if ordered:
+        yield from pending.popleft().result()
+        return
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    for future in done:
+        pending.discard(future)
+        yield from future.result()
+
+
+# Destino: salida estándar, un segmento por línea y una línea en blanco entre mensajes
+class StdoutSink:
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def write(self, er7):
+        self.stream.write(er7.replace('\r', '\n') + '\n\n')
+
+    def close(self):
+        self.stream.flush()
+
+
+# Destino: fichero de texto con un mensaje por línea (segmentos separados por \r)
+# Al superar max_bytes se rota como logging.handlers: ruta -> ruta.1 -> ... -> ruta.N
+class RotatingFileSink:
+    def __init__(self, path, max_bytes=ROTATE_BYTES, backup_count=ROTATE_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._file = open(path, 'ab')
+        self._size = self._file.tell()
+
+    def write(self, er7):
+        data = er7.encode() + b'\n'
+        if self._size and self._size + len(data) > self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._size += len(data)
+
+    def _rotate(self):
+        self._file.close()
+        for n in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f'{self.path}.{n}'):
+                os.replace(f'{self.path}.{n}', f'{self.path}.{n + 1}')
+        if self.backup_count:
+            os.replace(self.path, f'{self.path}.1')
+        self._file = open(self.path, 'wb')
+        self._size = 0
+
+    def close(self):
+        self._file.close()
+
+
+# Destino: servidor MLLP, con hasta window mensajes en vuelo sobre el pool de conexiones
+# acks cuenta los códigos MSA-1 recibidos; errors, los envíos sin respuesta
+class MLLPSink:
+    def __init__(self, host, port, window=MLLP_WINDOW, pool=None):
+        self.host = host
+        self.port = port
+        self.window = window
+        self.pool = pool or mllp.pool
+        self.acks = {}
+        self.errors = 0
+        self._in_flight = deque()
+
+    def write(self, er7):
+        if len(self._in_flight) >= self.window:
+            self._wait_oldest()
+        self._in_flight.append(self.pool.send_async(self.host, self.port, er7))
+
+    def _wait_oldest(self):
+        future = self._in_flight.popleft()
+        try:
+            ack = future.result(self.pool.timeout)
+        except Exception:
+            self.errors += 1
+            return
+        code = parse_header(ack).segment_field('MSA', 1)
+        self.acks[code] = self.acks.get(code, 0) + 1
+
+    def close(self):
+        while self._in_flight:
+            self._wait_oldest()
+
+
+# Contador de avance: filas, bytes y ritmo desde el inicio
+class Progress:
+    def __init__(self, interval=REPORT_INTERVAL, stream=None):
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.rows = 0
+        self.bytes = 0
+        self.start = time.monotonic()
+        self._next_report = self.start + interval
+
+    def add(self, nbytes):
+        self.rows += 1
+        self.bytes += nbytes
+        if self.interval and time.monotonic() >= self._next_report:
+            self.report()
+            self._next_report = time.monotonic() + self.interval
+
+    def report(self, final=False):
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        label = 'Total' if final else 'Avance'
+        self.stream.write(f"[pipeline] {label}: {self.rows} filas | {self.rows / elapsed:.0f} filas/s | "
+                          f"{self.bytes / elapsed / 1024:.1f} KB/s\n")
+        self.stream.flush()
+
+
+# Función para ejecutar el pipeline completo: filas -> campos -> ER7 -> destino
+# workers > 1 reparte la generación de ER7 entre procesos (ver rows_to_er7_parallel)
+# Devuelve el objeto Progress con los totales
+def run(rows, sink, report_interval=REPORT_INTERVAL, workers=1, chunk_size=CHUNK_SIZE,
+        ordered=True):
+    progress = Progress(report_interval)
+    if workers > 1:
+        messages = rows_to_er7_parallel(rows, workers, chunk_size, ordered)
+    else:
+        messages = fields_to_er7(rows_to_fields(rows))
+    try:
+        for er7 in messages:
+            sink.write(er7)
+            progress.add(len(er7.encode()))
+    finally:
+        sink.close()
+    progress.report(final=True)
+    return progress
@@ -0,0 +1,97 @@
+"""
+Benchmark del constructor ER7 por plantillas (hl7_templates) frente a hl7apy.
+Comprueba primero que ambos caminos generan exactamente el mismo ER7 para ADT^A04,
+OMI^O23, ORU^R01 y ACK (incluyendo valores con caracteres a escapar) y después
+mide mensajes/segundo de cada uno.
+Uso: python benchmarks/bench_er7_builder.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from hl7apy.core import Message  # noqa: E402
+import hl7_templates  # noqa: E402
+
+DURATION = 2.0  # Segundos por medición
+
+PACIENTE = {
+    'pid_3': '123456',
+    'pid_5': 'Pérez García^Juan Antonio',
+    'pid_7': '19850315',
+    'pid_8': 'M',
+}
+MSH = {'msh_3': 'HIS', 'msh_4': 'HOSP', 'msh_5': 'RIS', 'msh_6': 'RAD',
+       'msh_7': '20250101120000', 'msh_10': 'MSG0001'}
+
+CASOS = {
+    'ADT^A04': dict(MSH, **PACIENTE, pv1_2='I'),
+    'OMI^O23': dict(MSH, **PACIENTE, orc_2='ORD0001', orc_12='Dra. Ana Rodríguez',
+                    obr_2='ORD0001', obr_4='71020^RADIOGRAFIA TORAX^CPT4',
+                    obr_13='Tos persistente', obr_16='Dr. Carlos López',
+                    ipc_5='CR^RADIOGRAFIA^DCM'),
+    'ORU^R01': dict(MSH, **PACIENTE, orc_2='ORD0001', orc_12='Dr. Carlos López',
+                    obr_2='ORD0001', obr_4='71020^RADIOGRAFIA TORAX^CPT4',
+                    obr_13='Tos persistente', obr_16='Dr. Carlos López',
+                    obx_3='RADIOGRAFIA TORAX',
+                    obx_5='Sin infiltrados | sin derrame ~ ver C:\\informes \\H\\destacado\\N\\'),
+    'ACK': dict(MSH, msh_10='ACKMSG0001', msa_1='AA', msa_2='MSG0001'),
+}
+
+# Orden de asignación de campos por segmento en el camino hl7apy (el mismo que usaban los simuladores)
+ESTRUCTURA = {
+    'ADT^A04': ('ADT_A01', [('pid', (3, 5, 7, 8)), ('pv1', (2,))]),
+    'OMI^O23': ('OMI_O23', [('pid', (3, 5, 7, 8)), ('orc', (1, 2, 12)),
+                            ('obr', (2, 4, 16, 13)), ('ipc', (5,))]),
+    'ORU^R01': ('ORU_R01', [('pid', (3, 5, 7, 8)), ('orc', (2, 12)),
+                            ('obr', (2, 4, 16, 13)), ('obx', (1, 2, 3, 5))]),
+    'ACK': ('ACK', [('msa', (1, 2))]),
+}
+FIJOS = {'orc_1': 'NW', 'obx_1': '1', 'obx_2': 'TX'}
+
+
+# Construye el mensaje con hl7apy asignando campo a campo
+def build_hl7apy(message_type, values):
+    structure, segments = ESTRUCTURA[message_type]
+    msg = Message(structure, version='2.5')
+    for n in (3, 4, 5, 6, 7):
+        setattr(msg.msh, f'msh_{n}', values[f'msh_{n}'])
+    msg.msh.msh_9 = message_type
+    msg.msh.msh_10 = values['msh_10']
+    msg.msh.msh_11 = 'P'
+    msg.msh.msh_12 = '2.5'
+    for seg, fields in segments:
+        segment = getattr(msg, seg)
+        for n in fields:
+            name = f'{seg}_{n}'
+            if name == 'orc_1' and message_type == 'ORU^R01':
+                continue
+            setattr(segment, name, FIJOS.get(name, values.get(name, '')))
+    return msg.to_er7()
+
+
+def build_template(message_type, values):
+    return hl7_templates.render(message_type, values)
+
+
+def rate(func, message_type, values):
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < DURATION:
+        for _ in range(50):
+            func(message_type, values)
+        count += 50
+    return count / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    for message_type, values in CASOS.items():
+        a = build_hl7apy(message_type, values)
+        b = build_template(message_type, values)
+        assert a == b, f"{message_type} difiere:\nhl7apy:    {a!r}\nplantilla: {b!r}"
+    print("Salida idéntica byte a byte en los 4 tipos de mensaje.\n")
+    print(f"{'Tipo':>8} | {'hl7apy msg/s':>13} | {'plantilla msg/s':>15} | {'x':>6}")
+    for message_type, values in CASOS.items():
+        slow = rate(build_hl7apy, message_type, values)
+        fast = rate(build_template, message_type, values)
+        print(f"{message_type:>8} | {slow:>13.0f} | {fast:>15.0f} | {fast / slow:>6.1f}")
@@ -0,0 +1,62 @@
+"""
+Benchmark del tokenizador ER7 (hl7_tokens) frente al parseo con hl7apy (hl7_lazy).
+Lee los campos que usan los manejadores de los simuladores (MSH-9, MSH-10, PID-3.1,
+ORC-2, OBR-4) de un OMI^O23 y un ORU^R01; comprueba primero que ambos caminos devuelven
+los mismos valores y después mide mensajes/segundo de cada uno.
+Uso: python benchmarks/bench_er7_tokenizer.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import hl7_templates  # noqa: E402
+from hl7_lazy import parse_header  # noqa: E402
+from hl7_tokens import tokenize  # noqa: E402
+
+DURATION = 2.0  # Segundos por medición
+
+COMUNES = {'msh_3': 'HIS', 'msh_4': 'HOSP', 'msh_5': 'RIS', 'msh_6': 'RAD',
+           'msh_7': '20250101120000', 'msh_10': 'MSG0001',
+           'pid_3': '123456^^^HOSP^MR', 'pid_5': 'Pérez García^Juan Antonio', 'pid_7': '19850315',
+           'pid_8': 'M', 'orc_2': 'ORD0001', 'orc_12': 'Dr. Carlos López', 'obr_2': 'ORD0001',
+           'obr_4': '71020^RADIOGRAFIA TORAX^CPT4', 'obr_13': 'Tos persistente',
+           'obr_16': 'Dr. Carlos López'}
+CASOS = {
+    'OMI^O23': hl7_templates.render('OMI^O23', dict(COMUNES, ipc_5='CR^RADIOGRAFIA^DCM')),
+    'ORU^R01': hl7_templates.render('ORU^R01', dict(COMUNES, obx_3='RADIOGRAFIA TORAX',
+                                                    obx_5='Sin infiltrados ni consolidaciones.')),
+}
+
+
+def read_hl7apy(er7):
+    msg = parse_header(er7)
+    return (msg.msh_9, msg.control_id, msg.pid.pid_3.pid_3_1.value,
+            msg.orc.orc_2.value, msg.obr.obr_4.value)
+
+
+def read_tokens(er7):
+    msg = tokenize(er7)
+    return msg.msh_9, msg.control_id, msg['PID.3.1'], msg['ORC.2'], msg['OBR.4']
+
+
+def rate(func, er7):
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < DURATION:
+        for _ in range(10):
+            func(er7)
+        count += 10
+    return count / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    for message_type, er7 in CASOS.items():
+        a, b = read_hl7apy(er7), read_tokens(er7)
+        assert a == b, f"{message_type} difiere:\nhl7apy:  {a!r}\ntokens: {b!r}"
+    print("Mismos valores en los dos caminos.\n")
+    print(f"{'Tipo':>8} | {'hl7apy msg/s':>13} | {'tokens msg/s':>13} | {'x':>6}")
+    for message_type, er7 in CASOS.items():
+        slow = rate(read_hl7apy, er7)
+        fast = rate(read_tokens, er7)
+        print(f"{message_type:>8} | {slow:>13.0f} | {fast:>13.0f} | {fast / slow:>6.1f}")
@@ -0,0 +1,63 @@
+"""
+Benchmark del decodificador de bloques MLLP (mllp.MLLPFrameDecoder).
+Compara el rendimiento del decodificador incremental con el bucle original
+(data += chunk y split) para mensajes de 1 KB, 100 KB y 5 MB leídos en trozos de 64 KB.
+Uso: python benchmarks/bench_mllp_decoder.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from mllp import MLLP_SB, MLLP_EB, MLLP_CR, RECV_SIZE, MLLPFrameDecoder  # noqa: E402
+
+SIZES = [('1 KB', 1024), ('100 KB', 100 * 1024), ('5 MB', 5 * 1024 * 1024)]
+STREAM_BYTES = 64 * 1024 * 1024  # Bytes procesados por cada medición
+
+
+# Construye un flujo con varios bloques MLLP del tamaño indicado y lo parte en trozos de recv()
+def build_chunks(size):
+    body = b'MSH|^~\\&|RIS|RAD|HIS|HOSP|20250101000000||ORU^R01|ORU0001|P|2.5\rOBX|1|TX|RX||'
+    body += b'x' * max(size - len(body), 0)
+    block = MLLP_SB + body + MLLP_EB + MLLP_CR
+    stream = block * max(STREAM_BYTES // len(block), 1)
+    return [stream[i:i + RECV_SIZE] for i in range(0, len(stream), RECV_SIZE)], len(stream)
+
+
+# Bucle original de los simuladores: concatena y se queda con el último bloque de cada lectura
+def legacy(chunks):
+    frames = 0
+    data = b''
+    for chunk in chunks:
+        data += chunk
+        if MLLP_EB in chunk:
+            data.split(MLLP_SB)[-1].split(MLLP_EB)[0]
+            frames += 1
+            data = b''
+    return frames
+
+
+# Decodificador incremental
+def decoder(chunks):
+    dec = MLLPFrameDecoder(max_frame_size=8 * 1024 * 1024)
+    frames = 0
+    for chunk in chunks:
+        frames += len(dec.feed(chunk))
+    return frames
+
+
+def measure(func, chunks, total):
+    start = time.perf_counter()
+    frames = func(chunks)
+    elapsed = time.perf_counter() - start
+    return frames, total / elapsed / 1e6, frames / elapsed
+
+
+if __name__ == '__main__':
+    print(f"{'Tamaño':>8} | {'Método':>10} | {'Bloques':>8} | {'MB/s':>9} | {'Bloques/s':>10}")
+    for label, size in SIZES:
+        chunks, total = build_chunks(size)
+        for name, func in (('original', legacy), ('decoder', decoder)):
+            frames, mbps, fps = measure(func, chunks, total)
+            print(f"{label:>8} | {name:>10} | {frames:>8} | {mbps:>9.1f} | {fps:>10.0f}")
+    print("Nota: el bucle original pierde los bloques que llegan juntos en la misma lectura.")
@@ -0,0 +1,243 @@
+"""
+Generador de carga HIS -> RIS.
+Sintetiza pacientes, órdenes e IDs de control variados y envía ADT^A04 / OMI^O23 al RIS
+a un ritmo objetivo en lazo abierto (llegadas constantes o de Poisson) repartidos en N
+conexiones MLLP persistentes. La latencia de cada ACK se mide desde el instante en que
+el mensaje debía salir según el calendario (no desde el envío real), para no ocultar
+las colas cuando el RIS se satura, y se acumula en un histograma estilo HdrHistogram.
+"""
+# Importación de librerías estándar
+import argparse  # Parámetros de línea de comandos
+import random  # Datos sintéticos y llegadas de Poisson
+import threading  # Contadores compartidos con los hilos lectores MLLP
+import time  # Calendario de envíos
+from functools import partial  # Callback con el instante programado
+import his_simulator  # Constructores de mensajes y destino del RIS
+import hl7_trace  # Trazas HIS -> RIS -> HIS (segmento ZTR)
+from histogram import LatencyHistogram  # Percentiles de latencia
+from hl7_lazy import parse_header  # Lectura del MSA-1 del ACK
+from hl7_tokens import tokenize  # Cabecera y ZTR de los ORU^R01 recibidos
+from mllp import MLLPClient, MLLPServer  # Conexiones persistentes y receptor de ORU
+
+RATE = 100.0  # Mensajes por segundo
+DURATION = 30.0  # Segundos de carga
+CONNECTIONS = 4  # Conexiones MLLP concurrentes
+MAX_OUTSTANDING = 10000  # Mensajes sin ACK antes de frenar el calendario (protege la memoria)
+DRAIN_TIMEOUT = 30.0  # Segundos de espera de los ACK pendientes al terminar
+
+# Datos para pacientes y órdenes sintéticos
+NOMBRES = ('Juan', 'María', 'José', 'Carmen', 'Antonio', 'Ana', 'Manuel', 'Laura', 'Francisco',
+           'Isabel', 'David', 'Lucía', 'Javier', 'Elena', 'Carlos', 'Marta', 'Pablo', 'Sara')
+APELLIDOS = ('García', 'Rodríguez', 'González', 'Fernández', 'López', 'Martínez', 'Sánchez',
+             'Pérez', 'Gómez', 'Martín', 'Jiménez', 'Ruiz', 'Hernández', 'Díaz', 'Moreno',
+             'Muñoz', 'Álvarez', 'Romero')
+MOTIVOS = ('Tos persistente', 'Dolor torácico', 'Cefalea intensa', 'Dolor abdominal',
+           'Control rutinario', 'Traumatismo', 'Disnea', 'Fiebre sin foco')
+MEDICOS = ('Dra. Ana Rodríguez', 'Dr. Luis Navarro', 'Dra. Pilar Ortega', 'Dr. Jorge Castro')
+# (estudio, modalidad, OBR-4, IPC-5)
+ESTUDIOS = (
+    ('RADIOGRAFIA TORAX', 'CR', '71020^RADIOGRAFIA TORAX^CPT4', 'CR^RADIOGRAFIA^DCM'),
+    ('TOMOGRAFIA TORAX', 'CT', '71250^CT TORAX SIN CONTRASTE^CPT4', 'CT^TOMOGRAFIA COMPUTARIZADA^DCM'),
+    ('RM CEREBRAL', 'MR', '70551^RM CEREBRO SIN CONTRASTE^CPT4', 'MR^RESONANCIA MAGNETICA^DCM'),
+    ('ECOGRAFIA ABDOMINAL', 'US', '76700^ECOGRAFIA ABDOMEN COMPLETO^CPT4', 'US^ECOGRAFIA^DCM'),
+    ('MAMOGRAFIA', 'MG', '77067^MAMOGRAFIA DE CRIBADO^CPT4', 'MG^MAMOGRAFIA^DCM'),
+)
+ORDENES_POR_PACIENTE = (1, 1, 1, 2, 2, 3)  # Se elige una al azar para cada paciente
+
+
+# Función que genera un paciente sintético; n hace único el identificador
+def synthetic_patient(rng, n):
+    return {
+        'id': f'{500000 + n}',
+        'nombre': rng.choice(NOMBRES),
+        'apellido': f'{rng.choice(APELLIDOS)} {rng.choice(APELLIDOS)}',
+        'fecha_nac': f'{rng.randint(1930, 2020)}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}',
+        'sexo': rng.choice('MF'),
+        'motivo': rng.choice(MOTIVOS),
+    }
+
+
+# Generador infinito de (order_id, ER7): un ADT^A04 por paciente (order_id None) seguido
+# de sus OMI^O23. prefix: prefijo de MSH-10 y de los IDs de orden (distinto en cada ejecución)
+def synthetic_messages(rng, prefix):
+    seq = 0
+    patient_n = 0
+    while True:
+        patient_n += 1
+        paciente = synthetic_patient(rng, patient_n)
+        seq += 1
+        yield None, his_simulator.build_adt_a04(f'{prefix}{seq:08d}', paciente)
+        for _ in range(rng.choice(ORDENES_POR_PACIENTE)):
+            seq += 1
+            estudio, modality, obr4, ipc5 = rng.choice(ESTUDIOS)
+            order_id = f'O{prefix}{seq:08d}'
+            yield order_id, his_simulator.build_omi_o23(f'{prefix}{seq:08d}', order_id, estudio,
+                                                        modality, obr4, ipc5, paciente=paciente,
+                                                        medico=rng.choice(MEDICOS))
+
+
+# Generador de instantes de envío (segundos desde el inicio)
+# mode 'constant': intervalo fijo 1/rate; 'poisson': intervalos exponenciales de media 1/rate
+def arrival_offsets(rate, mode, rng):
+    t = 0.0
+    while True:
+        yield t
+        t += rng.expovariate(rate) if mode == 'poisson' else 1.0 / rate
+
+
+# Generador de carga en lazo abierto sobre N conexiones MLLP
+# Cada OMI^O23 lleva traza ZTR (hl7_trace): con --escuchar-oru se obtiene la latencia
+# por tramo HIS -> RIS -> HIS además de la del ACK.
+# run() devuelve un dict con rendimiento, códigos de ACK y percentiles de latencia (µs)
+class LoadGenerator:
+    def __init__(self, host, port, rate=RATE, duration=DURATION, connections=CONNECTIONS,
+                 arrivals='constant', seed=None, max_outstanding=MAX_OUTSTANDING):
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.duration = duration
+        self.connections = connections
+        self.arrivals = arrivals
+        self.rng = random.Random(seed)
+        self.max_outstanding = max_outstanding
+        self.latency = LatencyHistogram()
+        self.sent = 0
+        self.acks = {}  # Código MSA-1 -> cuenta
+        self.errors = 0  # Envíos fallidos o sin respuesta
+        self.max_lag = 0.0  # Mayor retraso del envío real frente al calendario (s)
+        self._clients = [None] * connections
+        self._outstanding = 0
+        self._cond = threading.Condition()
+
+    # Conexión i (se reabre si el RIS la cerró)
+    def _client(self, i):
+        client = self._clients[i]
+        if client is None or client.closed:
+            client = self._clients[i] = MLLPClient(self.host, self.port)
+        return client
+
+    # Callback del ACK (hilo lector MLLP): latencia desde el instante programado
+    def _done(self, scheduled, stamps, future):
+        latency = time.perf_counter() - scheduled
+        if stamps:
+            hl7_trace.recorder.record(dict(stamps, omi_ack=hl7_trace.now_us()))
+        try:
+            code = parse_header(future.result()).segment_field('MSA', 1)
+        except Exception:
+            code = None
+        with self._cond:
+            if code is None:
+                self.errors += 1
+            else:
+                self.acks[code] = self.acks.get(code, 0) + 1
+            self._outstanding -= 1
+            self._cond.notify_all()
+        if code is not None:
+            self.latency.record(latency * 1e6)
+
+    def run(self):
+        prefix = f'L{int(time.time()) % 100000:05d}'
+        messages = synthetic_messages(self.rng, prefix)
+        start = time.perf_counter()
+        for i, offset in enumerate(arrival_offsets(self.rate, self.arrivals, self.rng)):
+            if offset >= self.duration:
+                break
+            order_id, er7 = next(messages)
+            scheduled = start + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                self.max_lag = max(self.max_lag, -delay)
+            with self._cond:
+                while self._outstanding >= self.max_outstanding:
+                    self._cond.wait()
+                self._outstanding += 1
+            stamps = None
+            if order_id:
+                stamps = {'omi_send': hl7_trace.now_us()}
+                hl7_trace.recorder.start(order_id, stamps)
+                er7 = hl7_trace.with_trace(er7, order_id, stamps)
+            try:
+                future = self._client(i % self.connections).send_async(er7)
+            except OSError:
+                with self._cond:
+                    self._outstanding -= 1
+                    self.errors += 1
+                continue
+            self.sent += 1
+            future.add_done_callback(partial(self._done, scheduled, stamps))
+        send_elapsed = time.perf_counter() - start
+        with self._cond:
+            self._cond.wait_for(lambda: self._outstanding == 0, DRAIN_TIMEOUT)
+        elapsed = time.perf_counter() - start
+        for client in self._clients:
+            if client is not None:
+                client.close()
+        return {
+            'sent': self.sent,
+            'acks': dict(self.acks),
+            'errors': self.errors,
+            'pending': self._outstanding,
+            'send_rate': self.sent / send_elapsed if send_elapsed else 0.0,
+            'ack_rate': sum(self.acks.values()) / elapsed if elapsed else 0.0,
+            'max_lag': self.max_lag,
+            'latency': self.latency,
+        }
+
+
+# Servidor ligero en el puerto del HIS que responde AA a los ORU^R01 del RIS y cierra su
+# traza (sustituye a his_simulator.on_his_message, que imprime cada mensaje)
+def oru_sink(port):
+    received = {'oru': 0}
+
+    def on_message(hl7, conn):
+        msg = tokenize(hl7)
+        if msg.msh_9.startswith('ORU'):
+            received['oru'] += 1
+            trace_id, stamps = hl7_trace.read_trace(msg)
+            if trace_id:
+                stamps['his_recv'] = hl7_trace.now_us()
+                hl7_trace.recorder.finish(trace_id, stamps)
+            conn.sendall(his_simulator.ACKS.frame(msg.control_id, 'AA'))
+
+    server = MLLPServer('localhost', port, on_message, name='HIS-LOAD').start()
+    return server, received
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default=his_simulator.RIS_MLLP_SERVER_HOST, help='Host MLLP del RIS')
+    parser.add_argument('--port', type=int, default=his_simulator.RIS_MLLP_SERVER_PORT,
+                        help='Puerto MLLP del RIS')
+    parser.add_argument('--ritmo', type=float, default=RATE, metavar='MSG/S', help='Mensajes por segundo')
+    parser.add_argument('--duracion', type=float, default=DURATION, metavar='SEG', help='Segundos de carga')
+    parser.add_argument('--conexiones', type=int, default=CONNECTIONS, metavar='N',
+                        help='Conexiones MLLP concurrentes')
+    parser.add_argument('--llegadas', choices=('constant', 'poisson'), default='constant',
+                        help='Distribución de los instantes de envío')
+    parser.add_argument('--semilla', type=int, default=None, help='Semilla para repetir la misma carga')
+    parser.add_argument('--escuchar-oru', action='store_true',
+                        help='Responder los ORU^R01 del RIS en el puerto del HIS')
+    args = parser.parse_args(argv)
+
+    oru = None
+    if args.escuchar_oru:
+        server, oru = oru_sink(his_simulator.HIS_MLLP_SERVER_PORT)
+    gen = LoadGenerator(args.host, args.port, args.ritmo, args.duracion, args.conexiones,
+                        args.llegadas, args.semilla)
+    print(f"[CARGA] {args.ritmo:g} msg/s ({args.llegadas}) durante {args.duracion:g} s "
+          f"en {args.conexiones} conexiones -> {args.host}:{args.port}")
+    r = gen.run()
+    print(f"[CARGA] Enviados: {r['sent']} ({r['send_rate']:.1f} msg/s) | ACK: {r['acks']} "
+          f"({r['ack_rate']:.1f} msg/s) | Errores: {r['errors']} | Sin ACK: {r['pending']}")
+    print(f"[CARGA] Retraso máximo del calendario: {r['max_lag'] * 1000:.1f} ms")
+    print(f"[CARGA] Latencia ACK: {r['latency'].summary()}")
+    if oru is not None:
+        print(f"[CARGA] ORU^R01 recibidos: {oru['oru']}")
+        for linea in hl7_trace.recorder.summary():
+            print(f"[CARGA]   {linea}")
+
+
+if __name__ == '__main__':
+    main()
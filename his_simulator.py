@@ -3,12 +3,18 @@ Simulador HIS para flujo HL7 v2 con RIS/PACS usando hl7apy y MLLP.
 Actúa como cliente MLLP (envía ADT, OMI) y servidor MLLP (recibe ACK, ORU).
 """
 # Importación de librerías estándar y de terceros
-import socket  # Para comunicación de red
-import threading  # Para ejecución en hilos
-import time  # Para delays y timestamps
-import requests  # Para enviar logs al monitor web
-from hl7apy.core import Message  # Para construir mensajes HL7
-from hl7apy.parser import parse_message  # Para parsear mensajes HL7
+import itertools  # Contador de MSH-10
+import os  # Ritmo configurable por variable de entorno
+import time  # Para timestamps
+from concurrent.futures import TimeoutError as FutureTimeout  # ACK que no llega a tiempo
+import pacing  # Ritmo de los pasos (presentación, rápido, ritmo fijo, replay)
+import sim_log  # Registro por niveles (consola y monitor web) con muestreo
+from hl7_tokens import tokenize  # Tokenizador ER7: campos por desplazamientos, sin árbol de hl7apy
+from mllp import send_mllp_message, MLLPServer  # Cliente y servidor MLLP compartidos
+import hl7_templates  # Plantillas ER7 precompiladas para construir mensajes
+import hl7_outbox  # Cola de salida persistente hacia el RIS
+import hl7_trace  # Trazas HIS -> RIS -> HIS (segmento ZTR)
+import metrics  # Registro de métricas y endpoint /metrics
 
 # Configuración de puertos y hosts para MLLP
 HIS_MLLP_SERVER_HOST = 'localhost'  # Host local para el servidor HIS
@@ -16,10 +22,13 @@ HIS_MLLP_SERVER_PORT = 6661  # Puerto donde el HIS escucha ACK y ORU
 RIS_MLLP_SERVER_HOST = 'localhost'  # Host local para el RIS
 RIS_MLLP_SERVER_PORT = 6662  # Puerto donde el RIS escucha ADT y OMI
 
-# Caracteres especiales del protocolo MLLP
-MLLP_SB = b'\x0b'  # <VT> - Start Block
-MLLP_EB = b'\x1c'  # <FS> - End Block
-MLLP_CR = b'\x0d'  # <CR> - Carriage Return
+# Límites del servidor MLLP
+MLLP_BACKLOG = 1024  # Conexiones pendientes de aceptar
+MLLP_READ_LIMIT = 16 * 1024 * 1024  # Tamaño máximo de un bloque MLLP por conexión (bytes)
+
+# Endpoint de métricas (formato Prometheus): http://localhost:9661/metrics
+METRICS_PORT = 9661
+PARSE_ERRORS = metrics.counter('hl7_parse_errors_total', 'Mensajes HL7 recibidos que no se pudieron parsear')
 
 # Datos simulados de paciente y médicos
 PACIENTE = {
@@ -33,136 +42,100 @@ PACIENTE = {
 MEDICO_SOLICITANTE = 'Dra. Ana Rodríguez'  # Médico que solicita el estudio
 RADIOLOGO = 'Dr. Carlos López'  # Radiólogo que informa
 
-# Bandera y tiempo de delay para presentación didáctica
-DEMO_DELAY = True  # Si es True, agrega pausas entre pasos
-DEMO_DELAY_SECONDS = 7  # Segundos de pausa
+# Ritmo de los pasos del flujo (pacing.py): 'presentacion:7' deja 7 s entre pasos para
+# la demo, 'rapido' los encadena sin pausas (pruebas de rendimiento) y 'ritmo:N' da N pasos/s
+# Solo espera el script principal; on_his_message responde siempre en el acto
+PACING = os.environ.get('HL7_PACING', pacing.DEFAULT_SPEC)
+
+# Cola de salida persistente (hl7_outbox.py): los ADT/OMI se guardan en disco antes de
+# enviarlos y se reenvían si el RIS está caído o el HIS se reinicia ('' la desactiva)
+OUTBOX_DIR = os.environ.get('HL7_OUTBOX_DIR', 'outbox_his')
+ACK_TIMEOUT = 30  # Segundos esperando el ACK antes de seguir (el mensaje queda en la cola)
+
+# MSH-10 únicos por ejecución: prefijo de la ejecución (centésimas de segundo en hexadecimal)
+# más un contador. El RIS descarta como duplicado un MSH-10 ya visto en su ventana de
+# duplicados (DEDUP_WINDOW, una hora), así que repetir IDs fijos entre ejecuciones haría
+# que una segunda ejecución contra el mismo RIS no procesara ninguna orden
+RUN_ID = f'{int(time.time() * 100):x}'
+_msg_ids = itertools.count(1)
+
+
+# Devuelve el siguiente MSH-10 de esta ejecución (p. ej. MSG18a3f0c2b10001)
+def nuevo_msg_id():
+    return f'MSG{RUN_ID}{next(_msg_ids):04d}'
 
 # Función para enviar mensajes HL7 usando MLLP como cliente
-# host: destino, port: puerto destino, hl7_message: mensaje HL7 en string
-# Devuelve el mensaje HL7 recibido como respuesta (ACK, ORU, etc.)
-def send_mllp_message(host, port, hl7_message):
-    with socket.create_connection((host, port)) as s:
-        mllp_msg = MLLP_SB + hl7_message.encode() + MLLP_EB + MLLP_CR
-        s.sendall(mllp_msg)
-        data = b''
-        while True:
-            chunk = s.recv(4096)
-            if not chunk:
-                break
-            data += chunk
-            if MLLP_EB in chunk:
-                break
-        if data:
-            # Extrae el mensaje HL7 del bloque MLLP
-            hl7 = data.split(MLLP_SB)[-1].split(MLLP_EB)[0].decode(errors='ignore')
-            return hl7
-        return None
+# Se reutiliza el cliente de mllp.py: conexiones persistentes por (host, puerto),
+# reconexión automática y correlación del ACK por MSH-10.
+# send_mllp_message(host, port, hl7_message) devuelve la respuesta (ACK, ORU, etc.)
 
 # Función para levantar un servidor MLLP que recibe mensajes HL7
 # port: puerto a escuchar, on_message: función callback para procesar cada mensaje recibido
+# El servidor asyncio de mllp.py atiende muchas conexiones persistentes a la vez y
+# ejecuta on_message(hl7, conn) en un pool de hilos; conn.sendall() envía la respuesta.
 def mllp_server(port, on_message):
-    def server():
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            s.bind(('localhost', port))
-            s.listen(1)
-            print(f"[HIS] Servidor MLLP escuchando en puerto {port}")
-            while True:
-                conn, addr = s.accept()
-                with conn:
-                    data = b''
-                    while True:
-                        chunk = conn.recv(4096)
-                        if not chunk:
-                            break
-                        data += chunk
-                        if MLLP_EB in chunk:
-                            break
-                    if data:
-                        # Extrae el mensaje HL7 y lo pasa al callback
-                        hl7 = data.split(MLLP_SB)[-1].split(MLLP_EB)[0].decode(errors='ignore')
-                        on_message(hl7, conn)
-    threading.Thread(target=server, daemon=True).start()
+    server = MLLPServer('localhost', port, on_message, backlog=MLLP_BACKLOG,
+                        read_limit=MLLP_READ_LIMIT, name='HIS').start()
+    log.info("Servidor MLLP escuchando en puerto %s", port)
+    return server
 
 # Creación de mensajes HL7
 
-# Función para construir un mensaje ADT_A01 (registro de paciente)
+# Los mensajes se generan con las plantillas precompiladas de hl7_templates.py, que
+# producen el mismo ER7 que hl7apy (Message(...).to_er7()) sin construir el árbol de objetos.
+
+# Función para obtener los campos PID de un paciente (por defecto, el paciente simulado)
+def campos_paciente(paciente=PACIENTE):
+    return {
+        'pid_3': paciente['id'],
+        'pid_5': f"{paciente['apellido']}^{paciente['nombre']}",
+        'pid_7': paciente['fecha_nac'],
+        'pid_8': paciente['sexo'],
+    }
+
+# Función para construir un mensaje ADT^A04 (registro de paciente)
 # msg_ctrl_id: ID de control del mensaje (para correlacionar con ACK)
-# Devuelve el mensaje ADT_A01 en formato ER7
-def build_adt_a04(msg_ctrl_id):
-    # Cambiar ADT_A04 por ADT_A01 (estructura base compatible en hl7apy)
-    msg = Message("ADT_A01", version="2.5")
-    msg.msh.msh_3 = 'HIS'
-    msg.msh.msh_4 = 'HOSP'
-    msg.msh.msh_5 = 'RIS'
-    msg.msh.msh_6 = 'RAD'
-    msg.msh.msh_7 = time.strftime('%Y%m%d%H%M%S')
-    msg.msh.msh_9 = 'ADT^A04'
-    msg.msh.msh_10 = msg_ctrl_id
-    msg.msh.msh_11 = 'P'
-    msg.msh.msh_12 = '2.5'
-    msg.pid.pid_3 = PACIENTE['id']
-    msg.pid.pid_5 = f"{PACIENTE['apellido']}^{PACIENTE['nombre']}"
-    msg.pid.pid_7 = PACIENTE['fecha_nac']
-    msg.pid.pid_8 = PACIENTE['sexo']
-    msg.pv1.pv1_2 = 'I'
-    return msg.to_er7()
+# paciente: dict con los datos del paciente (por defecto PACIENTE)
+# Devuelve el mensaje ADT^A04 en formato ER7 (estructura ADT_A01 de hl7apy)
+def build_adt_a04(msg_ctrl_id, paciente=PACIENTE):
+    return hl7_templates.ADT_A04.render(dict(
+        campos_paciente(paciente),
+        msh_3='HIS', msh_4='HOSP', msh_5='RIS', msh_6='RAD',
+        msh_10=msg_ctrl_id,
+        pv1_2='I',
+    ))
 
 # Función para construir un mensaje OMI_O23 (orden de estudio)
 # msg_ctrl_id: ID de control del mensaje, order_id: ID de la orden
 # estudio: nombre del estudio, modality: modalidad del estudio (ej. CR, CT)
 # obr4: código y descripción del procedimiento (CPT4), ipc5: código del ítem en el paquete
+# paciente: dict con los datos del paciente (por defecto PACIENTE)
+# medico: médico solicitante (por defecto MEDICO_SOLICITANTE)
 # Devuelve el mensaje OMI_O23 en formato ER7
-def build_omi_o23(msg_ctrl_id, order_id, estudio, modality, obr4, ipc5):
-    # Usar la estructura OMI_O23 para mensajes OMI^O23 (no OML_O21)
-    try:
-        msg = Message("OMI_O23", version="2.5")
-        msg.msh.msh_3 = 'HIS'
-        msg.msh.msh_4 = 'HOSP'
-        msg.msh.msh_5 = 'RIS'
-        msg.msh.msh_6 = 'RAD'
-        msg.msh.msh_7 = time.strftime('%Y%m%d%H%M%S')
-        msg.msh.msh_9 = 'OMI^O23'
-        msg.msh.msh_10 = msg_ctrl_id
-        msg.msh.msh_11 = 'P'
-        msg.msh.msh_12 = '2.5'
-        msg.pid.pid_3 = PACIENTE['id']
-        msg.pid.pid_5 = f"{PACIENTE['apellido']}^{PACIENTE['nombre']}"
-        msg.pid.pid_7 = PACIENTE['fecha_nac']
-        msg.pid.pid_8 = PACIENTE['sexo']
-        msg.orc.orc_1 = 'NW'
-        msg.orc.orc_2 = order_id
-        msg.orc.orc_12 = MEDICO_SOLICITANTE
-        msg.obr.obr_2 = order_id
-        msg.obr.obr_4 = obr4
-        msg.obr.obr_16 = RADIOLOGO
-        msg.obr.obr_13 = PACIENTE['motivo']
-        # El segmento IPC no es estándar en OMI_O23, solo agregar si la estructura lo permite
-        if hasattr(msg, 'ipc'):
-            msg.ipc.ipc_5 = ipc5
-        return msg.to_er7()
-    except Exception as e:
-        print(f"[HIS] Error construyendo OMI^O23: {e}")
-        return ''
+def build_omi_o23(msg_ctrl_id, order_id, estudio, modality, obr4, ipc5, paciente=PACIENTE,
+                  medico=MEDICO_SOLICITANTE):
+    return hl7_templates.OMI_O23.render(dict(
+        campos_paciente(paciente),
+        msh_3='HIS', msh_4='HOSP', msh_5='RIS', msh_6='RAD',
+        msh_10=msg_ctrl_id,
+        orc_2=order_id,
+        orc_12=medico,
+        obr_2=order_id,
+        obr_4=obr4,
+        obr_13=paciente['motivo'],
+        obr_16=RADIOLOGO,
+        ipc_5=ipc5,
+    ))
+
+# Fábrica de ACK con el MSH precalculado (RIS/RAD -> HIS/HOSP); frame() da los bytes MLLP
+ACKS = hl7_templates.ack_factory('RIS', 'RAD', 'HIS', 'HOSP')
 
 # Función para construir un mensaje ACK (acknowledgment)
 # msg_ctrl_id: ID de control del mensaje original
 # ack_code: código de ACK, 'AA' para acknowledgment positivo
 # Devuelve el mensaje ACK en formato ER7
 def build_ack(msg_ctrl_id, ack_code='AA'):
-    msg = Message("ACK", version="2.5")
-    msg.msh.msh_3 = 'RIS'
-    msg.msh.msh_4 = 'RAD'
-    msg.msh.msh_5 = 'HIS'
-    msg.msh.msh_6 = 'HOSP'
-    msg.msh.msh_7 = time.strftime('%Y%m%d%H%M%S')
-    msg.msh.msh_9 = 'ACK'
-    msg.msh.msh_10 = f"ACK{msg_ctrl_id}"
-    msg.msh.msh_11 = 'P'
-    msg.msh.msh_12 = '2.5'
-    msg.msa.msa_1 = ack_code
-    msg.msa.msa_2 = msg_ctrl_id
-    return msg.to_er7()
+    return ACKS.er7(msg_ctrl_id, ack_code)
 
 # Función para construir un mensaje ORU_R01 (informe de resultado)
 # msg_ctrl_id: ID de control del mensaje, order_id: ID de la orden
@@ -170,119 +143,136 @@ def build_ack(msg_ctrl_id, ack_code='AA'):
 # obx5: resultado del estudio
 # Devuelve el mensaje ORU_R01 en formato ER7
 def build_oru_r01(msg_ctrl_id, order_id, estudio, obr4, obx5):
-    msg = Message("ORU_R01", version="2.5")
-    msg.msh.msh_3 = 'RIS'
-    msg.msh.msh_4 = 'RAD'
-    msg.msh.msh_5 = 'HIS'
-    msg.msh.msh_6 = 'HOSP'
-    msg.msh.msh_7 = time.strftime('%Y%m%d%H%M%S')
-    msg.msh.msh_9 = 'ORU^R01'
-    msg.msh.msh_10 = msg_ctrl_id
-    msg.msh.msh_11 = 'P'
-    msg.msh.msh_12 = '2.5'
-    msg.pid.pid_3 = PACIENTE['id']
-    msg.pid.pid_5 = f"{PACIENTE['apellido']}^{PACIENTE['nombre']}"
-    msg.pid.pid_7 = PACIENTE['fecha_nac']
-    msg.pid.pid_8 = PACIENTE['sexo']
-    msg.orc.orc_2 = order_id
-    msg.orc.orc_12 = RADIOLOGO
-    msg.obr.obr_2 = order_id
-    msg.obr.obr_4 = obr4
-    msg.obr.obr_16 = RADIOLOGO
-    msg.obr.obr_13 = PACIENTE['motivo']
-    msg.obx.obx_1 = '1'
-    msg.obx.obx_2 = 'TX'
-    msg.obx.obx_3 = estudio
-    msg.obx.obx_5 = obx5
-    return msg.to_er7()
+    return hl7_templates.ORU_R01.render(dict(
+        campos_paciente(),
+        msh_3='RIS', msh_4='RAD', msh_5='HIS', msh_6='HOSP',
+        msh_10=msg_ctrl_id,
+        orc_2=order_id,
+        orc_12=RADIOLOGO,
+        obr_2=order_id,
+        obr_4=obr4,
+        obr_13=PACIENTE['motivo'],
+        obr_16=RADIOLOGO,
+        obx_3=estudio,
+        obx_5=obx5,
+    ))
 
-# Función para enviar logs al monitor web
-# msg: mensaje a enviar, source: fuente del mensaje (por defecto 'HIS')
-def web_log(msg, source='HIS'):
+# Cola de salida hacia el RIS; la crea main() (None: envío directo sin persistencia)
+outbox = None
+
+# Función para enviar un mensaje al RIS y esperar su ACK
+# Con cola de salida el mensaje queda en disco antes de enviarse; si el ACK no llega en
+# ACK_TIMEOUT segundos devuelve None y el mensaje se entregará cuando el RIS responda
+def enviar_al_ris(hl7_msg):
+    if outbox is None:
+        return send_mllp_message(RIS_MLLP_SERVER_HOST, RIS_MLLP_SERVER_PORT, hl7_msg)
     try:
-        requests.post('http://localhost:5000/log', json={'source': source, 'msg': msg})
-    except Exception:
-        pass
+        return outbox.put(hl7_msg).result(ACK_TIMEOUT)
+    except FutureTimeout:
+        log.warning("Sin ACK del RIS en %s s; el mensaje sigue en la cola de salida (%s pendientes)",
+                    ACK_TIMEOUT, outbox.pending)
+        return None
+
+# Función para enviar una orden OMI^O23 al RIS con traza de extremo a extremo
+# Añade el segmento ZTR (trace_id = order_id, marca omi_send), abre la traza y registra
+# el tramo omi_send -> omi_ack al recibir el ACK. Devuelve el ACK recibido.
+def enviar_orden(omi_msg, order_id):
+    stamps = {'omi_send': hl7_trace.now_us()}
+    hl7_trace.recorder.start(order_id, stamps)
+    ack = enviar_al_ris(hl7_trace.with_trace(omi_msg, order_id, stamps))
+    if ack is not None:
+        hl7_trace.recorder.record(dict(stamps, omi_ack=hl7_trace.now_us()))
+    return ack
+
+# Registro del HIS: consola y monitor web (los cuerpos HL7 van en DEBUG)
+# HL7_LOG_LEVEL / HL7_WEB_LOG_LEVEL / HL7_LOG_SAMPLE ajustan niveles y muestreo
+log = sim_log.SimLogger('HIS')
 
 # Manejo de mensajes recibidos por el HIS
 
 # Función que procesa los mensajes HL7 recibidos en el HIS
 # hl7: mensaje HL7 en formato string, conn: conexión del socket
 def on_his_message(hl7, conn):
-    print(f"\n[HIS] Recibido mensaje HL7:\n{hl7}\n")
-    web_log(f"Recibido mensaje HL7:\n{hl7}")
+    log.begin_message()
+    log.debug("Recibido mensaje HL7:\n%s", hl7)
     if not hl7.strip():
-        print("[HIS] Advertencia: Mensaje vacío recibido. Ignorando.")
-        web_log("Advertencia: Mensaje vacío recibido. Ignorando.")
+        log.warning("Advertencia: Mensaje vacío recibido. Ignorando.")
         return
     try:
-        # Intenta parsear el mensaje HL7
-        msg = parse_message(hl7, find_groups=False)
+        # Tokeniza el mensaje HL7 (los campos se leen por ruta sin construir objetos)
+        msg = tokenize(hl7)
     except Exception as e:
-        print(f"[HIS] Error al parsear mensaje HL7: {e}\nMensaje recibido:\n{hl7}")
-        web_log(f"Error al parsear mensaje HL7: {e}\nMensaje recibido:\n{hl7}")
+        PARSE_ERRORS.inc()
+        log.error("Error al parsear mensaje HL7: %s\nMensaje recibido:\n%s", e, hl7)
         return
     # Manejo de mensajes ACK
-    if msg.msh.msh_9.value.startswith('ACK'):
-        ack_code = msg.msa.msa_1.value
-        print(f"[HIS] ACK recibido: {ack_code}")
-        web_log(f"ACK recibido: {ack_code}")
+    if msg.msh_9.startswith('ACK'):
+        ack_code = msg.segment_field('MSA', 1)
+        log.info("ACK recibido: %s", ack_code)
         if ack_code != 'AA':
-            print(f"[HIS] ¡Error en ACK! Código: {ack_code}")
-            web_log(f"¡Error en ACK! Código: {ack_code}")
+            log.warning("¡Error en ACK! Código: %s", ack_code)
     # Manejo de mensajes ORU^R01 (resultados de estudios)
-    elif msg.msh.msh_9.value.startswith('ORU^R01'):
-        print(f"[HIS] Resultado recibido para orden: {msg.orc.orc_2.value}")
-        web_log(f"Resultado recibido para orden: {msg.orc.orc_2.value}")
+    elif msg.msh_9.startswith('ORU^R01'):
+        log.info("Resultado recibido para orden: %s", msg['ORC.2'])
+        # Cierra la traza de la orden con las marcas del RIS (ZTR) y la de recepción
+        trace_id, stamps = hl7_trace.read_trace(msg)
+        if trace_id:
+            stamps['his_recv'] = hl7_trace.now_us()
+            stamps = hl7_trace.recorder.finish(trace_id, stamps)
+            if 'omi_send' in stamps:
+                log.info("Orden %s: OMI^O23 -> ORU^R01 en %.1f ms", trace_id,
+                         (stamps['his_recv'] - stamps['omi_send']) / 1000)
         # Enviar ACK de vuelta al RIS
-        ack = build_ack(msg.msh.msh_10.value, 'AA')
-        mllp_msg = MLLP_SB + ack.encode() + MLLP_EB + MLLP_CR
-        conn.sendall(mllp_msg)
-        print(f"[HIS] ACK enviado por ORU^R01\n")
-        web_log("ACK enviado por ORU^R01")
+        conn.sendall(ACKS.frame(msg.control_id, 'AA'))
+        log.info("ACK enviado por ORU^R01")
 
 # MAIN
 if __name__ == "__main__":
     # Inicia el servidor MLLP para recibir mensajes HIS
     mllp_server(HIS_MLLP_SERVER_PORT, on_his_message)
+    metrics.serve(METRICS_PORT)
+    log.info("Métricas en http://localhost:%s/metrics", METRICS_PORT)
     time.sleep(1)  # Espera a que el servidor esté listo
+    pacer = pacing.from_spec(PACING)
+    log.info("Ritmo de los pasos: %s", pacer)
+    if OUTBOX_DIR:
+        outbox = hl7_outbox.Outbox(OUTBOX_DIR, RIS_MLLP_SERVER_HOST, RIS_MLLP_SERVER_PORT).start()
+        if outbox.recovered:
+            log.info("Cola de salida: %s mensajes sin ACK de la ejecución anterior", outbox.recovered)
 
     # Paso 1: Registro del paciente (ADT^A04)
-    adt_id = 'MSG0001'
+    pacer.wait()
+    adt_id = nuevo_msg_id()
     adt_msg = build_adt_a04(adt_id)
-    print(f"[HIS] Enviando ADT^A04 al RIS:\n{adt_msg}\n")
-    web_log(f"Enviando ADT^A04 al RIS:\n{adt_msg}")
-    ack = send_mllp_message(RIS_MLLP_SERVER_HOST, RIS_MLLP_SERVER_PORT, adt_msg)
-    print(f"[HIS] ACK recibido por ADT^A04:\n{ack}\n")
-    web_log(f"ACK recibido por ADT^A04:\n{ack}")
-    if DEMO_DELAY:
-        time.sleep(DEMO_DELAY_SECONDS)
+    log.debug("Enviando ADT^A04 al RIS:\n%s", adt_msg)
+    ack = enviar_al_ris(adt_msg)
+    log.debug("ACK recibido por ADT^A04:\n%s", ack)
 
     # Paso 3a: Orden de Radiografía (OMI^O23)
-    omi1_id = 'MSG0002'
+    pacer.wait()
+    omi1_id = nuevo_msg_id()
     order1_id = 'ORD0001'
     omi1_msg = build_omi_o23(omi1_id, order1_id, 'RADIOGRAFIA TORAX', 'CR', '71020^RADIOGRAFIA TORAX^CPT4', 'CR^RADIOGRAFIA^DCM')
-    print(f"[HIS] Enviando OMI^O23 (Radiografía) al RIS:\n{omi1_msg}\n")
-    web_log(f"Enviando OMI^O23 (Radiografía) al RIS:\n{omi1_msg}")
-    ack = send_mllp_message(RIS_MLLP_SERVER_HOST, RIS_MLLP_SERVER_PORT, omi1_msg)
-    print(f"[HIS] ACK recibido por OMI^O23 (Radiografía):\n{ack}\n")
-    web_log(f"ACK recibido por OMI^O23 (Radiografía):\n{ack}")
-    if DEMO_DELAY:
-        time.sleep(DEMO_DELAY_SECONDS)
+    log.debug("Enviando OMI^O23 (Radiografía) al RIS:\n%s", omi1_msg)
+    ack = enviar_orden(omi1_msg, order1_id)
+    log.debug("ACK recibido por OMI^O23 (Radiografía):\n%s", ack)
 
     # Paso 3b: Orden de Tomografía (OMI^O23)
-    omi2_id = 'MSG0003'
+    pacer.wait()
+    omi2_id = nuevo_msg_id()
     order2_id = 'ORD0002'
     omi2_msg = build_omi_o23(omi2_id, order2_id, 'TOMOGRAFIA TORAX', 'CT', '71250^CT TORAX SIN CONTRASTE^CPT4', 'CT^TOMOGRAFIA COMPUTARIZADA^DCM')
-    print(f"[HIS] Enviando OMI^O23 (Tomografía) al RIS:\n{omi2_msg}\n")
-    web_log(f"Enviando OMI^O23 (Tomografía) al RIS:\n{omi2_msg}")
-    ack = send_mllp_message(RIS_MLLP_SERVER_HOST, RIS_MLLP_SERVER_PORT, omi2_msg)
-    print(f"[HIS] ACK recibido por OMI^O23 (Tomografía):\n{ack}\n")
-    web_log(f"ACK recibido por OMI^O23 (Tomografía):\n{ack}")
-    if DEMO_DELAY:
-        time.sleep(DEMO_DELAY_SECONDS)
+    log.debug("Enviando OMI^O23 (Tomografía) al RIS:\n%s", omi2_msg)
+    ack = enviar_orden(omi2_msg, order2_id)
+    log.debug("ACK recibido por OMI^O23 (Tomografía):\n%s", ack)
 
-    print("[HIS] Esperando resultados ORU^R01 del RIS... (Ctrl+C para salir)")
-    web_log("Esperando resultados ORU^R01 del RIS... (Ctrl+C para salir)")
-    while True:
-        time.sleep(DEMO_DELAY_SECONDS)
+    log.info("Esperando resultados ORU^R01 del RIS... (Ctrl+C para salir)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        if outbox is not None:
+            outbox.close()  # Lo no confirmado queda en disco para el siguiente arranque
+        print("\n[HIS] Latencia por tramo:")
+        for linea in hl7_trace.recorder.summary():
+            print(f"[HIS]   {linea}")
@@ -0,0 +1,110 @@
+"""
+Histograma de latencias al estilo HdrHistogram.
+Los valores (enteros, p. ej. microsegundos) se guardan en cubetas log-lineales: cada
+potencia de dos se divide en sub-cubetas, de modo que el error relativo de cualquier
+percentil está acotado por las cifras significativas elegidas y la memoria es fija
+(unas pocas decenas de miles de contadores) sea cual sea el número de muestras.
+"""
+# Importación de librerías estándar
+import math  # Para dimensionar las sub-cubetas
+import threading  # record() se llama desde varios hilos
+
+DEFAULT_SIGNIFICANT_FIGURES = 3  # Error relativo máximo ~0,1 %
+DEFAULT_HIGHEST_VALUE = 3600 * 1000 * 1000  # 1 hora en microsegundos
+
+
+# Histograma log-lineal con precisión de significant_figures cifras
+# record(v) suma una muestra (los valores fuera de rango se recortan a [0, highest_value]);
+# percentile(p) devuelve el valor más alto equivalente a la cubeta del percentil p.
+class LatencyHistogram:
+    def __init__(self, significant_figures=DEFAULT_SIGNIFICANT_FIGURES,
+                 highest_value=DEFAULT_HIGHEST_VALUE):
+        self.significant_figures = significant_figures
+        self.highest_value = highest_value
+        sub_bucket_count = 2 ** math.ceil(math.log2(2 * 10 ** significant_figures))
+        self._sub_bits = sub_bucket_count.bit_length() - 1  # log2(sub_bucket_count)
+        self._half_bits = self._sub_bits - 1
+        self._half_count = sub_bucket_count // 2
+        self._counts = [0] * (self._index(highest_value) + 1)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    # Posición en _counts del valor v
+    def _index(self, v):
+        bucket = max(v.bit_length() - self._sub_bits, 0)
+        sub = v >> bucket
+        return ((bucket + 1) << self._half_bits) + sub - self._half_count
+
+    # Valor más alto que cae en la misma cubeta que la posición index
+    def _value_at(self, index):
+        bucket = (index >> self._half_bits) - 1
+        sub = (index & (self._half_count - 1)) + self._half_count
+        if bucket < 0:
+            sub -= self._half_count
+            bucket = 0
+        return (sub << bucket) + (1 << bucket) - 1
+
+    # Suma count muestras con valor value
+    def record(self, value, count=1):
+        value = min(max(int(value), 0), self.highest_value)
+        index = self._index(value)
+        with self._lock:
+            self._counts[index] += count
+            self.count += count
+            self.total += value * count
+            if self.min is None or value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+    # Suma al histograma las muestras de otro con la misma configuración
+    def merge(self, other):
+        with other._lock:
+            counts = list(other._counts)
+            count, total, vmin, vmax = other.count, other.total, other.min, other.max
+        with self._lock:
+            for i, c in enumerate(counts):
+                if c:
+                    self._counts[i] += c
+            self.count += count
+            self.total += total
+            if vmin is not None and (self.min is None or vmin < self.min):
+                self.min = vmin
+            self.max = max(self.max, vmax)
+
+    # Borra todas las muestras
+    def reset(self):
+        with self._lock:
+            self._counts = [0] * len(self._counts)
+            self.count = self.total = self.max = 0
+            self.min = None
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    # Valor por debajo del cual queda el p % de las muestras (0 si no hay muestras)
+    def percentile(self, p):
+        with self._lock:
+            if not self.count:
+                return 0
+            target = max(math.ceil(self.count * p / 100.0), 1)
+            seen = 0
+            for index, c in enumerate(self._counts):
+                seen += c
+                if seen >= target:
+                    return min(self._value_at(index), self.max)
+        return self.max
+
+    # Dict {percentil: valor} para la lista de percentiles pedida
+    def percentiles(self, ps=(50, 95, 99, 99.9)):
+        return {p: self.percentile(p) for p in ps}
+
+    # Resumen en una línea; scale/unit convierten la unidad registrada (p. ej. µs -> ms)
+    def summary(self, scale=1000.0, unit='ms', ps=(50, 95, 99, 99.9)):
+        parts = [f"p{p:g}={self.percentile(p) / scale:.2f}{unit}" for p in ps]
+        parts.append(f"max={self.max / scale:.2f}{unit}")
+        return f"n={self.count} " + ' '.join(parts)
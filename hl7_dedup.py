@@ -0,0 +1,166 @@
+"""
+Índice de duplicados por ventana de tiempo para los receptores MLLP.
+Los reintentos (hl7_outbox.py) y las reproducciones (hl7_replay.py) reenvían el mismo
+MSH-10; el RIS debe responder con el mismo ACK sin volver a procesar el mensaje.
+Cada mensaje se identifica por un resumen de 64 bits de (emisor, MSH-10), que ocupa
+poco y tiene una probabilidad de colisión despreciable con millones de mensajes. Las
+claves se guardan en un dict (búsqueda O(1)) y en una rueda de expiración de `slots`
+franjas que cubre `window` segundos: al avanzar el reloj se descarta la franja más
+antigua entera. max_entries acota la memoria: si se supera, se descartan franjas
+antiguas antes de tiempo.
+SQLiteDuplicateIndex ofrece lo mismo sobre una base SQLite local para compartir el índice
+entre los procesos del RIS en modo prefork (ris_prefork.py).
+"""
+# Importación de librerías estándar
+import hashlib  # Resumen de 64 bits de cada clave
+import sqlite3  # Índice compartido entre procesos
+import threading  # El índice se comparte entre los hilos de los callbacks
+import time  # Reloj de la ventana
+from collections import deque  # Franjas de la rueda de expiración
+import metrics  # Contadores de /metrics
+
+WINDOW = 3600.0  # Segundos durante los que se recuerda un MSH-10
+SLOTS = 60  # Franjas de la rueda (cada una cubre WINDOW / SLOTS segundos)
+MAX_ENTRIES = 1000000  # Claves como máximo (memoria fija)
+PENDING = ''  # Respuesta de un mensaje que aún se está procesando
+
+# Métricas del índice
+LOOKUPS = metrics.counter('hl7_dedup_lookups_total', 'Mensajes comprobados en el índice de duplicados',
+                          ('result',))
+EVICTIONS = metrics.counter('hl7_dedup_evictions_total',
+                            'Claves descartadas antes de tiempo por superar max_entries')
+
+
+# Resumen de 64 bits de (emisor, MSH-10)
+def message_key(sender, control_id):
+    return int.from_bytes(hashlib.blake2b(f'{sender}\x00{control_id}'.encode(),
+                                          digest_size=8).digest(), 'big')
+
+
+# Índice de duplicados
+# claim(clave) registra el mensaje y devuelve None si es nuevo, o la respuesta guardada
+# (PENDING si el original aún se está procesando) si es un duplicado. complete() guarda la
+# respuesta (p. ej. el código de ACK) y forget() borra la clave si no se procesó.
+class DuplicateIndex:
+    def __init__(self, window=WINDOW, slots=SLOTS, max_entries=MAX_ENTRIES, clock=time.monotonic):
+        self.window = window
+        self.slot_seconds = window / slots
+        self.max_entries = max_entries
+        self.clock = clock
+        self._index = {}  # clave -> [respuesta, id de franja]
+        self._wheel = deque()  # (id de franja, inicio, lista de claves), de la más antigua a la actual
+        self._next_slot = 0
+        self._lock = threading.Lock()
+        self.size_gauge = metrics.gauge('hl7_dedup_entries', 'Claves en el índice de duplicados')
+        self.size_gauge.set_function(lambda: len(self._index))
+
+    def __len__(self):
+        return len(self._index)
+
+    # Descarta las franjas caducadas y abre una nueva si la actual terminó; devuelve la actual
+    # Debe llamarse con _lock tomado
+    def _advance(self, now):
+        while self._wheel and self._wheel[0][1] <= now - self.window:
+            self._drop_oldest()
+        if not self._wheel or now >= self._wheel[-1][1] + self.slot_seconds:
+            self._wheel.append((self._next_slot, now, []))
+            self._next_slot += 1
+        return self._wheel[-1]
+
+    # Borra las claves de la franja más antigua que no se hayan renovado en otra posterior
+    def _drop_oldest(self):
+        slot_id, _, keys = self._wheel.popleft()
+        index = self._index
+        for key in keys:
+            entry = index.get(key)
+            if entry is not None and entry[1] == slot_id:
+                del index[key]
+
+    def claim(self, key):
+        with self._lock:
+            slot_id, _, keys = self._advance(self.clock())
+            entry = self._index.get(key)
+            if entry is not None:
+                LOOKUPS.labels('duplicate').inc()
+                return entry[0]
+            self._index[key] = [PENDING, slot_id]
+            keys.append(key)
+            while len(self._index) > self.max_entries and len(self._wheel) > 1:
+                before = len(self._index)
+                self._drop_oldest()
+                EVICTIONS.inc(before - len(self._index))
+        LOOKUPS.labels('new').inc()
+        return None
+
+    def complete(self, key, response):
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is not None:
+                entry[0] = response
+
+    def forget(self, key):
+        with self._lock:
+            self._index.pop(key, None)
+
+
+# Índice de duplicados compartido entre procesos en una base SQLite (modo WAL)
+# Misma interfaz que DuplicateIndex. claim() es un único INSERT ... ON CONFLICT atómico:
+# si dos procesos reciben el mismo MSH-10 a la vez, solo uno lo inserta. Las filas de más
+# de window segundos se tratan como nuevas y se borran cada purge_every inserciones, así
+# que el tamaño de la tabla queda acotado por la ventana. Una conexión por hilo.
+# El gauge hl7_dedup_entries pasa a contar las filas de la tabla (sustituye al del índice
+# en memoria que el trabajador prefork descarta).
+class SQLiteDuplicateIndex:
+    def __init__(self, path, window=WINDOW, purge_every=10000, clock=time.time):
+        self.path = path
+        self.window = window
+        self.purge_every = purge_every
+        self.clock = clock
+        self._local = threading.local()
+        self._inserts = 0
+        self._conn().execute(
+            'CREATE TABLE IF NOT EXISTS dedup (key INTEGER PRIMARY KEY, response TEXT, seen REAL)')
+        self.size_gauge = metrics.gauge('hl7_dedup_entries', 'Claves en el índice de duplicados')
+        self.size_gauge.set_function(lambda: len(self))
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    # La clave de 64 bits sin signo pasa a entero con signo (INTEGER de SQLite)
+    @staticmethod
+    def _key(key):
+        return key - (1 << 64) if key >= 1 << 63 else key
+
+    def __len__(self):
+        return self._conn().execute('SELECT COUNT(*) FROM dedup').fetchone()[0]
+
+    def claim(self, key):
+        key = self._key(key)
+        now = self.clock()
+        conn = self._conn()
+        inserted = conn.execute(
+            "INSERT INTO dedup (key, response, seen) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET response = excluded.response, seen = excluded.seen "
+            "WHERE dedup.seen <= ?", (key, PENDING, now, now - self.window)).rowcount
+        if inserted:
+            LOOKUPS.labels('new').inc()
+            self._inserts += 1
+            if self._inserts % self.purge_every == 0:
+                conn.execute('DELETE FROM dedup WHERE seen <= ?', (now - self.window,))
+            return None
+        row = conn.execute('SELECT response FROM dedup WHERE key = ?', (key,)).fetchone()
+        if row is None:  # Borrada entre las dos sentencias (forget de otro proceso)
+            return self.claim(key)
+        LOOKUPS.labels('duplicate').inc()
+        return row[0]
+
+    def complete(self, key, response):
+        self._conn().execute('UPDATE dedup SET response = ? WHERE key = ?', (response, self._key(key)))
+
+    def forget(self, key):
+        self._conn().execute('DELETE FROM dedup WHERE key = ?', (self._key(key),))
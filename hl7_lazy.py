@@ -0,0 +1,86 @@
+"""
+Parser HL7 perezoso para decisiones de enrutamiento.
+parse_header() solo separa el segmento MSH y expone tipo de mensaje, evento y ID de
+control en microsegundos; el parseo completo con hl7apy se hace únicamente la primera
+vez que se accede a un segmento o campo que no está en la cabecera.
+"""
+# Importación de librerías de terceros
+from hl7apy.parser import parse_message  # Parseo completo bajo demanda
+
+
+# Mensaje HL7 con cabecera ya separada y cuerpo sin parsear
+# Atributos de cabecera (sin hl7apy): msh_9, msh_10, message_type, trigger_event,
+# control_id, sending_app, sending_facility, receiving_app, receiving_facility.
+# segment_field('MSA', 1) lee un campo de otro segmento sin parsear el mensaje entero.
+# Cualquier otro atributo (msg.orc.orc_2.value, msg.msh, ...) dispara parse_message()
+# una sola vez y se delega en el mensaje de hl7apy.
+class LazyMessage:
+    def __init__(self, er7, find_groups=False):
+        self.er7 = er7
+        self._find_groups = find_groups
+        self._parsed = None
+        self._segments = None
+        end = len(er7)
+        for sep in ('\r', '\n'):
+            pos = er7.find(sep)
+            if 0 <= pos < end:
+                end = pos
+        msh = er7[:end]
+        if not msh.startswith('MSH') or len(msh) < 8:
+            raise ValueError(f"El mensaje no empieza por un segmento MSH válido: {msh[:20]!r}")
+        self.field_sep = msh[3]
+        self.component_sep = msh[4]
+        self.msh_fields = msh.split(self.field_sep)  # msh_fields[n - 1] es MSH-n
+        self.msh_9 = self.msh_field(9)
+        self.msh_10 = self.msh_field(10)
+        event = self.msh_9.split(self.component_sep)
+        self.message_type = event[0]
+        self.trigger_event = event[1] if len(event) > 1 else ''
+        self.control_id = self.msh_10
+        self.sending_app = self.msh_field(3)
+        self.sending_facility = self.msh_field(4)
+        self.receiving_app = self.msh_field(5)
+        self.receiving_facility = self.msh_field(6)
+
+    # Devuelve MSH-n como texto ('' si no existe); MSH-1 es el propio separador
+    def msh_field(self, n):
+        if n == 1:
+            return self.field_sep
+        return self.msh_fields[n - 1] if len(self.msh_fields) > n - 1 else ''
+
+    # Devuelve el campo n del primer segmento con ese nombre ('' si no existe)
+    # Solo separa el texto en segmentos; no construye objetos de hl7apy
+    def segment_field(self, segment, n):
+        if segment == 'MSH':
+            return self.msh_field(n)
+        if self._segments is None:
+            self._segments = self.er7.replace('\n', '\r').split('\r')
+        prefix = segment + self.field_sep
+        for seg in self._segments:
+            if seg.startswith(prefix):
+                fields = seg.split(self.field_sep)
+                return fields[n] if len(fields) > n else ''
+        return ''
+
+    # True si el mensaje ya se ha parseado con hl7apy
+    @property
+    def parsed(self):
+        return self._parsed is not None
+
+    # Mensaje completo de hl7apy (se parsea la primera vez)
+    @property
+    def message(self):
+        if self._parsed is None:
+            self._parsed = parse_message(self.er7, find_groups=self._find_groups)
+        return self._parsed
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.message, name)
+
+
+# Función para parsear solo la cabecera de un mensaje HL7 en formato ER7
+# Lanza ValueError si el mensaje no empieza por MSH
+def parse_header(er7, find_groups=False):
+    return LazyMessage(er7, find_groups=find_groups)
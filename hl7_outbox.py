@@ -0,0 +1,375 @@
+"""
+Cola de salida persistente (store-and-forward) para los mensajes que el HIS envía al RIS.
+Cada mensaje se añade a un diario en disco de solo escritura al final, repartido en
+ficheros de segmento, antes de enviarlo; un hilo escritor agrupa en un único write() y
+un único fsync todos los registros que llegan mientras termina el anterior (group
+commit), así que el coste del fsync se reparte entre el lote. Al recibir el ACK se
+escribe un registro de confirmación con su MSH-10. Al arrancar se releen los segmentos y
+se reenvían los mensajes sin confirmación, en orden: entrega al menos una vez aunque el
+RIS esté caído o el proceso se reinicie. Los segmentos con todo confirmado se borran.
+Formato de registro: tipo (1 byte), longitud (4), CRC32 (4) y datos (ER7 o MSH-10, UTF-8).
+"""
+# Importación de librerías estándar
+import heapq  # Mensajes listos para enviar, en orden de llegada
+import itertools  # Numeración de mensajes
+import os  # Directorio, segmentos y fsync
+import struct  # Cabecera de cada registro
+import threading  # Hilos escritor y emisor
+import time  # Reintentos y duración del fsync
+import zlib  # CRC32 de cada registro
+from collections import OrderedDict, deque  # Mensajes pendientes en orden y plazos de ACK
+from concurrent.futures import Future  # ACK de cada mensaje
+from functools import partial  # Callback del ACK con su MSH-10
+import metrics  # Contadores e histogramas de /metrics
+import mllp  # Conexión MLLP y MSH-10 de cada mensaje
+
+SEGMENT_BYTES = 64 * 1024 * 1024  # Tamaño a partir del cual se abre un segmento nuevo
+WINDOW = 100  # Mensajes enviados sin ACK como máximo
+RETRY_INTERVAL = 2.0  # Segundos entre reintentos si el destino no responde
+ACK_TIMEOUT = 30.0  # Segundos sin ACK tras los que un mensaje enviado se reintenta
+SEGMENT_SUFFIX = '.seg'
+
+RECORD_MESSAGE = 1  # Mensaje HL7 pendiente de enviar
+RECORD_ACK = 2  # Confirmación (MSH-10) de un mensaje ya entregado
+_HEADER = struct.Struct('>BII')  # tipo, longitud, CRC32
+
+# Métricas de la cola de salida
+MESSAGES = metrics.counter('hl7_outbox_messages_total',
+                           'Mensajes de la cola de salida por evento', ('event',))
+PENDING = metrics.gauge('hl7_outbox_pending', 'Mensajes de la cola de salida sin ACK')
+FSYNC_SECONDS = metrics.histogram('hl7_outbox_fsync_seconds', 'Duración de cada write+fsync del diario')
+WRITE_ERRORS = metrics.counter('hl7_outbox_write_errors_total',
+                               'Errores de escritura o fsync del diario (la cola deja de aceptar mensajes)')
+BATCH_RECORDS = metrics.histogram('hl7_outbox_batch_records', 'Registros por fsync (group commit)',
+                                  buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000))
+
+
+# Registro binario de un mensaje o una confirmación
+def encode_record(kind, payload):
+    return _HEADER.pack(kind, len(payload), zlib.crc32(payload)) + payload
+
+
+# Lee los registros de un segmento; devuelve ([(tipo, datos)], bytes válidos)
+# Se detiene en el primer registro incompleto o con CRC erróneo (escritura cortada)
+def read_segment(path):
+    records = []
+    good = 0
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                break
+            kind, length, crc = _HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc or kind not in (
+                    RECORD_MESSAGE, RECORD_ACK):
+                break
+            records.append((kind, payload))
+            good += _HEADER.size + length
+    return records, good
+
+
+# Mensaje pendiente: orden de llegada, segmento donde está escrito, ER7 y Future del ACK
+class _Entry:
+    __slots__ = ('seq', 'segment', 'er7', 'future')
+
+    def __init__(self, seq, er7, segment=None):
+        self.seq = seq
+        self.segment = segment
+        self.er7 = er7
+        self.future = Future()
+
+
+# Cola de salida persistente hacia host:port
+# put(er7) devuelve un Future con el ACK; con wait=True (por defecto) además espera a que
+# el mensaje esté en disco. Para lotes, put(..., wait=False) y un flush() al final.
+# Se usa una sola conexión MLLP propia (no el pool) para que el RIS reciba los mensajes en
+# el mismo orden en que se encolaron. fsync=False desactiva el fsync (solo para comparar)
+# Un mensaje sin ACK tras ack_timeout segundos se abandona en la conexión y se reintenta,
+# para que un ACK perdido o un destino que no responde no agoten la ventana
+class Outbox:
+    def __init__(self, directory, host, port, segment_bytes=SEGMENT_BYTES, window=WINDOW,
+                 retry_interval=RETRY_INTERVAL, fsync=True, ack_timeout=ACK_TIMEOUT):
+        self.directory = directory
+        self.host = host
+        self.port = port
+        self.segment_bytes = segment_bytes
+        self.window = window
+        self.retry_interval = retry_interval
+        self.fsync = fsync
+        self.ack_timeout = ack_timeout
+        self.recovered = 0  # Mensajes sin ACK encontrados al arrancar
+        self._cond = threading.Condition()
+        self._batch = []  # (registro en bytes, _Entry o None, Future de durabilidad o None)
+        self._pending = OrderedDict()  # MSH-10 -> _Entry, en orden de llegada
+        self._unacked = {}  # Segmento -> mensajes sin ACK escritos en él
+        self._ready = []  # Montículo (seq, MSH-10) de mensajes en disco listos para enviar
+        self._in_flight = 0
+        self._deadlines = deque()  # (plazo, conexión, Future) de los envíos, en orden (hilo emisor)
+        self._client = None  # MLLPClient hacia host:port, se reabre si se cierra
+        self._retry_at = 0.0  # Instante a partir del cual volver a intentar tras un fallo
+        self._seq = itertools.count()
+        self._closing = False
+        self._error = None  # OSError del escritor: a partir de él put() y flush() fallan
+        self._threads = []
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+        PENDING.set_function(lambda: len(self._pending))
+
+    # Mensajes sin ACK (en disco o esperando el siguiente fsync)
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def _path(self, segment):
+        return os.path.join(self.directory, f'{segment:010d}{SEGMENT_SUFFIX}')
+
+    def _segments(self):
+        return sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+                      if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit())
+
+    # Relee los segmentos: reconstruye los pendientes y recorta las colas cortadas
+    def _recover(self):
+        segments = self._segments()
+        for segment in segments:
+            path = self._path(segment)
+            records, good = read_segment(path)
+            if good < os.path.getsize(path):
+                with open(path, 'r+b') as f:
+                    f.truncate(good)
+            for kind, payload in records:
+                text = payload.decode('utf-8')
+                if kind == RECORD_MESSAGE:
+                    ctrl_id = mllp.control_id(text)
+                    entry = _Entry(next(self._seq), text, segment)
+                    self._pending[ctrl_id] = entry
+                    self._unacked[segment] = self._unacked.get(segment, 0) + 1
+                else:
+                    entry = self._pending.pop(text, None)
+                    if entry is not None:
+                        self._unacked[entry.segment] -= 1
+        self._ready = [(e.seq, k) for k, e in self._pending.items()]
+        heapq.heapify(self._ready)
+        self.recovered = len(self._pending)
+        self._segment = (segments[-1] + 1) if segments else 1
+        for segment in segments:
+            self._unacked.setdefault(segment, 0)
+        self._trim()
+        self._open_segment()
+
+    # Abre el segmento activo y sincroniza el directorio para que el fichero nuevo
+    # sobreviva a una caída
+    def _open_segment(self):
+        self._file = open(self._path(self._segment), 'ab', buffering=0)
+        self._size = 0
+        if self.fsync:
+            fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    # Borra los segmentos más antiguos mientras no tengan mensajes sin ACK
+    # Se borra solo un prefijo: la confirmación de un mensaje siempre está en su segmento
+    # o en uno posterior, así que ningún mensaje vivo pierde su confirmación
+    def _trim(self):
+        for segment in sorted(self._unacked):
+            if segment == self._segment or self._unacked[segment] > 0:
+                break
+            del self._unacked[segment]
+            try:
+                os.remove(self._path(segment))
+            except FileNotFoundError:
+                pass
+
+    # Arranca los hilos escritor y emisor
+    def start(self):
+        for target, name in ((self._writer, 'outbox-writer'), (self._sender, 'outbox-sender')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    # Añade un mensaje a la cola; devuelve un Future con el ACK (str)
+    # wait=True: no vuelve hasta que el mensaje está en disco (comparte fsync con el lote)
+    # Si ya hay un mensaje pendiente con el mismo MSH-10 (p. ej. recuperado al arrancar) no
+    # se duplica: se devuelve el Future del que ya está en la cola
+    def put(self, er7, wait=True):
+        ctrl_id = mllp.control_id(er7)
+        entry = _Entry(next(self._seq), er7)
+        durable = Future() if wait else None
+        with self._cond:
+            if self._error is not None:
+                raise self._error
+            if self._closing:
+                raise RuntimeError("La cola de salida está cerrada")
+            if ctrl_id in self._pending:
+                return self._pending[ctrl_id].future
+            self._pending[ctrl_id] = entry
+            self._batch.append((encode_record(RECORD_MESSAGE, er7.encode('utf-8')), entry, durable))
+            self._cond.notify_all()
+        MESSAGES.labels('queued').inc()
+        if durable is not None:
+            durable.result()
+        return entry.future
+
+    # Espera a que todo lo añadido hasta ahora esté en disco
+    def flush(self):
+        durable = Future()
+        with self._cond:
+            if self._error is not None:
+                raise self._error
+            self._batch.append((b'', None, durable))
+            self._cond.notify_all()
+        durable.result()
+
+    # Hilo escritor: un write() y un fsync por lote; rota el segmento al superar su tamaño
+    # Un OSError (p. ej. disco lleno) detiene la cola: _fail() lo propaga a los pendientes
+    def _writer(self):
+        while True:
+            with self._cond:
+                while not self._batch and not self._closing:
+                    self._cond.wait()
+                if not self._batch:
+                    break
+                batch, self._batch = self._batch, []
+            started = time.perf_counter()
+            data = b''.join(record for record, _, _ in batch)
+            try:
+                if self._size >= self.segment_bytes:
+                    self._rotate()
+                self._write_all(data)
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+            except OSError as e:
+                self._fail(batch, e)
+                break
+            self._size += len(data)
+            FSYNC_SECONDS.observe(time.perf_counter() - started)
+            BATCH_RECORDS.observe(len(batch))
+            with self._cond:
+                for _, entry, _ in batch:
+                    if entry is not None:
+                        entry.segment = self._segment
+                        self._unacked[self._segment] = self._unacked.get(self._segment, 0) + 1
+                        heapq.heappush(self._ready, (entry.seq, mllp.control_id(entry.er7)))
+                self._cond.notify_all()
+            for _, _, durable in batch:
+                if durable is not None:
+                    durable.set_result(None)
+
+    # write() sin búfer puede escribir menos bytes de los pedidos: se repite hasta el final
+    def _write_all(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[self._file.write(view):]
+
+    # Error de escritura: la cola deja de aceptar mensajes y los Future de durabilidad y de
+    # ACK del lote fallido (y de lo que quedase por escribir) reciben el error
+    def _fail(self, batch, error):
+        WRITE_ERRORS.inc()
+        with self._cond:
+            self._error = error
+            batch = batch + self._batch
+            self._batch = []
+            for _, entry, _ in batch:
+                if entry is not None:
+                    self._pending.pop(mllp.control_id(entry.er7), None)
+            self._cond.notify_all()
+        for _, entry, durable in batch:
+            if durable is not None:
+                durable.set_exception(error)
+            if entry is not None and not entry.future.done():
+                entry.future.set_exception(error)
+
+    # Cierra el segmento activo, abre el siguiente y borra los ya confirmados
+    def _rotate(self):
+        self._file.close()
+        with self._cond:
+            self._unacked.setdefault(self._segment, 0)
+            self._segment += 1
+            self._trim()
+        self._open_segment()
+
+    # Abandona los envíos cuyo plazo de ACK venció (su callback los devuelve a la cola) y
+    # devuelve los segundos hasta el siguiente plazo (None si no hay envíos en vuelo)
+    def _expire(self):
+        now = time.monotonic()
+        deadlines = self._deadlines
+        while deadlines and (deadlines[0][0] <= now or deadlines[0][2].done()):
+            _, client, future = deadlines.popleft()
+            if not future.done():
+                MESSAGES.labels('timeout').inc()
+                client.abandon(future)
+        return deadlines[0][0] - now if deadlines else None
+
+    # Hilo emisor: envía en orden los mensajes ya en disco, con hasta window sin ACK
+    def _sender(self):
+        while True:
+            next_deadline = self._expire()
+            with self._cond:
+                if self._closing:
+                    break
+                wait = self._retry_at - time.monotonic()
+                if wait > 0 or not self._ready or self._in_flight >= self.window:
+                    if wait <= 0:
+                        wait = None
+                    if next_deadline is not None:
+                        wait = next_deadline if wait is None else min(wait, next_deadline)
+                    self._cond.wait(wait)
+                    continue
+                _, ctrl_id = heapq.heappop(self._ready)
+                entry = self._pending.get(ctrl_id)
+                if entry is None:
+                    continue
+                self._in_flight += 1
+            try:
+                if self._client is None or self._client.closed:
+                    self._client = mllp.MLLPClient(self.host, self.port)
+                future = self._client.send_async(entry.er7)
+            except OSError:
+                self._failed(entry, ctrl_id)
+                continue
+            self._deadlines.append((time.monotonic() + self.ack_timeout, self._client, future))
+            future.add_done_callback(partial(self._response, entry, ctrl_id))
+
+    # Envío fallido (destino caído o conexión cerrada): vuelve a la cola y se espera
+    def _failed(self, entry, ctrl_id):
+        MESSAGES.labels('retried').inc()
+        with self._cond:
+            self._in_flight -= 1
+            if self._pending.get(ctrl_id) is entry:
+                heapq.heappush(self._ready, (entry.seq, ctrl_id))
+            self._retry_at = time.monotonic() + self.retry_interval
+            self._cond.notify_all()
+
+    # Callback del ACK (hilo lector MLLP): registra la confirmación y resuelve el Future
+    # Cualquier respuesta cuenta como entregado (un AE/AR no se arregla reenviando)
+    def _response(self, entry, ctrl_id, future):
+        try:
+            ack = future.result()
+        except Exception:
+            self._failed(entry, ctrl_id)
+            return
+        with self._cond:
+            self._in_flight -= 1
+            if self._pending.get(ctrl_id) is entry:
+                del self._pending[ctrl_id]
+                self._unacked[entry.segment] -= 1
+                self._batch.append((encode_record(RECORD_ACK, ctrl_id.encode('utf-8')), None, None))
+            self._cond.notify_all()
+        MESSAGES.labels('acked').inc()
+        if not entry.future.done():
+            entry.future.set_result(ack)
+
+    # Detiene los hilos tras escribir las confirmaciones pendientes; lo no enviado queda
+    # en disco para el siguiente arranque
+    def close(self):
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._file.close()
+        if self._client is not None:
+            self._client.close()
@@ -0,0 +1,248 @@
+"""
+Reproducción de tráfico HL7 capturado contra el RIS (o cualquier servidor MLLP).
+Lee capturas MLLP (<VT>...<FS><CR>) o ficheros ER7 (un mensaje por bloque MSH, con
+segmentos separados por CR o saltos de línea) en streaming, con memoria constante, y
+los envía por MLLP respetando la separación original entre mensajes (MSH-7) acelerada
+V veces (1x, 10x...) o a máxima velocidad. Los mensajes se reparten entre N conexiones
+persistentes; se informa del retraso de cada envío frente a su instante programado y
+de la latencia de ACK medida desde ese instante (como his_load.py).
+"""
+# Importación de librerías estándar
+import argparse  # Parámetros de línea de comandos
+import itertools  # Encadenado de varias capturas
+import sys  # Informe por stderr
+import threading  # Contadores compartidos con los hilos lectores MLLP
+import time  # Calendario de envíos
+from collections import deque  # Plazos de ACK en orden de envío
+from functools import partial  # Callback con el instante programado
+import pacing  # Calendario replay (MSH-7) o sin pausas
+from histogram import LatencyHistogram  # Percentiles de retraso y latencia
+from hl7_lazy import parse_header  # MSH-7 del mensaje y MSA-1 del ACK
+from mllp import MLLP_SB, RECV_SIZE, MLLPClient, MLLPFrameDecoder  # Lectura de capturas y envío
+
+# Destino por defecto: el RIS (no se importa ris_simulator, que arrancaría sus ejecutores)
+RIS_MLLP_SERVER_HOST = 'localhost'
+RIS_MLLP_SERVER_PORT = 6662
+SPEED = '1'  # Velocidad por defecto: ritmo original
+CONNECTIONS = 4  # Conexiones MLLP concurrentes
+MAX_OUTSTANDING = 1000  # Mensajes sin ACK antes de dejar de leer la captura (memoria constante)
+REPORT_INTERVAL = 5  # Segundos entre informes de avance
+ACK_TIMEOUT = 10.0  # Segundos sin ACK tras los que un mensaje cuenta como error y libera su hueco
+ENCODING = 'utf-8'  # Codificación de las capturas
+
+
+# Mensajes de una captura MLLP: lee por bloques de RECV_SIZE con el decodificador de mllp.py
+def read_mllp(path, encoding=ENCODING):
+    decoder = MLLPFrameDecoder()
+    with open(path, 'rb') as f:
+        while True:
+            n = f.readinto(decoder.get_buffer())
+            if not n:
+                break
+            for block in decoder.commit(n):
+                yield block.decode(encoding, errors='ignore')
+
+
+# Mensajes de un fichero ER7: cada segmento MSH empieza un mensaje nuevo; las líneas en
+# blanco se ignoran. El modo texto normaliza CR, LF y CRLF, y los segmentos se unen con CR
+def read_er7(path, encoding=ENCODING):
+    segments = []
+    with open(path, encoding=encoding, errors='ignore') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line.strip():
+                continue
+            if line.startswith('MSH') and segments:
+                yield '\r'.join(segments)
+                segments = []
+            segments.append(line)
+    if segments:
+        yield '\r'.join(segments)
+
+
+# Formato de una captura: 'mllp' si el primer byte útil es <VT>, si no 'er7'
+def detect_format(path):
+    with open(path, 'rb') as f:
+        head = f.read(RECV_SIZE).lstrip(b' \t\r\n')  # <VT> también es espacio para lstrip()
+    return 'mllp' if head.startswith(MLLP_SB) else 'er7'
+
+
+# Mensajes de una o varias capturas, en orden; fmt: 'auto', 'mllp' o 'er7'
+def read_messages(paths, fmt='auto', encoding=ENCODING):
+    readers = {'mllp': read_mllp, 'er7': read_er7}
+    return itertools.chain.from_iterable(
+        readers[detect_format(path) if fmt == 'auto' else fmt](path, encoding) for path in paths)
+
+
+# Crea el pacer para una velocidad '1', '10', '0.5' o 'max'
+def speed_pacer(speed):
+    if str(speed).lower() in ('max', 'maximo', 'rapido'):
+        return pacing.Pacer()
+    return pacing.Replay(float(speed))
+
+
+# Reproductor: envía cada mensaje en el instante del pacer por una de N conexiones
+# max_outstanding limita los mensajes sin ACK; al alcanzarlo se deja de leer la captura
+# Un mensaje sin ACK tras ack_timeout segundos (p. ej. un tipo que el destino no confirma)
+# se abandona, cuenta como error y libera su hueco
+class Replayer:
+    def __init__(self, host, port, speed=SPEED, connections=CONNECTIONS,
+                 max_outstanding=MAX_OUTSTANDING, report_interval=REPORT_INTERVAL, stream=None,
+                 ack_timeout=ACK_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.pacer = speed_pacer(speed)
+        self.connections = connections
+        self.max_outstanding = max_outstanding
+        self.ack_timeout = ack_timeout
+        self.report_interval = report_interval
+        self.stream = stream or sys.stderr
+        self.lag = LatencyHistogram()  # Retraso del envío frente al calendario (µs)
+        self.latency = LatencyHistogram()  # Instante programado -> ACK (µs)
+        self.sent = 0
+        self.acks = {}  # Código MSA-1 -> cuenta
+        self.errors = 0  # Envíos fallidos o sin respuesta
+        self.timeouts = 0  # Mensajes abandonados sin ACK tras ack_timeout (incluidos en errors)
+        self.skipped = 0  # Bloques sin MSH válido
+        self._clients = [None] * connections
+        self._outstanding = 0
+        self._deadlines = deque()  # (plazo, conexión, Future) en orden de envío
+        self._cond = threading.Condition()
+
+    # Conexión i (se reabre si el servidor la cerró)
+    def _client(self, i):
+        client = self._clients[i]
+        if client is None or client.closed:
+            client = self._clients[i] = MLLPClient(self.host, self.port)
+        return client
+
+    # Callback del ACK (hilo lector MLLP): latencia desde el instante programado
+    def _done(self, scheduled, future):
+        latency = time.monotonic() - scheduled
+        try:
+            code = parse_header(future.result()).segment_field('MSA', 1)
+        except Exception:
+            code = None
+        with self._cond:
+            if future.cancelled():
+                self.timeouts += 1
+            if code is None:
+                self.errors += 1
+            else:
+                self.acks[code] = self.acks.get(code, 0) + 1
+            self._outstanding -= 1
+            self._cond.notify_all()
+        if code is not None:
+            self.latency.record(latency * 1e6)
+
+    # Abandona los mensajes cuyo plazo de ACK venció (su _done los cuenta como error) y
+    # devuelve los segundos hasta el siguiente plazo (None si no hay ninguno pendiente)
+    def _expire(self):
+        now = time.monotonic()
+        deadlines = self._deadlines
+        while deadlines and (deadlines[0][0] <= now or deadlines[0][2].done()):
+            _, client, future = deadlines.popleft()
+            if not future.done():
+                client.abandon(future)
+        return deadlines[0][0] - now if deadlines else None
+
+    # Espera a que se libere algún hueco (o a que termine todo si drain), sin dejar de
+    # vencer plazos ni de informar
+    def _wait(self, start, drain=False):
+        while True:
+            wait = self._expire()
+            with self._cond:
+                if (self._outstanding == 0) if drain else (self._outstanding < self.max_outstanding):
+                    return
+                if self.report_interval:
+                    until_report = self._next_report - time.monotonic()
+                    wait = until_report if wait is None else min(wait, until_report)
+                self._cond.wait(max(wait, 0.0) if wait is not None else None)
+            self._maybe_report(start)
+
+    def _maybe_report(self, start):
+        if self.report_interval and time.monotonic() >= self._next_report:
+            self.report(start)
+            self._next_report = time.monotonic() + self.report_interval
+
+    def report(self, start, final=False):
+        elapsed = max(time.monotonic() - start, 1e-9)
+        label = 'Total' if final else 'Avance'
+        with self._cond:
+            acks = sum(self.acks.values())
+            outstanding = self._outstanding
+        self.stream.write(f"[REPLAY] {label}: {self.sent} enviados ({self.sent / elapsed:.0f} msg/s) | "
+                          f"ACK: {acks} | Sin ACK: {outstanding} | Errores: {self.errors} "
+                          f"(plazo vencido: {self.timeouts}) | "
+                          f"Retraso p99: {self.lag.percentile(99) / 1000:.1f} ms, "
+                          f"máx: {self.lag.max / 1000:.1f} ms\n")
+        self.stream.flush()
+
+    def run(self, messages):
+        start = time.monotonic()
+        self._next_report = start + self.report_interval
+        for er7 in messages:
+            try:
+                event_time = pacing.hl7_time(parse_header(er7).msh_field(7))
+            except ValueError:
+                self.skipped += 1
+                continue
+            scheduled = self.pacer.due(event_time)
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._wait(start)
+            with self._cond:
+                self._outstanding += 1
+            self.lag.record(max(time.monotonic() - scheduled, 0.0) * 1e6)
+            try:
+                client = self._client(self.sent % self.connections)
+                future = client.send_async(er7)
+            except OSError:
+                with self._cond:
+                    self._outstanding -= 1
+                    self.errors += 1
+                continue
+            self.sent += 1
+            self._deadlines.append((time.monotonic() + self.ack_timeout, client, future))
+            future.add_done_callback(partial(self._done, scheduled))
+            self._maybe_report(start)
+        self._wait(start, drain=True)
+        for client in self._clients:
+            if client is not None:
+                client.close()
+        self.report(start, final=True)
+        return self
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('capturas', nargs='+', metavar='CAPTURA', help='Ficheros MLLP o ER7')
+    parser.add_argument('--host', default=RIS_MLLP_SERVER_HOST, help='Host MLLP de destino')
+    parser.add_argument('--port', type=int, default=RIS_MLLP_SERVER_PORT,
+                        help='Puerto MLLP de destino')
+    parser.add_argument('--velocidad', default=SPEED, metavar='V',
+                        help="Compresión del tiempo: 1 (ritmo original), 10 (10 veces más rápido) o 'max'")
+    parser.add_argument('--conexiones', type=int, default=CONNECTIONS, metavar='N',
+                        help='Conexiones MLLP concurrentes')
+    parser.add_argument('--formato', choices=('auto', 'mllp', 'er7'), default='auto',
+                        help='Formato de las capturas')
+    parser.add_argument('--codificacion', default=ENCODING, help='Codificación de las capturas')
+    parser.add_argument('--plazo-ack', type=float, default=ACK_TIMEOUT, metavar='SEG',
+                        help='Segundos sin ACK tras los que un mensaje cuenta como error')
+    parser.add_argument('--informe', type=float, default=REPORT_INTERVAL, metavar='SEG',
+                        help='Segundos entre informes de avance (0 para desactivar)')
+    args = parser.parse_args(argv)
+
+    replayer = Replayer(args.host, args.port, args.velocidad, args.conexiones,
+                        report_interval=args.informe, ack_timeout=args.plazo_ack)
+    print(f"[REPLAY] {len(args.capturas)} captura(s) a velocidad {args.velocidad} "
+          f"en {args.conexiones} conexiones -> {args.host}:{args.port}")
+    replayer.run(read_messages(args.capturas, args.formato, args.codificacion))
+    print(f"[REPLAY] ACK: {replayer.acks} | Sin MSH válido: {replayer.skipped}")
+    print(f"[REPLAY] Retraso frente al calendario: {replayer.lag.summary()}")
+    print(f"[REPLAY] Latencia ACK (desde el instante programado): {replayer.latency.summary()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+Constructor rápido de mensajes HL7 v2 en formato ER7 a partir de plantillas precompiladas.
+Genera ADT^A04, OMI^O23, ORU^R01 y ACK directamente como texto, sin construir el árbol
+de objetos de hl7apy, con la misma salida byte a byte que Message(...).to_er7().
+Incluye una fábrica de ACK que deja listos los bytes MLLP sellando solo los campos variables.
+"""
+# Importación de librerías estándar
+import re  # Para escapar el carácter de escape
+import string  # Para extraer los nombres de campo de cada plantilla
+import time  # Para el timestamp por defecto de MSH-7
+import threading  # Para proteger la caché de ACK
+from collections import OrderedDict  # Para la caché LRU de ACK
+from mllp import MLLP_SB, MLLP_EB, MLLP_CR  # Delimitadores de bloque MLLP
+
+# Escapado ER7 igual al que aplica hl7apy a los valores de texto: | y ~ se convierten en
+# \F\ y \R\, y la barra invertida en \E\ salvo que ya forme parte de una secuencia de
+# escape (\H\, \N\, \F\, \S\, \T\, \R\, \E\). ^ y & se respetan como separadores de
+# componente y subcomponente, igual que al asignar 'Apellido^Nombre' a un campo en hl7apy.
+_ESCAPE_CHAR_RE = re.compile(r'(?<!\\[HNFSTRE])\\(?![HNFSTRE]\\)')
+
+
+# Función para escapar un valor antes de insertarlo en un campo ER7
+def escape(value):
+    if value is None:
+        return ''
+    value = str(value)
+    if '|' in value or '~' in value:
+        value = value.replace('|', '\\F\\').replace('~', '\\R\\')
+    if '\\' in value:
+        value = _ESCAPE_CHAR_RE.sub(lambda m: '\\E\\', value)
+    return value
+
+
+# Plantilla ER7 precompilada
+# er7: texto del mensaje con segmentos separados por \r y marcadores {campo} en los valores
+# render(values) devuelve el mensaje con los valores escapados; los campos ausentes quedan vacíos.
+# Con default_time=True, msh_7 toma la hora actual si no se indica; sin él se deja vacío
+# como hace hl7apy (p. ej. al reconstruir una fila con MSH_DATETIME_OF_MESSAGE a NULL).
+class ER7Template:
+    def __init__(self, er7, default_time=False):
+        self.er7 = er7
+        self.default_time = default_time
+        self.fields = tuple(name for _, name, _, _ in string.Formatter().parse(er7) if name)
+
+    def render(self, values):
+        if self.default_time and 'msh_7' in self.fields and not values.get('msh_7'):
+            values = dict(values, msh_7=time.strftime('%Y%m%d%H%M%S'))
+        return self.er7.format_map({name: escape(values.get(name)) for name in self.fields})
+
+
+# Cabecera MSH común: aplicación/instalación emisora y receptora, fecha, tipo e ID de control
+_MSH = 'MSH|^~\\&|{msh_3}|{msh_4}|{msh_5}|{msh_6}|{msh_7}||%s|{msh_10}|P|2.5'
+_PID = 'PID|||{pid_3}||{pid_5}||{pid_7}|{pid_8}'
+
+# ADT^A04: registro de paciente (estructura ADT_A01 en hl7apy)
+ADT_A04 = ER7Template('\r'.join([
+    _MSH % 'ADT^A04',
+    _PID,
+    'PV1||{pv1_2}',
+]), default_time=True)
+
+# OMI^O23: orden de estudio de imagen
+OMI_O23 = ER7Template('\r'.join([
+    _MSH % 'OMI^O23',
+    _PID,
+    'ORC|NW|{orc_2}||||||||||{orc_12}',
+    'OBR||{obr_2}||{obr_4}|||||||||{obr_13}|||{obr_16}',
+    'IPC|||||{ipc_5}',
+]), default_time=True)
+
+# ORU^R01: informe de resultado
+ORU_R01 = ER7Template('\r'.join([
+    _MSH % 'ORU^R01',
+    _PID,
+    'ORC||{orc_2}||||||||||{orc_12}',
+    'OBR||{obr_2}||{obr_4}|||||||||{obr_13}|||{obr_16}',
+    'OBX|1|TX|{obx_3}||{obx_5}',
+]), default_time=True)
+
+# ACK: confirmación de recepción
+ACK = ER7Template('\r'.join([
+    _MSH % 'ACK',
+    'MSA|{msa_1}|{msa_2}',
+]), default_time=True)
+
+# ADT^A01 reconstruido desde una fila de ADT_MESSAGES: MSH-9, MSH-11 y MSH-12 vienen de la tabla
+ADT_A01 = ER7Template('\r'.join([
+    'MSH|^~\\&|{msh_3}|{msh_4}|{msh_5}|{msh_6}|{msh_7}||{msh_9}|{msh_10}|{msh_11}|{msh_12}',
+    'EVN|{evn_1}|{evn_2}',
+    'PID|{pid_1}||{pid_3}||{pid_5}|{pid_6}|{pid_7}|{pid_8}',
+    'PV1|{pv1_1}|{pv1_2}|{pv1_3}|{pv1_4}|||{pv1_7}',
+]))
+
+# Plantillas por tipo de mensaje (MSH-9)
+TEMPLATES = {
+    'ADT^A04': ADT_A04,
+    'OMI^O23': OMI_O23,
+    'ORU^R01': ORU_R01,
+    'ACK': ACK,
+}
+
+
+# Función para generar un mensaje ER7 a partir del tipo (MSH-9) y un dict de valores
+def render(message_type, values):
+    return TEMPLATES[message_type].render(values)
+
+
+# Fábrica de ACK para un par (aplicación emisora, aplicación receptora)
+# La parte fija del MSH se precalcula una vez; en cada ACK solo se sellan MSH-7 (cacheado
+# por segundo), MSH-10, MSA-1 y MSA-2. frame() devuelve directamente los bytes MLLP.
+# Los últimos cache_size ACK se guardan por (ID de control, código) para responder
+# retransmisiones sin volver a generarlos.
+class AckFactory:
+    def __init__(self, sending_app, sending_facility, receiving_app, receiving_facility,
+                 cache_size=4096):
+        self.prefix = 'MSH|^~\\&|%s|%s|%s|%s|' % tuple(
+            escape(v) for v in (sending_app, sending_facility, receiving_app, receiving_facility))
+        self._prefix_bytes = MLLP_SB + self.prefix.encode()
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # (msg_ctrl_id, ack_code) -> bytes MLLP
+        self._lock = threading.Lock()
+        self._timestamp = (None, b'')  # (segundo, MSH-7 en bytes), se reemplaza de forma atómica
+
+    # MSH-7 del segundo actual, formateado una sola vez por segundo
+    def _now(self):
+        second = int(time.time())
+        cached = self._timestamp
+        if cached[0] != second:
+            cached = (second, time.strftime('%Y%m%d%H%M%S', time.localtime(second)).encode())
+            self._timestamp = cached
+        return cached[1]
+
+    # Devuelve el ACK como bloque MLLP listo para conn.sendall()
+    def frame(self, msg_ctrl_id, ack_code='AA'):
+        key = (msg_ctrl_id, ack_code)
+        with self._lock:
+            data = self._cache.get(key)
+            if data is not None:
+                self._cache.move_to_end(key)
+                return data
+        ctrl_id = escape(msg_ctrl_id).encode()
+        data = b''.join((self._prefix_bytes, self._now(), b'||ACK|ACK', ctrl_id,
+                         b'|P|2.5\rMSA|', escape(ack_code).encode(), b'|', ctrl_id,
+                         MLLP_EB, MLLP_CR))
+        with self._lock:
+            self._cache[key] = data
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return data
+
+    # Devuelve el ACK en formato ER7 (sin delimitadores MLLP)
+    def er7(self, msg_ctrl_id, ack_code='AA'):
+        return self.frame(msg_ctrl_id, ack_code)[1:-2].decode()
+
+
+_ack_factories = {}
+_ack_factories_lock = threading.Lock()
+
+
+# Función para obtener la fábrica de ACK compartida de un par emisor/receptor
+def ack_factory(sending_app, sending_facility, receiving_app, receiving_facility):
+    key = (sending_app, sending_facility, receiving_app, receiving_facility)
+    with _ack_factories_lock:
+        factory = _ack_factories.get(key)
+        if factory is None:
+            factory = _ack_factories[key] = AckFactory(*key)
+        return factory
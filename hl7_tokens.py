@@ -0,0 +1,229 @@
+"""
+Tokenizador ER7 sin copias con acceso a campos por desplazamientos.
+tokenize() recorre los bytes del mensaje una sola vez (búsqueda de separadores con una
+expresión regular compilada, en C) y guarda en arrays compactos de enteros dónde empieza
+y acaba cada segmento, campo y componente (de la primera repetición). msg['PID.5.1']
+corta un memoryview del mensaje con esos desplazamientos y solo decodifica el trozo
+pedido; no se construye ningún árbol de objetos como en hl7apy. Repeticiones distintas
+de la primera y subcomponentes se localizan bajo demanda dentro de su campo.
+TokenizedMessage tiene la misma interfaz que LazyMessage (hl7_lazy): cabecera, msh_field(),
+segment_field() y, como último recurso, el mensaje completo de hl7apy.
+Rutas: 'PID', 'PID.3', 'PID.5.1', 'PID.5.1.2', 'OBX[2].5' (segunda OBX), 'PID.3[2].1'
+(segunda repetición de PID-3). Los valores se devuelven tal cual en ER7 (sin resolver
+secuencias de escape) y '' si no existen.
+"""
+# Importación de librerías estándar
+import re  # Búsqueda de separadores
+from array import array  # Tablas de desplazamientos
+from functools import lru_cache  # Rutas y patrones ya compilados
+from itertools import chain  # Fin del mensaje como último separador
+from hl7_lazy import LazyMessage  # Interfaz común y parseo completo con hl7apy
+
+ENCODING = 'utf-8'  # Codificación de los mensajes en bytes
+CR, LF = 13, 10  # Fin de segmento
+
+
+# Patrón que encuentra los separadores de campo, componente y repetición y los fines de segmento
+@lru_cache(maxsize=16)
+def _delimiters(separators):
+    return re.compile(b'[' + re.escape(separators) + b'\r\n]')
+
+
+# Ruta 'SEG[n].campo[r].componente.subcomponente' -> (SEG, n, campo, r, componente, subcomponente)
+_PATH = re.compile(r'([A-Z][A-Z0-9]{2})(?:\[(\d+)\])?(?:\.(\d+)(?:\[(\d+)\])?(?:\.(\d+)(?:\.(\d+))?)?)?')
+
+
+@lru_cache(maxsize=256)
+def parse_path(path):
+    m = _PATH.fullmatch(path)
+    if m is None:
+        raise KeyError(f"Ruta HL7 no válida: {path!r}")
+    segment, occurrence, field, rep, comp, sub = m.groups()
+    return (segment, int(occurrence or 1),
+            *(int(value) if value else None for value in (field, rep, comp, sub)))
+
+
+# Mensaje ER7 tokenizado
+# _segs[j]: primer campo (el nombre) del segmento j; _fields[2i], _fields[2i + 1]: inicio y
+# fin del campo i; _fcomp[i]: primer componente del campo i; _comps[2k], _comps[2k + 1]:
+# inicio y fin del componente k. Cada tabla lleva un centinela al final, así que el campo
+# n del segmento j es _segs[j] + n y sus componentes van de _fcomp[i] a _fcomp[i + 1].
+# MSH-1 y MSH-2 (separadores) no tienen componentes: se devuelven enteros.
+class TokenizedMessage(LazyMessage):
+    def __init__(self, data, encoding=ENCODING, find_groups=False):
+        if isinstance(data, str):
+            self._er7 = data
+            data = data.encode(encoding)
+        else:
+            self._er7 = None
+            data = bytes(data)
+        self._data = data
+        self._view = memoryview(data)
+        self.encoding = encoding
+        self._find_groups = find_groups
+        self._parsed = None
+        self._scan()
+        self.msh_9 = self.msh_field(9)
+        self.msh_10 = self.msh_field(10)
+        event = self.msh_9.split(self.component_sep)
+        self.message_type = event[0]
+        self.trigger_event = event[1] if len(event) > 1 else ''
+        self.control_id = self.msh_10
+        self.sending_app = self.msh_field(3)
+        self.sending_facility = self.msh_field(4)
+        self.receiving_app = self.msh_field(5)
+        self.receiving_facility = self.msh_field(6)
+
+    # Texto ER7 completo (para hl7apy); se decodifica solo si se pide
+    @property
+    def er7(self):
+        if self._er7 is None:
+            self._er7 = self._data.decode(self.encoding, errors='ignore')
+        return self._er7
+
+    # Recorre el mensaje una vez y llena las tablas de desplazamientos
+    def _scan(self):
+        data = self._data
+        size = len(data)
+        if not data.startswith(b'MSH') or size < 8:
+            raise ValueError(f"El mensaje no empieza por un segmento MSH válido: {data[:20]!r}")
+        fs, cs, rs = data[3], data[4], data[5]
+        self.field_sep = chr(fs)
+        self.component_sep = chr(cs)
+        self._rs = data[5:6]
+        self._ss = data[7:8]
+        # MSH-2 (caracteres de codificación) acaba en el siguiente separador de campo o de segmento
+        end = 4
+        while end < size and data[end] not in (fs, CR, LF):
+            end += 1
+        segs, fields, fcomp, comps = array('I'), array('I', (0, 3, 3, 4)), array('I', (0, 0)), array('I')
+        names = {}
+        seg_start = seg_first = 0  # Inicio y primer campo del segmento en curso
+        field_start = comp_start = 4
+        comp_first = 0  # Primer componente del campo en curso
+        first_rep = False  # Los componentes solo se guardan en la primera repetición
+        positions = (m.start() for m in _delimiters(data[3:6]).finditer(data, end))
+        for pos in chain(positions, (size,)):
+            c = data[pos] if pos < size else CR
+            if c == cs:
+                if first_rep:
+                    comps.append(comp_start)
+                    comps.append(pos)
+                comp_start = pos + 1
+            elif c == rs:
+                if first_rep:
+                    comps.append(comp_start)
+                    comps.append(pos)
+                    first_rep = False
+            else:
+                if c != fs and pos == seg_start:  # Línea vacía (CRLF, CR repetidos o fin)
+                    seg_start = field_start = comp_start = pos + 1
+                    continue
+                if first_rep:
+                    comps.append(comp_start)
+                    comps.append(pos)
+                fields.append(field_start)
+                fields.append(pos)
+                fcomp.append(comp_first)
+                field_start = comp_start = pos + 1
+                comp_first = len(comps) >> 1
+                first_rep = True
+                if c != fs:  # Fin de segmento
+                    name = data[fields[2 * seg_first]:fields[2 * seg_first + 1]].decode('ascii', 'ignore')
+                    names.setdefault(name, []).append(len(segs))
+                    segs.append(seg_first)
+                    seg_first = len(fields) >> 1
+                    seg_start = pos + 1
+        segs.append(len(fields) >> 1)
+        fcomp.append(len(comps) >> 1)
+        self._segs, self._fields, self._fcomp, self._comps = segs, fields, fcomp, comps
+        self._names = names
+
+    # Número de segmentos con ese nombre
+    def count(self, segment):
+        return len(self._names.get(segment, ()))
+
+    # Índice del campo n de la aparición occurrence (desde 1) del segmento, o None
+    def _field_index(self, segment, n, occurrence=1):
+        found = self._names.get(segment)
+        if found is None or not 0 < occurrence <= len(found):
+            return None
+        j = found[occurrence - 1]
+        first = self._segs[j]
+        return first + n if 0 <= n < self._segs[j + 1] - first else None
+
+    # Trozo n (desde 1) de data[start:end] separado por sep, o None
+    def _piece(self, start, end, sep, n):
+        data = self._data
+        for _ in range(n - 1):
+            pos = data.find(sep, start, end)
+            if pos < 0:
+                return None
+            start = pos + 1
+        pos = data.find(sep, start, end)
+        return start, end if pos < 0 else pos
+
+    # Desplazamientos (inicio, fin) de una ruta, o None si no existe
+    def bounds(self, path):
+        segment, occurrence, field, rep, comp, sub = parse_path(path)
+        fields = self._fields
+        if field is None:
+            found = self._names.get(segment)
+            if found is None or not 0 < occurrence <= len(found):
+                return None
+            j = found[occurrence - 1]
+            return fields[2 * self._segs[j]], fields[2 * self._segs[j + 1] - 1]
+        i = self._field_index(segment, field, occurrence)
+        if i is None:
+            return None
+        start, end = fields[2 * i], fields[2 * i + 1]
+        if rep is None and comp is None:
+            return start, end
+        first, last = self._fcomp[i], self._fcomp[i + 1]
+        if first == last:  # MSH-1 / MSH-2: sin repeticiones ni componentes
+            return (start, end) if (rep or 1) == (comp or 1) == (sub or 1) == 1 else None
+        comps = self._comps
+        if (rep or 1) == 1:
+            if comp is None:
+                return comps[2 * first], comps[2 * last - 1]
+            if comp > last - first:
+                return None
+            k = first + comp - 1
+            found = comps[2 * k], comps[2 * k + 1]
+        else:
+            found = self._piece(start, end, self._rs, rep)
+            if found is not None and comp is not None:
+                found = self._piece(*found, self.component_sep.encode(), comp)
+        if found is not None and sub is not None:
+            found = self._piece(*found, self._ss, sub)
+        return found
+
+    # memoryview del valor de una ruta (vacío si no existe), sin copiar el mensaje
+    def view(self, path):
+        found = self.bounds(path)
+        return self._view[found[0]:found[1]] if found else self._view[0:0]
+
+    # Valor de una ruta como texto ER7 ('' si no existe)
+    def __getitem__(self, path):
+        found = self.bounds(path)
+        return str(self._view[found[0]:found[1]], self.encoding, 'ignore') if found else ''
+
+    def __contains__(self, path):
+        return self.bounds(path) is not None
+
+    # Devuelve MSH-n como texto ('' si no existe); MSH-1 es el propio separador
+    def msh_field(self, n):
+        return self.segment_field('MSH', n)
+
+    # Devuelve el campo n del primer segmento con ese nombre ('' si no existe)
+    def segment_field(self, segment, n):
+        i = self._field_index(segment, n)
+        if i is None:
+            return ''
+        return str(self._view[self._fields[2 * i]:self._fields[2 * i + 1]], self.encoding, 'ignore')
+
+
+# Función para tokenizar un mensaje HL7 en formato ER7 (str o bytes)
+# Lanza ValueError si el mensaje no empieza por MSH
+def tokenize(er7, encoding=ENCODING, find_groups=False):
+    return TokenizedMessage(er7, encoding, find_groups)
@@ -0,0 +1,120 @@
+"""
+Trazas de extremo a extremo HIS -> RIS -> HIS por orden.
+Cada OMI^O23 lleva un segmento ZTR con un ID de traza (el ID de la orden) y las marcas de
+tiempo de las etapas ya recorridas; el RIS añade las suyas y las devuelve en el ZTR del
+ORU^R01, de modo que el HIS puede calcular la duración de cada tramo. Las marcas son
+microsegundos de reloj de pared (time.time_ns), comparables si los simuladores
+comparten máquina o tienen los relojes sincronizados.
+"""
+# Importación de librerías estándar
+import threading  # El registrador se usa desde varios hilos
+import time  # Marcas de tiempo
+from collections import OrderedDict  # Trazas abiertas, las más antiguas primero
+from histogram import LatencyHistogram  # Latencia por tramo
+import metrics  # Publicación de los tramos en /metrics
+
+# Etapas en orden de paso
+STAGES = ('omi_send', 'omi_ack', 'ris_recv', 'oru_build', 'oru_send', 'his_recv')
+
+# Tramos medidos (desde, hasta); el último es el total de la orden
+SPANS = (
+    ('omi_send', 'omi_ack'),
+    ('omi_send', 'ris_recv'),
+    ('ris_recv', 'oru_build'),
+    ('oru_build', 'oru_send'),
+    ('oru_send', 'his_recv'),
+    ('omi_send', 'his_recv'),
+)
+
+MAX_OPEN_TRACES = 10000  # Trazas sin ORU que se recuerdan (las más antiguas se descartan)
+
+
+# Marca de tiempo actual en microsegundos
+def now_us():
+    return time.time_ns() // 1000
+
+
+# Segmento ZTR: ZTR|<trace_id>|etapa^marca~etapa^marca...
+def ztr_segment(trace_id, stamps):
+    marks = '~'.join(f'{stage}^{ts}' for stage, ts in stamps.items())
+    return f'ZTR|{trace_id}|{marks}'
+
+
+# Devuelve el mensaje ER7 con el segmento ZTR añadido al final
+def with_trace(er7, trace_id, stamps):
+    return er7 + '\r' + ztr_segment(trace_id, stamps)
+
+
+# Lee el ZTR de un mensaje (LazyMessage de hl7_lazy)
+# Devuelve (trace_id, {etapa: marca}) o (None, {}) si el mensaje no trae traza
+def read_trace(msg):
+    trace_id = msg.segment_field('ZTR', 1)
+    if not trace_id:
+        return None, {}
+    stamps = {}
+    for mark in msg.segment_field('ZTR', 2).split('~'):
+        stage, _, ts = mark.partition('^')
+        if ts.isdigit():
+            stamps[stage] = int(ts)
+    return trace_id, stamps
+
+
+# Registrador de trazas: marcas de las trazas abiertas y un histograma (µs) por tramo
+# start() guarda las marcas locales del emisor; finish() las combina con las recibidas en
+# el ZTR de la respuesta y registra todos los tramos completos. Los tramos locales que
+# pueden terminar después que la traza (omi_send -> omi_ack: el ORU puede llegar antes que
+# el ACK) se registran directamente con record().
+class TraceRecorder:
+    def __init__(self, max_open=MAX_OPEN_TRACES):
+        self.max_open = max_open
+        self.histograms = {span: LatencyHistogram() for span in SPANS}
+        self.completed = 0
+        self._open = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Abre una traza con sus primeras marcas
+    def start(self, trace_id, stamps):
+        with self._lock:
+            self._open[trace_id] = dict(stamps)
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+
+    # Cierra una traza: une las marcas locales con stamps y registra sus tramos
+    def finish(self, trace_id, stamps):
+        with self._lock:
+            merged = self._open.pop(trace_id, {})
+            self.completed += 1
+        merged.update(stamps)
+        self.record(merged)
+        return merged
+
+    # Registra todos los tramos cuyas dos marcas estén en stamps
+    def record(self, stamps):
+        for (start, end), hist in self.histograms.items():
+            if start in stamps and end in stamps:
+                hist.record(stamps[end] - stamps[start])
+
+    # Líneas de /metrics: un summary de Prometheus (segundos) por tramo con muestras
+    def metric_lines(self):
+        name = 'hl7_trace_span_seconds'
+        lines = [f"# HELP {name} Duración de cada tramo HIS -> RIS -> HIS por orden",
+                 f"# TYPE {name} summary"]
+        for (start, end), hist in self.histograms.items():
+            if not hist.count:
+                continue
+            span = f'{start}->{end}'
+            for q in (0.5, 0.95, 0.99, 0.999):
+                lines.append(f'{name}{{span="{span}",quantile="{q}"}} {hist.percentile(q * 100) / 1e6}')
+            lines.append(f'{name}_sum{{span="{span}"}} {hist.total / 1e6}')
+            lines.append(f'{name}_count{{span="{span}"}} {hist.count}')
+        return lines
+
+    # Resumen por tramo (solo los que tienen muestras)
+    def summary(self):
+        return [f"{start} -> {end}: {hist.summary()}"
+                for (start, end), hist in self.histograms.items() if hist.count]
+
+
+# Registrador compartido por el proceso
+recorder = TraceRecorder()
+metrics.registry.collector(recorder.metric_lines)
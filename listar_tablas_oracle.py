@@ -1,103 +1,81 @@
 """
 Script para conectarse a una base de datos Oracle y listar las tablas del esquema SEGMENTOS_HL7.
 Requiere: cx_Oracle (pip install cx_Oracle) y Oracle Instant Client instalado/configurado.
+Con --sqlite RUTA usa una base SQLite local con el mismo esquema de ADT_MESSAGES
+(--demo N la rellena con N mensajes de prueba).
+Los mensajes ADT se reconstruyen en streaming hacia stdout, un fichero rotativo o un
+servidor MLLP (--salida).
 """
-import cx_Oracle
-from hl7apy.core import Message
-from hl7apy.parser import parse_message
+import argparse
+import adt_db
+import adt_pipeline
 
-# Configuración de conexión
-usuario = 'SEGMENTOS_HL7'
-clave = 'SEGMENTOS_HL7'
-host = '172.16.60.21'
-port = 1521
-sid = 'prdsgh2'
-# Usar makedsn para construir el DSN con SID
-dsn = cx_Oracle.makedsn(host, port, sid=sid)
 
-try:
-    # Establecer conexión
-    conn = cx_Oracle.connect(user=usuario, password=clave, dsn=dsn)
-    print(f"Conectado a Oracle como {usuario}\n")
-    cur = conn.cursor()
+# Función para crear el destino del pipeline a partir de --salida
+# 'stdout', 'mllp://HOST:PUERTO' o una ruta de fichero (rotativo)
+def make_sink(salida, max_bytes=adt_pipeline.ROTATE_BYTES):
+    if salida == 'stdout':
+        return adt_pipeline.StdoutSink()
+    if salida.startswith('mllp://'):
+        host, _, port = salida[len('mllp://'):].rpartition(':')
+        return adt_pipeline.MLLPSink(host or 'localhost', int(port))
+    return adt_pipeline.RotatingFileSink(salida, max_bytes=max_bytes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sqlite', metavar='RUTA', help='Usar una base SQLite local en lugar de Oracle')
+    parser.add_argument('--demo', type=int, default=0, metavar='N',
+                        help='Insertar N mensajes de prueba en la base SQLite')
+    parser.add_argument('--fetch-size', type=int, default=adt_db.FETCH_SIZE,
+                        help='Filas por viaje de red (arraysize / fetchmany)')
+    parser.add_argument('--salida', default='stdout', metavar='DESTINO',
+                        help="Destino de los mensajes reconstruidos: stdout, una ruta de fichero "
+                             "o mllp://HOST:PUERTO")
+    parser.add_argument('--max-bytes', type=int, default=adt_pipeline.ROTATE_BYTES,
+                        help='Tamaño máximo de cada fichero de salida antes de rotar')
+    parser.add_argument('--informe', type=float, default=adt_pipeline.REPORT_INTERVAL,
+                        metavar='SEG', help='Segundos entre informes de avance (0 = solo al final)')
+    parser.add_argument('--procesos', type=int, default=1, metavar='N',
+                        help='Procesos que generan el ER7 en paralelo (1 = en el proceso principal)')
+    parser.add_argument('--chunk', type=int, default=adt_pipeline.CHUNK_SIZE, metavar='FILAS',
+                        help='Filas por bloque enviado a cada proceso')
+    parser.add_argument('--desordenado', action='store_true',
+                        help='Con --procesos, escribir los mensajes según terminan los bloques')
+    args = parser.parse_args(argv)
+
+    if args.sqlite:
+        conn = adt_db.connect_sqlite(args.sqlite)
+        if args.demo:
+            adt_db.populate_sqlite(conn, args.demo)
+        print(f"Conectado a SQLite ({args.sqlite})\n")
+    else:
+        conn = adt_db.connect_oracle()
+        print(f"Conectado a Oracle como {adt_db.ORACLE_USER}\n")
+
     # Consultar tablas del usuario
-    cur.execute("SELECT table_name FROM user_tables ORDER BY table_name")
-    tablas = cur.fetchall()
     print("Tablas en el esquema SEGMENTOS_HL7:")
-    for (tabla,) in tablas:
+    for tabla in adt_db.list_tables(conn):
         print(f"- {tabla}")
     print("\n---\n")
-    # Leer y mostrar todos los registros de ADT_MESSAGES
-    print("Registros en ADT_MESSAGES:")
-    cur.execute("SELECT ADT_MESSAGE_ID, HL7_RAW_MESSAGE, MESSAGE_SENT_FLAG, CREATED_AT FROM ADT_MESSAGES ORDER BY ADT_MESSAGE_ID")
-    rows = cur.fetchall()
-    hl7_objs = []  # Lista para almacenar los objetos hl7apy
-    for row in rows:
-        adt_id, hl7_msg, sent_flag, created_at = row
-        print(f"ID: {adt_id} | Enviado: {sent_flag} | Fecha: {created_at}")
-        print("Mensaje HL7 crudo:")
-        print(hl7_msg)
-        # Obtener todos los campos de la fila para construir el mensaje HL7 desde los campos de la tabla
-        cur2 = conn.cursor()
-        cur2.execute("""
-            SELECT ADT_MESSAGE_ID, MSH_FIELD_SEPARATOR, MSH_ENCODING_CHARACTERS, MSH_SENDING_APPLICATION, MSH_SENDING_FACILITY, 
-                   MSH_RECEIVING_APPLICATION, MSH_RECEIVING_FACILITY, MSH_DATETIME_OF_MESSAGE, MSH_MESSAGE_TYPE, MSH_MESSAGE_CONTROL_ID, 
-                   MSH_PROCESSING_ID, MSH_VERSION_ID, EVN_EVENT_TYPE_CODE, EVN_DATE_TIME_OF_EVENT, PID_SET_ID, PID_PATIENT_IDENTIFIER_LIST, 
-                   PID_PATIENT_NAME_FAMILY, PID_PATIENT_NAME_GIVEN, PID_DATE_OF_BIRTH, PID_ADMIN_SEX, PV1_SET_ID, PV1_PATIENT_CLASS, 
-                   PV1_ASSIGNED_PATIENT_LOCATION, PV1_ADMISSION_TYPE, PV1_ATTENDING_DOCTOR_ID
-            FROM ADT_MESSAGES WHERE ADT_MESSAGE_ID = :1
-        """, (adt_id,))
-        campos = cur2.fetchone()
-        if campos:
-            # Construir el mensaje HL7 desde los campos
-            try:
-                msg = Message("ADT_A01", version="2.5")
-                # MSH
-                msg.msh.msh_1 = campos[1] or '|'
-                msg.msh.msh_2 = campos[2] or '^~\&'
-                msg.msh.msh_3 = campos[3] or ''
-                msg.msh.msh_4 = campos[4] or ''
-                msg.msh.msh_5 = campos[5] or ''
-                msg.msh.msh_6 = campos[6] or ''
-                msg.msh.msh_7 = campos[7] or ''
-                msg.msh.msh_9 = campos[8] or ''
-                msg.msh.msh_10 = campos[9] or ''
-                msg.msh.msh_11 = campos[10] or ''
-                msg.msh.msh_12 = campos[11] or ''
-                # EVN
-                msg.evn.evn_1 = campos[12] or ''
-                msg.evn.evn_2 = campos[13] or ''
-                # PID
-                msg.pid.pid_1 = campos[14] or ''
-                msg.pid.pid_3 = campos[15] or ''
-                msg.pid.pid_5 = campos[16] or ''
-                msg.pid.pid_6 = campos[17] or ''
-                msg.pid.pid_7 = campos[18] or ''
-                msg.pid.pid_8 = campos[19] or ''
-                # PV1
-                msg.pv1.pv1_1 = campos[20] or ''
-                msg.pv1.pv1_2 = campos[21] or ''
-                msg.pv1.pv1_3 = campos[22] or ''
-                msg.pv1.pv1_4 = campos[23] or ''
-                msg.pv1.pv1_7 = campos[24] or ''
-                hl7_objs.append(msg)
-                print("[hl7apy] Mensaje HL7 construido desde campos de tabla:")
-                print(msg.to_er7())
-            except Exception as e:
-                print(f"[hl7apy] Error al construir HL7 desde campos: {e}")
-        cur2.close()
-        print("-"*60)
-    # Imprimir todos los mensajes almacenados en la lista como ER7
-    print("\nMensajes HL7 construidos desde campos de tabla:")
-    for i, msg in enumerate(hl7_objs, 1):
-        print(f"\n--- Mensaje {i} ---")
-        try:
-            print(msg.to_er7())
-        except Exception as e:
-            print(f"Error al imprimir mensaje {i}: {e}")
-    cur.close()
-    conn.close()
-except cx_Oracle.DatabaseError as e:
-    error, = e.args
-    print(f"Error de Oracle: {error.message}")
-    print("Verifica usuario, clave, DSN y que el Oracle Instant Client esté instalado.")
+    # Reconstruir los mensajes de ADT_MESSAGES en streaming: cada fila se convierte a ER7
+    # y se escribe en el destino sin acumular mensajes en memoria
+    print(f"Mensajes HL7 reconstruidos desde ADT_MESSAGES -> {args.salida}:\n", flush=True)
+    sink = make_sink(args.salida, args.max_bytes)
+    try:
+        adt_pipeline.run(adt_db.iter_adt_rows(conn, fetch_size=args.fetch_size), sink,
+                         report_interval=args.informe, workers=args.procesos,
+                         chunk_size=args.chunk, ordered=not args.desordenado)
+    finally:
+        conn.close()
+    if isinstance(sink, adt_pipeline.MLLPSink):
+        print(f"ACKs recibidos: {sink.acks} | Sin respuesta: {sink.errors}")
+
+if __name__ == '__main__':
+    try:
+        main()
+    except adt_db.database_errors() as e:
+        # cx_Oracle.DatabaseError trae un objeto de error con .message
+        error, = e.args
+        print(f"Error de Oracle: {getattr(error, 'message', error)}")
+        print("Verifica usuario, clave, DSN y que el Oracle Instant Client esté instalado.")
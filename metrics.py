@@ -0,0 +1,251 @@
+"""
+Registro de métricas en proceso con salida en formato de texto de Prometheus.
+Contadores, gauges e histogramas con etiquetas. Para que registrar una muestra no
+compita por un lock, cada hilo escribe en su propia celda (indexada por el id del hilo)
+y los valores se suman solo al leerlos (render()). serve() publica /metrics por HTTP en
+un hilo aparte; el monitor Flask lo expone en su propia ruta.
+"""
+# Importación de librerías estándar
+import threading  # Celdas por hilo y servidor HTTP en segundo plano
+from bisect import bisect_left  # Cubeta de cada observación
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Endpoint /metrics
+
+# Cubetas por defecto (segundos) para latencias
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0, 30.0)
+# Cubetas (bytes) para tamaños de bloque MLLP
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+# Escapa un valor de etiqueta (\\, comillas y saltos de línea)
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Texto {a="x",b="y"} para los nombres y valores de etiqueta dados
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+# Número en formato Prometheus (enteros sin decimales)
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+# Valor de un contador o gauge: celdas por hilo o función leída en cada render()
+class _Value:
+    __slots__ = ('_cells', '_function')
+
+    def __init__(self):
+        self._cells = {}
+        self._function = None
+
+    def inc(self, amount=1):
+        cells = self._cells
+        tid = threading.get_ident()
+        cells[tid] = cells.get(tid, 0) + amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    # Fija el valor (solo gauges): descarta las celdas y deja una sola
+    def set(self, value):
+        self._cells = {threading.get_ident(): value}
+
+    # El valor se obtiene llamando a function() al leerlo (p. ej. tamaño de una cola)
+    def set_function(self, function):
+        self._function = function
+
+    def get(self):
+        if self._function is not None:
+            return self._function()
+        return sum(list(self._cells.values()))
+
+
+# Histograma con cubetas fijas; cada hilo acumula en su celda [cuentas, suma]
+class _HistogramValue:
+    __slots__ = ('_bounds', '_cells')
+
+    def __init__(self, bounds):
+        self._bounds = bounds
+        self._cells = {}
+
+    def observe(self, value):
+        tid = threading.get_ident()
+        cell = self._cells.get(tid)
+        if cell is None:
+            cell = self._cells[tid] = [[0] * (len(self._bounds) + 1), 0.0]
+        cell[0][bisect_left(self._bounds, value)] += 1
+        cell[1] += value
+
+    # Devuelve (cuentas acumuladas por cubeta incluida +Inf, suma, total)
+    def get(self):
+        counts = [0] * (len(self._bounds) + 1)
+        total = 0.0
+        for cell_counts, cell_sum in list(self._cells.values()):
+            for i, c in enumerate(cell_counts):
+                counts[i] += c
+            total += cell_sum
+        cumulative, running = [], 0
+        for c in counts:
+            running += c
+            cumulative.append(running)
+        return cumulative, total, running
+
+
+# Familia de métricas con etiquetas; labels(*valores) devuelve (y recuerda) cada serie
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_value()  # Sin etiquetas: se publica desde 0
+
+    def _new_value(self):
+        return _Value()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} espera las etiquetas {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_value())
+        return child
+
+    # Atajos para métricas sin etiquetas
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def set_function(self, function):
+        self.labels().set_function(function)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{_labels(self.labelnames, values)} {_number(child.get())}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_value(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _samples(self):
+        bounds = [_number(float(b)) for b in self.buckets] + ['+Inf']
+        for values, child in list(self._children.items()):
+            cumulative, total, count = child.get()
+            for bound, c in zip(bounds, cumulative):
+                yield (f"{self.name}_bucket"
+                       f"{_labels(self.labelnames, values, (('le', bound),))} {c}")
+            yield f"{self.name}_sum{_labels(self.labelnames, values)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, values)} {count}"
+
+
+# Registro de métricas: las crea una sola vez por nombre y las vuelca en texto
+# collector(fn) añade una función que devuelve líneas ya formateadas (p. ej. hl7_trace)
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"La métrica {name} ya existe con otro tipo")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def collector(self, function):
+        self._collectors.append(function)
+
+    # Texto de todas las métricas en formato de exposición de Prometheus
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        for function in self._collectors:
+            lines.extend(function())
+        return '\n'.join(lines) + '\n'
+
+
+# Registro compartido por el proceso
+registry = Registry()
+counter = registry.counter
+gauge = registry.gauge
+histogram = registry.histogram
+render = registry.render
+
+
+# Manejador HTTP que responde /metrics con el registro por defecto
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Sin una línea por petición en la consola de los simuladores
+
+
+# Publica /metrics en host:port desde un hilo daemon; devuelve el servidor HTTP
+def serve(port, host='0.0.0.0'):
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
@@ -0,0 +1,628 @@
+"""
+Transporte MLLP compartido por los simuladores HIS y RIS.
+Incluye un cliente con conexiones persistentes (keep-alive) agrupadas por (host, puerto),
+reconexión automática cuando el par cierra y correlación de ACK por MSH-10 para
+poder tener varios mensajes en vuelo sobre el mismo socket, un decodificador
+incremental de bloques y un servidor asyncio que atiende muchas conexiones
+persistentes a la vez.
+"""
+# Importación de librerías estándar
+import socket  # Para comunicación de red
+import threading  # Para el hilo lector y los locks
+import itertools  # Para numerar los envíos en vuelo
+import asyncio  # Para el servidor MLLP concurrente
+import time  # Para medir respuestas y callbacks
+from collections import OrderedDict, deque  # Para la tabla de pendientes
+from concurrent.futures import Future, ThreadPoolExecutor  # Respuestas asíncronas y callbacks
+import metrics  # Contadores e histogramas de /metrics
+
+# Caracteres especiales del protocolo MLLP
+MLLP_SB = b'\x0b'  # <VT> - Start Block
+MLLP_EB = b'\x1c'  # <FS> - End Block
+MLLP_CR = b'\x0d'  # <CR> - Carriage Return
+
+# Valores por defecto del cliente
+DEFAULT_TIMEOUT = 30  # Segundos máximos esperando un ACK
+DEFAULT_MAX_CONNECTIONS = 4  # Conexiones persistentes por (host, puerto)
+DEFAULT_MAX_IN_FLIGHT = 64  # Mensajes en vuelo por conexión antes de abrir otra
+MAX_ABANDONED = 10000  # MSH-10 abandonados por timeout que se recuerdan para descartar su respuesta tardía
+RECV_SIZE = 65536  # Bytes leídos por cada recv()
+
+# Valores por defecto del servidor
+DEFAULT_BACKLOG = 1024  # Conexiones pendientes de accept() en la cola del kernel
+DEFAULT_READ_LIMIT = 16 * 1024 * 1024  # Tamaño máximo de un bloque MLLP (buffer de lectura por conexión)
+DEFAULT_HANDLER_WORKERS = 32  # Hilos que ejecutan los callbacks on_message
+
+
+# Métricas del transporte (side: 'client' o 'server')
+MESSAGES_SENT = metrics.counter('mllp_messages_sent_total',
+                                'Mensajes HL7 enviados por el cliente MLLP', ('type',))
+MESSAGES_RECEIVED = metrics.counter('mllp_messages_received_total',
+                                    'Mensajes HL7 recibidos por el servidor MLLP', ('server', 'type'))
+BYTES = metrics.counter('mllp_bytes_total', 'Bytes MLLP enviados y recibidos', ('side', 'direction'))
+FRAME_SIZE = metrics.histogram('mllp_frame_size_bytes', 'Tamaño de los bloques MLLP',
+                               ('side', 'direction'), buckets=metrics.SIZE_BUCKETS)
+ACK_CODES = metrics.counter('mllp_ack_codes_total',
+                            'Códigos MSA-1 de las respuestas recibidas por el cliente', ('code',))
+RESPONSE_SECONDS = metrics.histogram('mllp_response_seconds',
+                                     'Tiempo entre el envío y la respuesta (cliente)', ('type',))
+HANDLER_SECONDS = metrics.histogram('mllp_handler_seconds',
+                                    'Duración del callback on_message del servidor', ('server', 'type'))
+HANDLER_ERRORS = metrics.counter('mllp_handler_errors_total',
+                                 'Excepciones en el callback on_message', ('server',))
+FRAME_ERRORS = metrics.counter('mllp_frame_errors_total',
+                               'Bloques MLLP descartados por superar el tamaño máximo', ('side',))
+CONNECTION_ERRORS = metrics.counter('mllp_connection_errors_total',
+                                    'Conexiones del cliente cerradas con envíos pendientes')
+SERVER_CONNECTIONS = metrics.gauge('mllp_server_connections',
+                                   'Conexiones abiertas en el servidor MLLP', ('server',))
+SERVER_QUEUED = metrics.gauge('mllp_server_queued_frames',
+                              'Bloques recibidos esperando al callback', ('server',))
+
+
+# Función para encapsular un mensaje HL7 (str) en un bloque MLLP (bytes)
+def frame(hl7_message):
+    return MLLP_SB + hl7_message.encode() + MLLP_EB + MLLP_CR
+
+
+# Campos del segmento MSH (fields[n - 1] es MSH-n) o None si no empieza por MSH
+def _msh_fields(hl7_message):
+    msh = hl7_message.split('\r', 1)[0]
+    if not msh.startswith('MSH'):
+        return None
+    return msh.split(msh[3:4] or '|')
+
+
+# Función para obtener MSH-10 (ID de control) sin parsear el mensaje completo
+# Devuelve None si el mensaje no empieza por un segmento MSH válido
+def control_id(hl7_message):
+    fields = _msh_fields(hl7_message)
+    return fields[9] if fields and len(fields) > 9 else None
+
+
+# Tipo de mensaje para las métricas a partir de MSH-9 ('OMI^O23' -> 'OMI_O23')
+def message_type(hl7_message):
+    fields = _msh_fields(hl7_message)
+    if not fields or len(fields) < 9 or not fields[8]:
+        return 'unknown'
+    return '_'.join(fields[8].split(fields[1][:1] or '^')[:2])
+
+
+# Función para obtener MSA-2 (ID de control confirmado) de un ACK
+# Devuelve None si el mensaje no tiene segmento MSA
+def acked_control_id(hl7_message):
+    return _msa_field(hl7_message, 2)
+
+
+# Función para obtener MSA-1 (código de ACK: AA, AE, AR...) o None si no hay MSA
+def ack_code(hl7_message):
+    return _msa_field(hl7_message, 1)
+
+
+def _msa_field(hl7_message, n):
+    for segment in hl7_message.split('\r'):
+        if segment.startswith('MSA'):
+            fields = segment.split('|')
+            return fields[n] if len(fields) > n else None
+    return None
+
+
+# Error lanzado a los envíos pendientes cuando la conexión se cierra sin respuesta
+class MLLPConnectionClosed(ConnectionError):
+    pass
+
+
+# Error lanzado por el decodificador cuando un bloque supera el tamaño máximo
+class MLLPFrameTooLarge(ValueError):
+    pass
+
+
+# Decodificador incremental de bloques MLLP <VT>...<FS><CR>
+# Los bytes se reciben directamente en un bytearray reutilizable (get_buffer() + commit(n),
+# pensado para recv_into/BufferedProtocol) o se copian una sola vez con feed(data).
+# La búsqueda de <FS> continúa donde se quedó la lectura anterior, así que un mensaje
+# partido en muchas lecturas se recorre una única vez; cada bloque completo se copia
+# una sola vez al devolverlo. Los bytes fuera de un bloque se descartan.
+class MLLPFrameDecoder:
+    def __init__(self, max_frame_size=DEFAULT_READ_LIMIT, buffer_size=RECV_SIZE):
+        self.max_frame_size = max_frame_size
+        self._buf = bytearray(buffer_size)
+        self._view = memoryview(self._buf)
+        self._start = 0  # Inicio de los datos pendientes (el <VT> del bloque en curso)
+        self._end = 0  # Fin de los datos recibidos
+        self._scan = 0  # Posición desde la que seguir buscando <FS>
+        self._in_frame = False  # True si _start apunta a un <VT>
+
+    # Bytes recibidos que aún no forman un bloque completo
+    @property
+    def pending(self):
+        return self._end - self._start
+
+    # Devuelve un memoryview con al menos size bytes libres donde escribir lo recibido
+    def get_buffer(self, size=RECV_SIZE):
+        if size <= 0:
+            size = RECV_SIZE
+        capacity = len(self._buf)
+        if capacity - self._end < size:
+            live = self._end - self._start
+            if live <= capacity // 2 and live + size <= capacity:
+                # Compacta: mueve el bloque parcial al principio del buffer
+                self._view[:live] = self._view[self._start:self._end]
+            else:
+                # Crece: el bloque parcial no cabe cómodamente
+                new = bytearray(max(capacity * 2, live + size))
+                new[:live] = self._view[self._start:self._end]
+                self._buf, self._view = new, memoryview(new)
+            self._scan = max(self._scan - self._start, 0)
+            self._end = live
+            self._start = 0
+        return self._view[self._end:self._end + size]
+
+    # Registra nbytes escritos en el último get_buffer() y devuelve los bloques completos
+    def commit(self, nbytes):
+        self._end += nbytes
+        return self._frames()
+
+    # Copia data al buffer y devuelve los bloques completos
+    def feed(self, data):
+        n = len(data)
+        self.get_buffer(n)[:n] = data
+        return self.commit(n)
+
+    # Extrae todos los bloques completos disponibles (bytes sin <VT> ni <FS><CR>)
+    def _frames(self):
+        frames = []
+        buf = self._buf
+        while True:
+            if not self._in_frame:
+                sb = buf.find(MLLP_SB, self._start, self._end)
+                if sb < 0:
+                    self._start = self._end = self._scan = 0  # Nada útil: se reinicia el buffer
+                    break
+                self._start = sb
+                self._scan = sb + 1
+                self._in_frame = True
+            eb = buf.find(MLLP_EB, self._scan, self._end)
+            if eb < 0 or eb + 1 >= self._end:
+                # Bloque incompleto (o falta el <CR> final): se espera a la siguiente lectura
+                self._scan = self._end if eb < 0 else eb
+                if self._scan - self._start - 1 > self.max_frame_size:
+                    self._reset()
+                    raise MLLPFrameTooLarge(f"Bloque MLLP mayor que {self.max_frame_size} bytes")
+                break
+            if eb - self._start - 1 > self.max_frame_size:
+                self._reset()
+                raise MLLPFrameTooLarge(f"Bloque MLLP mayor que {self.max_frame_size} bytes")
+            frames.append(bytes(self._view[self._start + 1:eb]))
+            self._start = eb + 2 if buf[eb + 1] == MLLP_CR[0] else eb + 1
+            self._in_frame = False
+        if self._start == self._end:
+            self._start = self._end = self._scan = 0
+        return frames
+
+    # Descarta todo lo recibido (tras un bloque demasiado grande)
+    def _reset(self):
+        self._start = self._end = self._scan = 0
+        self._in_frame = False
+
+
+# Conexión MLLP persistente con envío en pipeline
+# Un hilo lector extrae los bloques recibidos y resuelve el Future del mensaje
+# cuyo MSH-10 coincide con el MSA-2 de la respuesta (o el más antiguo si no hay MSA).
+class MLLPClient:
+    def __init__(self, host, port, timeout=DEFAULT_TIMEOUT, max_frame_size=DEFAULT_READ_LIMIT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_frame_size = max_frame_size
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.sock.settimeout(None)  # El hilo lector bloquea hasta recibir datos o cierre
+        self.closed = False
+        self.used = False  # True tras el primer envío: si falla, puede ser un socket caducado
+        self._send_lock = threading.Lock()  # Serializa las escrituras en el socket
+        self._state_lock = threading.Lock()  # Protege la tabla de pendientes (lo usa el lector)
+        self._pending = OrderedDict()  # seq -> (msh10, Future, tipo, instante), en orden de envío
+        self._by_ctrl_id = {}  # msh10 -> deque de seq
+        self._abandoned = OrderedDict()  # msh10 abandonados por timeout (sus respuestas tardías se descartan)
+        self._seq = itertools.count()
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    # Número de mensajes enviados que aún esperan respuesta
+    @property
+    def in_flight(self):
+        return len(self._pending)
+
+    # Envía un mensaje sin esperar respuesta; devuelve un Future con el ACK (str)
+    def send_async(self, hl7_message):
+        future = Future()
+        ctrl_id = control_id(hl7_message)
+        msg_type = message_type(hl7_message)
+        data = frame(hl7_message)
+        # El registro se hace bajo el lock de envío para que el orden de la tabla
+        # coincida con el orden en el cable; el lector nunca toma ese lock
+        with self._send_lock:
+            with self._state_lock:
+                if self.closed:
+                    raise MLLPConnectionClosed(f"Conexión cerrada con {self.host}:{self.port}")
+                seq = next(self._seq)
+                future.mllp_seq = seq  # Para abandon()
+                self._pending[seq] = (ctrl_id, future, msg_type, time.perf_counter())
+                self._by_ctrl_id.setdefault(ctrl_id, deque()).append(seq)
+                self.used = True
+            try:
+                self.sock.sendall(data)
+            except OSError as e:
+                with self._state_lock:
+                    self._fail_pending(e)
+                raise MLLPConnectionClosed(str(e)) from e
+        MESSAGES_SENT.labels(msg_type).inc()
+        BYTES.labels('client', 'out').inc(len(data))
+        FRAME_SIZE.labels('client', 'out').observe(len(data))
+        return future
+
+    # Envía un mensaje y espera su respuesta
+    # Si vence el timeout el envío se abandona (deja de contar como en vuelo)
+    def send(self, hl7_message, timeout=None):
+        future = self.send_async(hl7_message)
+        try:
+            return future.result(timeout if timeout is not None else self.timeout)
+        except TimeoutError:
+            self.abandon(future)
+            raise
+
+    # Deja de esperar la respuesta de un envío (Future de send_async): se quita de los
+    # pendientes y se cancela; si la respuesta llega después, se descarta
+    def abandon(self, future):
+        with self._state_lock:
+            entry = self._pending.pop(getattr(future, 'mllp_seq', None), None)
+            if entry is not None:
+                ctrl_id = entry[0]
+                seqs = self._by_ctrl_id.get(ctrl_id)
+                seqs.remove(future.mllp_seq)
+                if not seqs:
+                    del self._by_ctrl_id[ctrl_id]
+                self._abandoned[ctrl_id] = None
+                if len(self._abandoned) > MAX_ABANDONED:
+                    self._abandoned.popitem(last=False)
+        future.cancel()
+
+    # Cierra el socket y falla los envíos pendientes
+    def close(self):
+        with self._state_lock:
+            self._fail_pending(MLLPConnectionClosed("Conexión cerrada localmente"))
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    # Marca la conexión como cerrada y propaga el error a todos los pendientes
+    # Debe llamarse con _state_lock tomado
+    def _fail_pending(self, error):
+        self.closed = True
+        pending, self._pending = self._pending, OrderedDict()
+        self._by_ctrl_id = {}
+        if pending:
+            CONNECTION_ERRORS.inc()
+        for _, future, _, _ in pending.values():
+            if not future.done():
+                future.set_exception(error if isinstance(error, MLLPConnectionClosed)
+                                     else MLLPConnectionClosed(str(error)))
+
+    # Resuelve el Future correspondiente a una respuesta recibida
+    def _resolve(self, hl7):
+        with self._state_lock:
+            seqs = self._by_ctrl_id.get(acked_control_id(hl7))
+            if seqs:
+                seq = seqs.popleft()
+            elif self._abandoned.pop(acked_control_id(hl7), False) is None:
+                return  # Respuesta tardía de un envío abandonado: se descarta
+            elif self._pending:
+                seq = next(iter(self._pending))  # Sin correlación: el más antiguo (MLLP es ordenado)
+                seqs = self._by_ctrl_id.get(self._pending[seq][0])
+                seqs.remove(seq)
+            else:
+                return  # Respuesta no solicitada: se descarta
+            ctrl_id, future, msg_type, sent_at = self._pending.pop(seq)
+            if not seqs:
+                self._by_ctrl_id.pop(ctrl_id, None)
+        RESPONSE_SECONDS.labels(msg_type).observe(time.perf_counter() - sent_at)
+        ACK_CODES.labels(ack_code(hl7) or 'none').inc()
+        if future.set_running_or_notify_cancel():
+            future.set_result(hl7)
+
+    # Hilo lector: recibe directamente en el buffer del decodificador y resuelve cada bloque
+    def _read_loop(self):
+        decoder = MLLPFrameDecoder(self.max_frame_size)
+        try:
+            while True:
+                n = self.sock.recv_into(decoder.get_buffer())
+                if not n:
+                    break
+                BYTES.labels('client', 'in').inc(n)
+                for block in decoder.commit(n):
+                    FRAME_SIZE.labels('client', 'in').observe(len(block))
+                    self._resolve(block.decode(errors='ignore'))
+        except MLLPFrameTooLarge:
+            FRAME_ERRORS.labels('client').inc()
+        except OSError:
+            pass
+        finally:
+            with self._state_lock:
+                self._fail_pending(MLLPConnectionClosed(
+                    f"{self.host}:{self.port} cerró la conexión sin responder"))
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+
+
+# Pool de conexiones MLLP persistentes por (host, puerto)
+# Reutiliza la conexión con menos mensajes en vuelo y abre otra solo si todas están
+# por encima de max_in_flight; las conexiones cerradas por el par se descartan y se
+# reconectan en el siguiente envío.
+class MLLPConnectionPool:
+    def __init__(self, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 max_in_flight=DEFAULT_MAX_IN_FLIGHT, timeout=DEFAULT_TIMEOUT):
+        self.max_connections = max_connections
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._clients = {}  # (host, port) -> lista de MLLPClient
+
+    # Conexiones abiertas hacia (host, port), descartando las cerradas
+    # Debe llamarse con _lock tomado
+    def _open_clients(self, host, port):
+        clients = [c for c in self._clients.get((host, port), []) if not c.closed]
+        self._clients[(host, port)] = clients
+        return clients
+
+    # Devuelve una conexión abierta hacia (host, port), creándola si hace falta
+    # La conexión TCP se abre fuera del lock para que un par lento no bloquee a los demás;
+    # si entretanto otros hilos llenaron el pool, la nueva se cierra y se reutiliza una existente
+    def get(self, host, port):
+        with self._lock:
+            clients = self._open_clients(host, port)
+            best = min(clients, key=lambda c: c.in_flight, default=None)
+            if best is not None and (best.in_flight < self.max_in_flight
+                                     or len(clients) >= self.max_connections):
+                return best
+        client = MLLPClient(host, port, timeout=self.timeout)
+        with self._lock:
+            clients = self._open_clients(host, port)
+            if len(clients) < self.max_connections:
+                clients.append(client)
+                return client
+            best = min(clients, key=lambda c: c.in_flight)
+        client.close()
+        return best
+
+    # Envía un mensaje y devuelve un Future con la respuesta
+    def send_async(self, host, port, hl7_message):
+        return self.get(host, port).send_async(hl7_message)
+
+    # Envía un mensaje y espera la respuesta
+    # Si una conexión reutilizada resulta estar caducada se reintenta una vez con otra nueva
+    def send(self, host, port, hl7_message, timeout=None):
+        timeout = timeout if timeout is not None else self.timeout
+        for attempt in range(2):
+            client = self.get(host, port)
+            reused = client.used
+            try:
+                return client.send(hl7_message, timeout)
+            except MLLPConnectionClosed:
+                if attempt or not reused:
+                    raise
+
+    # Cierra todas las conexiones del pool
+    def close(self):
+        with self._lock:
+            clients = [c for lst in self._clients.values() for c in lst]
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+
+# Pool por defecto compartido por los simuladores
+pool = MLLPConnectionPool()
+
+
+# Conexiones del pool por defecto y mensajes en vuelo (se leen en cada /metrics)
+def _pool_clients():
+    return [c for clients in list(pool._clients.values()) for c in list(clients)]
+
+
+CLIENT_CONNECTIONS = metrics.gauge('mllp_client_connections',
+                                   'Conexiones abiertas del pool de clientes MLLP')
+CLIENT_CONNECTIONS.set_function(lambda: len(_pool_clients()))
+CLIENT_IN_FLIGHT = metrics.gauge('mllp_client_in_flight', 'Mensajes del pool esperando respuesta')
+CLIENT_IN_FLIGHT.set_function(lambda: sum(c.in_flight for c in _pool_clients()))
+
+
+# Función para enviar mensajes HL7 usando MLLP como cliente a través del pool por defecto
+# host: destino, port: puerto destino, hl7_message: mensaje HL7 en string
+# Devuelve el mensaje HL7 recibido como respuesta (ACK, ORU, etc.) o None si el par
+# cerró la conexión sin responder
+def send_mllp_message(host, port, hl7_message):
+    try:
+        return pool.send(host, port, hl7_message)
+    except MLLPConnectionClosed:
+        return None
+
+
+# Adaptador que ofrece sendall() a los callbacks síncronos (on_his_message, on_ris_message)
+# Las escrituras se delegan al bucle de eventos y se espera a que el transporte acepte
+# más datos, de modo que el hilo del callback recibe contrapresión si el par no lee.
+class _ConnectionProxy:
+    def __init__(self, loop, protocol):
+        self._loop = loop
+        self._protocol = protocol
+        self.peername = protocol.transport.get_extra_info('peername')
+
+    def sendall(self, data):
+        asyncio.run_coroutine_threadsafe(self._protocol.write(data), self._loop).result()
+        BYTES.labels('server', 'out').inc(len(data))
+        FRAME_SIZE.labels('server', 'out').observe(len(data))
+
+
+# Protocolo de una conexión MLLP del servidor
+# El kernel escribe directamente en el buffer del decodificador (BufferedProtocol) y los
+# bloques completos se encolan; una tarea por conexión los entrega en orden al callback.
+# Si la cola crece demasiado se pausa la lectura del socket.
+class _MLLPServerProtocol(asyncio.BufferedProtocol):
+    MAX_QUEUED_FRAMES = 256  # Bloques encolados antes de pausar la lectura
+
+    def __init__(self, server):
+        self.server = server
+        self.decoder = MLLPFrameDecoder(server.read_limit)
+        self.frames = deque()
+        self.transport = None
+        self.closed = False
+        self.eof = False
+        self.paused = False
+
+    def connection_made(self, transport):
+        loop = self.server._loop
+        self.transport = transport
+        self.conn = _ConnectionProxy(loop, self)
+        self._wakeup = asyncio.Event()
+        self._can_write = asyncio.Event()
+        self._can_write.set()
+        self.server.connections += 1
+        self.server._protocols.add(self)
+        loop.create_task(self._process())
+
+    def get_buffer(self, sizehint):
+        return self.decoder.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes):
+        BYTES.labels('server', 'in').inc(nbytes)
+        try:
+            frames = self.decoder.commit(nbytes)
+        except MLLPFrameTooLarge as e:
+            FRAME_ERRORS.labels('server').inc()
+            print(f"[{self.server.name}] {e} desde {self.conn.peername}. Cerrando conexión.")
+            self.transport.close()
+            return
+        if frames:
+            self.frames.extend(frames)
+            self._wakeup.set()
+            if len(self.frames) >= self.MAX_QUEUED_FRAMES and not self.paused:
+                self.paused = True
+                self.transport.pause_reading()
+
+    def eof_received(self):
+        self.eof = True
+        self._wakeup.set()
+        return True  # La conexión se cierra tras responder a lo ya recibido
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self.server.connections -= 1
+        self.server._protocols.discard(self)
+        self._wakeup.set()
+        self._can_write.set()
+
+    def pause_writing(self):
+        self._can_write.clear()
+
+    def resume_writing(self):
+        self._can_write.set()
+
+    # Escribe una respuesta y espera si el buffer de escritura está lleno
+    async def write(self, data):
+        if self.closed:
+            raise MLLPConnectionClosed(f"{self.conn.peername} cerró la conexión")
+        self.transport.write(data)
+        await self._can_write.wait()
+
+    # Entrega los bloques de la conexión al callback, en orden y fuera del bucle de eventos
+    async def _process(self):
+        server = self.server
+        while not self.closed:
+            if not self.frames:
+                if self.eof:
+                    break
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            block = self.frames.popleft()
+            hl7 = block.decode(errors='ignore')
+            if self.paused and len(self.frames) < self.MAX_QUEUED_FRAMES // 2:
+                self.paused = False
+                self.transport.resume_reading()
+            msg_type = message_type(hl7)
+            MESSAGES_RECEIVED.labels(server.name, msg_type).inc()
+            FRAME_SIZE.labels('server', 'in').observe(len(block))
+            started = time.perf_counter()
+            try:
+                await server._loop.run_in_executor(server._executor, server.on_message,
+                                                   hl7, self.conn)
+            except Exception as e:
+                HANDLER_ERRORS.labels(server.name).inc()
+                print(f"[{server.name}] Error procesando mensaje de {self.conn.peername}: {e}")
+            finally:
+                HANDLER_SECONDS.labels(server.name, msg_type).observe(time.perf_counter() - started)
+        self.transport.close()
+
+
+# Servidor MLLP basado en asyncio
+# Cada conexión es persistente y puede traer varios bloques seguidos; los bloques de una
+# misma conexión se procesan en orden y los callbacks corren en un pool de hilos para no
+# bloquear el bucle de eventos con el trabajo de cada mensaje.
+# backlog: cola de accept() del kernel, read_limit: tamaño máximo de bloque por conexión
+# reuse_port: SO_REUSEPORT, para que varios procesos escuchen en el mismo puerto y el
+# kernel reparta las conexiones entre ellos (ris_prefork.py)
+class MLLPServer:
+    def __init__(self, host, port, on_message, backlog=DEFAULT_BACKLOG,
+                 read_limit=DEFAULT_READ_LIMIT, handler_workers=DEFAULT_HANDLER_WORKERS,
+                 name='MLLP', reuse_port=False):
+        self.host = host
+        self.port = port
+        self.on_message = on_message
+        self.backlog = backlog
+        self.reuse_port = reuse_port
+        self.read_limit = read_limit
+        self.name = name
+        self.connections = 0  # Conexiones abiertas en este momento
+        self._protocols = set()  # Conexiones vivas (para la métrica de bloques en cola)
+        SERVER_CONNECTIONS.labels(name).set_function(lambda: self.connections)
+        SERVER_QUEUED.labels(name).set_function(
+            lambda: sum(len(p.frames) for p in list(self._protocols)))
+        self._executor = ThreadPoolExecutor(max_workers=handler_workers,
+                                            thread_name_prefix=f"{name}-handler")
+        self._loop = None
+        self._server = None
+        self._ready = threading.Event()
+        self._error = None
+
+    # Arranca el bucle de eventos en un hilo daemon y espera a que el puerto esté escuchando
+    def start(self):
+        threading.Thread(target=self._run, name=f"{self.name}-mllp", daemon=True).start()
+        self._ready.wait()
+        if self._error:
+            raise self._error
+        return self
+
+    # Detiene el servidor y el bucle de eventos
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        self._executor.shutdown(wait=False)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._server = self._loop.run_until_complete(self._loop.create_server(
+                lambda: _MLLPServerProtocol(self), self.host, self.port,
+                backlog=self.backlog, reuse_address=True, reuse_port=self.reuse_port or None))
+        except OSError as e:
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        self._loop.run_forever()
@@ -0,0 +1,190 @@
+"""
+Ritmo (pacing) de los pasos de los simuladores HIS y RIS.
+Un Pacer decide cuándo toca el siguiente paso (enviar una orden, un resultado...) sin
+dormir en quien lo pide: due() devuelve el instante (time.monotonic()) y es quien ejecuta
+el paso el que espera, en un hilo propio o en el script principal, nunca en un callback
+del servidor MLLP. Modos:
+- presentacion:S  pasos separados al menos S segundos (demo didáctica)
+- rapido          sin pausas (pruebas de rendimiento)
+- ritmo:N         N pasos por segundo en un calendario fijo
+- replay[:V]      el ritmo original de los mensajes (MSH-7), acelerado V veces
+DelayQueue es la cola con instante de salida que usan los hilos de envío del RIS.
+"""
+# Importación de librerías estándar
+import calendar  # Conversión de MSH-7 a segundos
+import heapq  # Cola ordenada por instante de salida
+import itertools  # Desempate estable en la cola
+import threading  # Sincronización de la cola y del calendario
+import time  # Reloj monotónico y esperas
+
+# Modo por defecto de los simuladores (equivale al antiguo DEMO_DELAY de 7 s)
+DEFAULT_SPEC = 'presentacion:7'
+
+
+# Convierte un TS de HL7 (YYYY[MM[DD[HH[MM[SS[.S...]]]]]][+/-ZZZZ]) en segundos desde epoch
+# Sin zona se interpreta como hora local; devuelve None si no hay fecha o no es válida
+def hl7_time(ts):
+    ts = (ts or '').strip()
+    if len(ts) < 4:
+        return None
+    try:
+        offset = None
+        for sign in ('+', '-'):
+            pos = ts.find(sign, 4)
+            if pos != -1:
+                zone = ts[pos + 1:pos + 5]
+                offset = (int(zone[:2]) * 3600 + int(zone[2:4]) * 60) * (1 if sign == '+' else -1)
+                ts = ts[:pos]
+                break
+        whole, _, fraction = ts.partition('.')
+        whole = whole.ljust(14, '0')
+        parts = [int(whole[0:4]), int(whole[4:6]) or 1, int(whole[6:8]) or 1,
+                 int(whole[8:10]), int(whole[10:12]), int(whole[12:14])]
+        if offset is None:
+            seconds = time.mktime(tuple(parts) + (0, 0, -1))
+        else:
+            seconds = calendar.timegm(tuple(parts) + (0, 0, 0)) - offset
+    except (ValueError, OverflowError):
+        return None
+    return seconds + (float('0.' + fraction) if fraction.isdigit() else 0.0)
+
+
+# Ritmo base ("rapido"): cada paso puede ejecutarse ya
+# due(event_time) devuelve el instante monotónico del paso; event_time es la hora
+# original del mensaje (solo la usa replay). wait() duerme hasta ese instante y está
+# pensado para scripts y hilos de envío, no para callbacks del servidor MLLP.
+class Pacer:
+    name = 'rapido'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.lag = 0.0  # Mayor retraso de un paso respecto a su instante (s)
+
+    def _due(self, now, event_time):
+        return now
+
+    def due(self, event_time=None):
+        now = time.monotonic()
+        with self._lock:
+            return self._due(now, event_time)
+
+    def wait(self, event_time=None):
+        delay = self.due(event_time) - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            self.lag = max(self.lag, -delay)
+
+    def __repr__(self):
+        return self.name
+
+
+# Presentación: pasos separados al menos step segundos; el primero no espera
+class Presentation(Pacer):
+    name = 'presentacion'
+
+    def __init__(self, step):
+        super().__init__()
+        self.step = step
+        self._last = None
+
+    def _due(self, now, event_time):
+        due = now if self._last is None else max(now, self._last + self.step)
+        self._last = due
+        return due
+
+    def __repr__(self):
+        return f'{self.name}:{self.step:g}'
+
+
+# Ritmo fijo: el paso k toca en inicio + k / rate (si se va con retraso no se acumulan
+# ráfagas para recuperarlo, el calendario sigue desde el instante actual)
+class FixedRate(Pacer):
+    name = 'ritmo'
+
+    def __init__(self, rate):
+        super().__init__()
+        if rate <= 0:
+            raise ValueError("El ritmo debe ser mayor que 0")
+        self.rate = rate
+        self._next = None
+
+    def _due(self, now, event_time):
+        due = now if self._next is None else max(now, self._next)
+        self._next = due + 1.0 / self.rate
+        return due
+
+    def __repr__(self):
+        return f'{self.name}:{self.rate:g}'
+
+
+# Replay: respeta la separación original entre mensajes (event_time, p. ej. MSH-7),
+# dividida por speed; los pasos sin hora original se ejecutan ya
+class Replay(Pacer):
+    name = 'replay'
+
+    def __init__(self, speed=1.0):
+        super().__init__()
+        if speed <= 0:
+            raise ValueError("La velocidad debe ser mayor que 0")
+        self.speed = speed
+        self._origin = None  # (hora original del primer mensaje, instante monotónico)
+
+    def _due(self, now, event_time):
+        if event_time is None:
+            return now
+        if self._origin is None:
+            self._origin = (event_time, now)
+        first_event, start = self._origin
+        return start + (event_time - first_event) / self.speed
+
+    def __repr__(self):
+        return f'{self.name}:{self.speed:g}'
+
+
+# Crea un Pacer a partir de 'presentacion:7', 'rapido', 'ritmo:200' o 'replay:2'
+def from_spec(spec):
+    name, _, arg = str(spec).strip().partition(':')
+    name = name.lower()
+    try:
+        if name in ('presentacion', 'demo'):
+            return Presentation(float(arg or 7))
+        if name in ('rapido', 'asap'):
+            return Pacer()
+        if name in ('ritmo', 'rate'):
+            return FixedRate(float(arg))
+        if name == 'replay':
+            return Replay(float(arg or 1))
+    except ValueError as e:
+        raise ValueError(f"Ritmo no válido '{spec}': {e}") from None
+    raise ValueError(f"Ritmo desconocido '{spec}' (presentacion:S, rapido, ritmo:N, replay[:V])")
+
+
+# Cola con instante de salida: put() nunca bloquea (se puede llamar desde un callback
+# MLLP) y get() entrega cada elemento cuando llega su instante, en orden de instante
+class DelayQueue:
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def put(self, item, due=None):
+        due = time.monotonic() if due is None else due
+        with self._cond:
+            heapq.heappush(self._heap, (due, next(self._seq), item))
+            self._cond.notify()
+
+    def get(self):
+        with self._cond:
+            while True:
+                if self._heap:
+                    delay = self._heap[0][0] - time.monotonic()
+                    if delay <= 0:
+                        return heapq.heappop(self._heap)[2]
+                    self._cond.wait(delay)
+                else:
+                    self._cond.wait()
+
+    # Elementos encolados (incluidos los que aún no han llegado a su instante)
+    def qsize(self):
+        return len(self._heap)
@@ -0,0 +1,133 @@
+"""
+Ejecutor particionado por clave (p. ej. paciente, PID-3).
+Cada clave se asigna siempre al mismo carril (CRC32 de la clave módulo el número de
+carriles); cada carril es un hilo con su cola FIFO, así que las tareas de una misma clave
+se ejecutan en el orden en que se enviaron mientras las de claves distintas corren en
+paralelo en otros carriles. Publica la profundidad de cada carril en /metrics y detecta
+particiones calientes: un carril con al menos hot_depth tareas y hot_factor veces la
+media del resto se marca como caliente y se avisa (on_hot) con las claves más
+frecuentes, estimadas con un contador Misra-Gries de memoria fija.
+"""
+# Importación de librerías estándar
+import queue  # Cola FIFO de cada carril
+import threading  # Un hilo por carril
+import zlib  # Hash estable de la clave (igual en todos los procesos)
+from concurrent.futures import Future  # Resultado de cada tarea
+import metrics  # Profundidad de carriles y particiones calientes
+
+LANES = 8  # Carriles por defecto
+HOT_DEPTH = 50  # Tareas en cola a partir de las cuales un carril puede estar caliente
+HOT_FACTOR = 4.0  # Veces la media de los demás carriles
+TOP_KEYS = 32  # Contadores del estimador de claves frecuentes
+
+# Métricas de los ejecutores (executor: nombre del ejecutor, lane: número de carril)
+LANE_DEPTH = metrics.gauge('partition_lane_depth', 'Tareas en cola o en curso por carril',
+                           ('executor', 'lane'))
+LANE_TASKS = metrics.counter('partition_tasks_total', 'Tareas ejecutadas por carril', ('executor', 'lane'))
+HOT_LANES = metrics.gauge('partition_hot_lanes', 'Carriles marcados como calientes', ('executor',))
+HOT_EVENTS = metrics.counter('partition_hot_events_total',
+                             'Veces que un carril pasó a estar caliente', ('executor',))
+
+
+# Claves más frecuentes con k contadores (Misra-Gries): toda clave con más de n/(k+1)
+# apariciones está garantizada; las cuentas son una cota inferior
+class HeavyHitters:
+    def __init__(self, k=TOP_KEYS):
+        self.k = k
+        self.counts = {}
+
+    def add(self, key):
+        counts = self.counts
+        if key in counts:
+            counts[key] += 1
+        elif len(counts) < self.k:
+            counts[key] = 1
+        else:
+            for other in list(counts):
+                counts[other] -= 1
+                if not counts[other]:
+                    del counts[other]
+
+    def top(self, n=5):
+        return sorted(self.counts.items(), key=lambda item: -item[1])[:n]
+
+
+# Ejecutor con un hilo por carril; submit(clave, fn, *args) devuelve un Future
+# on_hot(carril, profundidad, claves_frecuentes) se llama cuando un carril pasa a caliente
+# Si quien envía espera al Future (como el RIS), la profundidad de un carril no supera el
+# número de hilos que envían: hot_depth debe quedar por debajo de ese número
+class PartitionedExecutor:
+    def __init__(self, lanes=LANES, name='lanes', hot_depth=HOT_DEPTH, hot_factor=HOT_FACTOR,
+                 on_hot=None):
+        self.lanes = lanes
+        self.name = name
+        self.hot_depth = hot_depth
+        self.hot_factor = hot_factor
+        self.on_hot = on_hot
+        self._queues = [queue.SimpleQueue() for _ in range(lanes)]
+        self._depths = [0] * lanes  # Tareas en cola o en curso
+        self._hot = set()  # Carriles calientes (dejan de serlo al bajar de hot_depth / 2)
+        self._keys = HeavyHitters()
+        self._lock = threading.Lock()
+        for lane in range(lanes):
+            LANE_DEPTH.labels(name, str(lane)).set_function(lambda lane=lane: self._depths[lane])
+            threading.Thread(target=self._run, args=(lane,), name=f'{name}-{lane}', daemon=True).start()
+        HOT_LANES.labels(name).set_function(lambda: len(self._hot))
+
+    # Carril de una clave (estable entre ejecuciones y procesos)
+    def lane(self, key):
+        return zlib.crc32(str(key).encode()) % self.lanes
+
+    def submit(self, key, fn, *args, **kwargs):
+        future = Future()
+        lane = self.lane(key)
+        with self._lock:
+            self._depths[lane] += 1
+            depth = self._depths[lane]
+            self._keys.add(key)
+            became_hot = lane not in self._hot and self._is_hot(lane)
+            if became_hot:
+                self._hot.add(lane)
+                top = self._keys.top()
+        self._queues[lane].put((future, fn, args, kwargs))
+        if became_hot:
+            HOT_EVENTS.labels(self.name).inc()
+            if self.on_hot is not None:
+                self.on_hot(lane, depth, top)
+        return future
+
+    # Debe llamarse con _lock tomado
+    def _is_hot(self, lane):
+        depth = self._depths[lane]
+        if depth < self.hot_depth:
+            return False
+        others = (sum(self._depths) - depth) / max(self.lanes - 1, 1)
+        return depth >= self.hot_factor * max(others, 1)
+
+    # Tareas en cola o en curso de cada carril
+    def depths(self):
+        return list(self._depths)
+
+    # Carriles calientes y claves más frecuentes [(clave, cuenta)]
+    def hot_lanes(self):
+        return sorted(self._hot)
+
+    def hot_keys(self, n=5):
+        with self._lock:
+            return self._keys.top(n)
+
+    def _run(self, lane):
+        tasks = self._queues[lane]
+        done = LANE_TASKS.labels(self.name, str(lane))
+        while True:
+            future, fn, args, kwargs = tasks.get()
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+            done.inc()
+            with self._lock:
+                self._depths[lane] -= 1
+                if lane in self._hot and self._depths[lane] < self.hot_depth // 2:
+                    self._hot.discard(lane)
@@ -0,0 +1,226 @@
+"""
+RIS en modo prefork: N procesos trabajadores escuchan en el mismo puerto MLLP con
+SO_REUSEPORT y el kernel reparte entre ellos las conexiones entrantes, de modo que el
+parseo con hl7apy de los ADT/OMI usa varios núcleos en lugar de uno (GIL).
+Un supervisor arranca los trabajadores y reinicia los que mueren. El estado que debe
+verse desde todos los procesos vive en una base SQLite local (modo WAL):
+- índice de duplicados por MSH-10 (hl7_dedup.SQLiteDuplicateIndex)
+- registro de órdenes recibidas y de su ORU^R01 (OrderStore)
+- última instantánea de /metrics de cada trabajador, que el supervisor publica unida
+  con la etiqueta worker en su propio /metrics
+Uso: python ris_prefork.py --procesos 4
+"""
+# Importación de librerías estándar
+import argparse  # Parámetros de línea de comandos
+import multiprocessing  # Procesos trabajadores
+import os  # Número de núcleos y PID del supervisor
+import signal  # Parada ordenada del supervisor
+import sqlite3  # Estado compartido entre procesos
+import threading  # Conexión SQLite por hilo
+import time  # Reinicios y volcado de métricas
+from collections import OrderedDict  # Familias de métricas en orden
+from multiprocessing.connection import wait  # Espera a que muera algún trabajador
+import metrics  # /metrics del supervisor
+
+# Configuración por defecto (el puerto y el endpoint de métricas son los del RIS)
+RIS_MLLP_SERVER_PORT = 6662
+METRICS_PORT = 9662
+WORKERS = os.cpu_count() or 1  # Un trabajador por núcleo
+DB_PATH = 'ris_prefork.db'  # Base SQLite compartida
+METRICS_INTERVAL = 1.0  # Segundos entre volcados de métricas de cada trabajador
+RESTART_DELAY = 1.0  # Pausa antes de reiniciar un trabajador que murió al arrancar
+MIN_UPTIME = 5.0  # Segundos de vida por debajo de los cuales un fallo cuenta como "al arrancar"
+
+# Métricas del supervisor
+WORKERS_ALIVE = metrics.gauge('ris_prefork_workers', 'Procesos trabajadores vivos')
+RESTARTS = metrics.counter('ris_prefork_restarts_total', 'Trabajadores reiniciados tras morir')
+
+
+# Conexión SQLite (una por hilo) con WAL y espera si otro proceso tiene el lock
+class _SQLite:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+
+# Registro compartido de órdenes: qué trabajador recibió cada OMI^O23 y el estado de su ORU^R01
+class OrderStore(_SQLite):
+    def __init__(self, path, worker=None):
+        super().__init__(path)
+        self.worker = worker
+        self.conn().execute('CREATE TABLE IF NOT EXISTS orders (order_id TEXT PRIMARY KEY, '
+                            'estudio TEXT, worker INTEGER, received REAL, finished REAL, status TEXT)')
+
+    def received(self, order_id, estudio):
+        self.conn().execute('INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, NULL, ?)',
+                            (order_id, estudio, self.worker, time.time(), 'pending'))
+
+    def done(self, order_id, status):
+        self.conn().execute('UPDATE orders SET finished = ?, status = ? WHERE order_id = ?',
+                            (time.time(), status, order_id))
+
+    # Órdenes por estado ({'pending': n, 'sent': n, 'error': n})
+    def counts(self):
+        return dict(self.conn().execute('SELECT status, COUNT(*) FROM orders GROUP BY status'))
+
+
+# Instantáneas de /metrics de cada trabajador
+class MetricsStore(_SQLite):
+    def __init__(self, path):
+        super().__init__(path)
+        self.conn().execute('CREATE TABLE IF NOT EXISTS worker_metrics (worker INTEGER PRIMARY KEY, '
+                            'pid INTEGER, updated REAL, body TEXT)')
+
+    def save(self, worker, body):
+        self.conn().execute('INSERT OR REPLACE INTO worker_metrics VALUES (?, ?, ?, ?)',
+                            (worker, os.getpid(), time.time(), body))
+
+    def clear(self):
+        self.conn().execute('DELETE FROM worker_metrics')
+
+    def snapshots(self):
+        return self.conn().execute('SELECT worker, body FROM worker_metrics ORDER BY worker').fetchall()
+
+
+# Añade la etiqueta worker a una línea de muestra ('m{a="x"} 1' -> 'm{worker="0",a="x"} 1')
+def _with_worker(line, worker):
+    brace, space = line.find('{'), line.find(' ')
+    if brace != -1 and brace < space:
+        return f'{line[:brace + 1]}worker="{worker}",{line[brace + 1:]}'
+    return f'{line[:space]}{{worker="{worker}"}}{line[space:]}'
+
+
+# Une las instantáneas de los trabajadores: cada familia una sola vez (HELP/TYPE) con las
+# muestras de todos los trabajadores etiquetadas con worker; skip: familias que no se
+# copian (las del propio supervisor, que los trabajadores también registran al importar)
+def merge_metrics(snapshots, skip=()):
+    families = OrderedDict()  # nombre -> ([HELP, TYPE], [muestras])
+    for worker, body in snapshots:
+        family = None
+        for line in body.splitlines():
+            if line.startswith('# '):
+                name = line.split(' ', 3)[2]
+                family = None if name in skip else families.setdefault(name, ([], []))
+                if family is not None and line not in family[0]:
+                    family[0].append(line)
+            elif line and family is not None:
+                family[1].append(_with_worker(line, worker))
+    lines = []
+    for header, samples in families.values():
+        lines.extend(header)
+        lines.extend(samples)
+    return lines
+
+
+# Proceso trabajador: un RIS completo escuchando con SO_REUSEPORT y estado en SQLite
+# El módulo del RIS se importa aquí para que el supervisor no cree sus objetos
+# El MSH-10 de los ORU^R01 lleva el número de trabajador y el PID: cada proceso tiene su
+# propio contador y un trabajador reiniciado vuelve a empezar desde 1
+def worker_main(worker, port, db_path):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C lo gestiona el supervisor
+    import hl7_dedup
+    import ris_simulator as ris
+    ris.duplicados = hl7_dedup.SQLiteDuplicateIndex(db_path, ris.DEDUP_WINDOW)
+    ris.resultados = ris.ResultDispatcher(store=OrderStore(db_path, worker),
+                                          oru_prefix=f'ORU{worker}-{os.getpid():x}-')
+    ris.mllp_server(port, ris.on_ris_message, reuse_port=True)
+    ris.resultados.start()
+    ris.log.info("Trabajador %s (PID %s) escuchando en el puerto %s", worker, os.getpid(), port)
+    store = MetricsStore(db_path)
+    parent = os.getppid()
+    while os.getppid() == parent:  # Si el supervisor desaparece, el trabajador termina
+        store.save(worker, metrics.render())
+        time.sleep(METRICS_INTERVAL)
+
+
+# Supervisor: arranca N trabajadores y reinicia los que mueren
+# Un trabajador que muere a los pocos segundos de arrancar (p. ej. puerto ocupado sin
+# SO_REUSEPORT) se reinicia tras RESTART_DELAY para no entrar en un bucle de arranques
+class Supervisor:
+    def __init__(self, workers=WORKERS, port=RIS_MLLP_SERVER_PORT, db_path=DB_PATH):
+        self.workers = workers
+        self.port = port
+        self.db_path = db_path
+        self.restarts = 0
+        self._ctx = multiprocessing.get_context('spawn')  # Procesos limpios, sin hilos heredados
+        self._procs = {}  # número de trabajador -> (Process, instante de arranque)
+        self._stopping = False
+        self.metrics_store = MetricsStore(db_path)
+        OrderStore(db_path)  # Crea las tablas antes de que arranquen los trabajadores
+        WORKERS_ALIVE.set_function(lambda: sum(p.is_alive() for p, _ in list(self._procs.values())))
+        RESTARTS.set_function(lambda: self.restarts)
+        own = (WORKERS_ALIVE.name, RESTARTS.name)
+        metrics.registry.collector(lambda: merge_metrics(self.metrics_store.snapshots(), own))
+
+    def _spawn(self, worker):
+        proc = self._ctx.Process(target=worker_main, args=(worker, self.port, self.db_path),
+                                 name=f'RIS-{worker}', daemon=True)
+        proc.start()
+        self._procs[worker] = (proc, time.monotonic())
+
+    def start(self):
+        self.metrics_store.clear()
+        for worker in range(self.workers):
+            self._spawn(worker)
+        return self
+
+    # Bucle del supervisor: espera a que muera algún trabajador y lo reinicia
+    def run(self):
+        while not self._stopping:
+            procs = {p.sentinel: (worker, p, started)
+                     for worker, (p, started) in list(self._procs.items())}
+            for sentinel in wait(list(procs), timeout=1.0):
+                if self._stopping:
+                    break
+                worker, proc, started = procs[sentinel]
+                proc.join()
+                print(f"[RIS] Trabajador {worker} (PID {proc.pid}) terminó con código {proc.exitcode}; "
+                      "se reinicia")
+                if time.monotonic() - started < MIN_UPTIME:
+                    time.sleep(RESTART_DELAY)
+                self.restarts += 1
+                self._spawn(worker)
+
+    def stop(self):
+        self._stopping = True
+        for proc, _ in self._procs.values():
+            proc.terminate()
+        for proc, _ in self._procs.values():
+            proc.join(5)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--procesos', type=int, default=WORKERS, metavar='N',
+                        help='Procesos trabajadores (por defecto, uno por núcleo)')
+    parser.add_argument('--port', type=int, default=RIS_MLLP_SERVER_PORT, help='Puerto MLLP del RIS')
+    parser.add_argument('--db', default=DB_PATH, help='Base SQLite con el estado compartido')
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                        help='Puerto de /metrics del supervisor')
+    args = parser.parse_args(argv)
+
+    supervisor = Supervisor(args.procesos, args.port, args.db).start()
+    signal.signal(signal.SIGTERM, lambda *_: supervisor.stop())
+    metrics.serve(args.metrics_port)
+    print(f"[RIS] Supervisor (PID {os.getpid()}): {args.procesos} trabajadores en el puerto "
+          f"{args.port}, estado en {args.db}, métricas en http://localhost:{args.metrics_port}/metrics")
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.stop()
+        print(f"[RIS] Órdenes: {OrderStore(args.db).counts()}")
+
+
+if __name__ == '__main__':
+    main()
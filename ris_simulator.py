@@ -3,13 +3,21 @@ Simulador RIS/PACS para flujo HL7 v2 con HIS usando hl7apy y MLLP.
 Actúa como servidor MLLP (recibe ADT, OMI) y cliente MLLP (envía ACK, ORU).
 """
 # Importación de librerías estándar y de terceros
-import socket  # Para comunicación de red
+import os  # Ritmo configurable por variable de entorno
 import threading  # Para ejecución en hilos
-import time  # Para delays y timestamps
+import time  # Para timestamps
+import itertools  # Para numerar los ORU^R01
+from collections import deque  # Para guardar las últimas latencias
 import random  # Para simular variabilidad si se desea
-import requests  # Para enviar logs al monitor web
-from hl7apy.core import Message  # Para construir mensajes HL7
-from hl7apy.parser import parse_message  # Para parsear mensajes HL7
+import partitioned  # Ejecutor por carriles (orden por paciente)
+import pacing  # Ritmo de los pasos (presentación, rápido, ritmo fijo, replay)
+import sim_log  # Registro por niveles (consola y monitor web) con muestreo
+from hl7_tokens import tokenize  # Tokenizador ER7: campos por desplazamientos, sin árbol de hl7apy
+from mllp import send_mllp_message, ack_code, MLLPServer, DEFAULT_HANDLER_WORKERS  # Cliente y servidor MLLP compartidos
+import hl7_templates  # Plantillas ER7 precompiladas para construir mensajes
+import hl7_dedup  # Índice de duplicados por MSH-10
+import hl7_trace  # Trazas HIS -> RIS -> HIS (segmento ZTR)
+import metrics  # Registro de métricas y endpoint /metrics
 
 # Configuración de puertos y hosts para MLLP
 RIS_MLLP_SERVER_HOST = 'localhost'  # Host local para el servidor RIS
@@ -17,10 +25,13 @@ RIS_MLLP_SERVER_PORT = 6662  # Puerto donde el RIS escucha ADT y OMI
 HIS_MLLP_SERVER_HOST = 'localhost'  # Host local para el HIS
 HIS_MLLP_SERVER_PORT = 6661  # Puerto donde el HIS escucha ACK y ORU
 
-# Caracteres especiales del protocolo MLLP
-MLLP_SB = b'\x0b'  # <VT> - Start Block
-MLLP_EB = b'\x1c'  # <FS> - End Block
-MLLP_CR = b'\x0d'  # <CR> - Carriage Return
+# Límites del servidor MLLP
+MLLP_BACKLOG = 1024  # Conexiones pendientes de aceptar
+MLLP_READ_LIMIT = 16 * 1024 * 1024  # Tamaño máximo de un bloque MLLP por conexión (bytes)
+
+# Endpoint de métricas (formato Prometheus): http://localhost:9662/metrics
+METRICS_PORT = 9662
+PARSE_ERRORS = metrics.counter('hl7_parse_errors_total', 'Mensajes HL7 recibidos que no se pudieron parsear')
 
 # Datos simulados de paciente y médicos
 PACIENTE = {
@@ -34,198 +45,292 @@ PACIENTE = {
 MEDICO_SOLICITANTE = 'Dra. Ana Rodríguez'  # Médico que solicita el estudio
 RADIOLOGO = 'Dr. Carlos López'  # Radiólogo que informa
 
-# Bandera y tiempo de delay para presentación didáctica
-DEMO_DELAY = True  # Si es True, agrega pausas entre pasos
-DEMO_DELAY_SECONDS = 7  # Segundos de pausa
+# Carriles por paciente (partitioned.py): los mensajes entrantes y los ORU^R01 de un
+# mismo paciente se procesan en orden; pacientes distintos, en paralelo
+RIS_LANES = 8  # Carriles para los mensajes entrantes
+# Cada callback espera a su carril, así que un carril de entrada no puede acumular más
+# tareas que callbacks simultáneos del servidor MLLP: el umbral de carril caliente se
+# fija por debajo de ese límite para que pueda alcanzarse
+RIS_HOT_DEPTH = DEFAULT_HANDLER_WORKERS // 2
+RESULT_WORKERS = 4  # Carriles que generan y envían los ORU^R01
+
+# Índice de duplicados (hl7_dedup.py): MSH-10 recordados por emisor durante DEDUP_WINDOW s
+DEDUP_WINDOW = 3600
+DEDUP_MAX_ENTRIES = 1000000
+
+# Ritmo de envío de los ORU^R01 (pacing.py): 'presentacion:7' separa los resultados 7 s
+# para la demo, 'rapido' los envía en cuanto se reciben (pruebas de rendimiento),
+# 'ritmo:N' a N por segundo y 'replay[:V]' con la separación original de las OMI (MSH-7)
+# Nunca se duerme en on_ris_message: el ACK sale en el acto y la espera la hace el hilo de envío
+PACING = os.environ.get('HL7_PACING', pacing.DEFAULT_SPEC)
 
 # Función para enviar mensajes HL7 usando MLLP como cliente
-# host: destino, port: puerto destino, hl7_message: mensaje HL7 en string
-# Devuelve el mensaje HL7 recibido como respuesta (ACK, ORU, etc.)
-def send_mllp_message(host, port, hl7_message):
-    with socket.create_connection((host, port)) as s:
-        mllp_msg = MLLP_SB + hl7_message.encode() + MLLP_EB + MLLP_CR
-        s.sendall(mllp_msg)
-        data = b''
-        while True:
-            chunk = s.recv(4096)
-            if not chunk:
-                break
-            data += chunk
-            if MLLP_EB in chunk:
-                break
-        if data:
-            # Extrae el mensaje HL7 del bloque MLLP
-            hl7 = data.split(MLLP_SB)[-1].split(MLLP_EB)[0].decode(errors='ignore')
-            return hl7
-        return None
+# Se reutiliza el cliente de mllp.py: conexiones persistentes por (host, puerto),
+# reconexión automática y correlación del ACK por MSH-10.
+# send_mllp_message(host, port, hl7_message) devuelve la respuesta (ACK, ORU, etc.)
 
 # Función para levantar un servidor MLLP que recibe mensajes HL7
 # port: puerto a escuchar, on_message: función callback para procesar cada mensaje recibido
-def mllp_server(port, on_message):
-    def server():
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            s.bind(('localhost', port))
-            s.listen(1)
-            print(f"[RIS] Servidor MLLP escuchando en puerto {port}")
-            while True:
-                conn, addr = s.accept()
-                with conn:
-                    data = b''
-                    while True:
-                        chunk = conn.recv(4096)
-                        if not chunk:
-                            break
-                        data += chunk
-                        if MLLP_EB in chunk:
-                            break
-                    if data:
-                        # Extrae el mensaje HL7 y lo pasa al callback
-                        hl7 = data.split(MLLP_SB)[-1].split(MLLP_EB)[0].decode(errors='ignore')
-                        on_message(hl7, conn)
-    threading.Thread(target=server, daemon=True).start()
+# El servidor asyncio de mllp.py atiende muchas conexiones persistentes a la vez y
+# ejecuta on_message(hl7, conn) en un pool de hilos; conn.sendall() envía la respuesta.
+# reuse_port: varios procesos en el mismo puerto (modo prefork, ris_prefork.py)
+def mllp_server(port, on_message, reuse_port=False):
+    server = MLLPServer('localhost', port, on_message, backlog=MLLP_BACKLOG,
+                        read_limit=MLLP_READ_LIMIT, name='RIS', reuse_port=reuse_port).start()
+    log.info("Servidor MLLP escuchando en puerto %s", port)
+    return server
 
 # Creación de mensajes HL7
 
+# Los mensajes se generan con las plantillas precompiladas de hl7_templates.py, que
+# producen el mismo ER7 que hl7apy (Message(...).to_er7()) sin construir el árbol de objetos.
+
+# Fábrica de ACK con el MSH precalculado (RIS/RAD -> HIS/HOSP); frame() da los bytes MLLP
+ACKS = hl7_templates.ack_factory('RIS', 'RAD', 'HIS', 'HOSP')
+
 # Función para construir un mensaje ACK para respuestas a mensajes ADT^A04 y OMI^O23
 # msg_ctrl_id: ID de control del mensaje original, ack_code: código de reconocimiento (AA, AE, etc.)
 # Devuelve el mensaje ACK en formato ER7
 def build_ack(msg_ctrl_id, ack_code='AA'):
-    msg = Message("ACK", version="2.5")
-    msg.msh.msh_3 = 'RIS'
-    msg.msh.msh_4 = 'RAD'
-    msg.msh.msh_5 = 'HIS'
-    msg.msh.msh_6 = 'HOSP'
-    msg.msh.msh_7 = time.strftime('%Y%m%d%H%M%S')
-    msg.msh.msh_9 = 'ACK'
-    msg.msh.msh_10 = f"ACK{msg_ctrl_id}"
-    msg.msh.msh_11 = 'P'
-    msg.msh.msh_12 = '2.5'
-    msg.msa.msa_1 = ack_code
-    msg.msa.msa_2 = msg_ctrl_id
-    return msg.to_er7()
+    return ACKS.er7(msg_ctrl_id, ack_code)
 
 # Función para construir un mensaje ORU^R01 con los resultados de estudios
 # msg_ctrl_id: ID de control del mensaje, order_id: ID de la orden, estudio: tipo de estudio (TAC, RX, etc.)
 # obr4: código y descripción del procedimiento, obx5: resultados en texto
 # Devuelve el mensaje ORU^R01 en formato ER7
 def build_oru_r01(msg_ctrl_id, order_id, estudio, obr4, obx5):
-    # Construye un mensaje ORU^R01 usando la estructura de grupos estándar HL7 v2.5
-    try:
-        msg = Message("ORU_R01", version="2.5")
-        msg.msh.msh_3 = 'RIS'
-        msg.msh.msh_4 = 'RAD'
-        msg.msh.msh_5 = 'HIS'
-        msg.msh.msh_6 = 'HOSP'
-        msg.msh.msh_7 = time.strftime('%Y%m%d%H%M%S')
-        msg.msh.msh_9 = 'ORU^R01'
-        msg.msh.msh_10 = msg_ctrl_id
-        msg.msh.msh_11 = 'P'
-        msg.msh.msh_12 = '2.5'
-        # Grupos: PATIENT_RESULT -> PATIENT (PID) y ORDER_OBSERVATION (ORC, OBR, OBX)
-        pr = msg.add_group('PATIENT_RESULT')
-        pat = pr.add_group('PATIENT')
-        pat.pid.pid_3 = PACIENTE['id']
-        pat.pid.pid_5 = f"{PACIENTE['apellido']}^{PACIENTE['nombre']}"
-        pat.pid.pid_7 = PACIENTE['fecha_nac']
-        pat.pid.pid_8 = PACIENTE['sexo']
-        oo = pr.add_group('ORDER_OBSERVATION')
-        oo.orc.orc_2 = order_id
-        oo.orc.orc_12 = RADIOLOGO
-        oo.obr.obr_2 = order_id
-        oo.obr.obr_4 = obr4
-        oo.obr.obr_16 = RADIOLOGO
-        oo.obr.obr_13 = PACIENTE['motivo']
-        obx = oo.add_segment('OBX')
-        obx.obx_1 = '1'
-        obx.obx_2 = 'TX'
-        obx.obx_3 = estudio
-        obx.obx_5 = obx5
-        return msg.to_er7()
-    except Exception as e:
-        print(f"[RIS] Error construyendo ORU^R01: {e}")
-        return ''
+    return hl7_templates.ORU_R01.render({
+        'msh_3': 'RIS', 'msh_4': 'RAD', 'msh_5': 'HIS', 'msh_6': 'HOSP',
+        'msh_10': msg_ctrl_id,
+        'pid_3': PACIENTE['id'],
+        'pid_5': f"{PACIENTE['apellido']}^{PACIENTE['nombre']}",
+        'pid_7': PACIENTE['fecha_nac'],
+        'pid_8': PACIENTE['sexo'],
+        'orc_2': order_id,
+        'orc_12': RADIOLOGO,
+        'obr_2': order_id,
+        'obr_4': obr4,
+        'obr_13': PACIENTE['motivo'],
+        'obr_16': RADIOLOGO,
+        'obx_3': estudio,
+        'obx_5': obx5,
+    })
 
 # Manejo de mensajes recibidos por el RIS
-ordenes = []  # Lista para almacenar órdenes recibidas
 def on_ris_message(hl7, conn):
-    print(f"\n[RIS] Recibido mensaje HL7:\n{hl7}\n")
-    web_log(f"Recibido mensaje HL7:\n{hl7}")
-    msg = parse_message(hl7, find_groups=False)
-    msh9 = msg.msh.msh_9.value
-    msg_ctrl_id = msg.msh.msh_10.value
-    if msh9.startswith('ADT^A04'):
-        print("[RIS] Paciente registrado en RIS.")
-        web_log("Paciente registrado en RIS.")
-        ack = build_ack(msg_ctrl_id, 'AA')
-        mllp_msg = MLLP_SB + ack.encode() + MLLP_EB + MLLP_CR
-        conn.sendall(mllp_msg)
-        print("[RIS] ACK enviado por ADT^A04\n")
-        web_log("ACK enviado por ADT^A04")
-        if DEMO_DELAY:
-            time.sleep(DEMO_DELAY_SECONDS)
-    elif msh9.startswith('OMI^O23'):
-        print(f"[RIS] Nueva orden recibida: {msg.orc.orc_2.value} - {msg.obr.obr_4.value}")
-        web_log(f"Nueva orden recibida: {msg.orc.orc_2.value} - {msg.obr.obr_4.value}")
-        ordenes.append({
-            'order_id': msg.orc.orc_2.value,
-            'estudio': msg.obr.obr_4.value
-        })
-        ack = build_ack(msg_ctrl_id, 'AA')
-        mllp_msg = MLLP_SB + ack.encode() + MLLP_EB + MLLP_CR
-        conn.sendall(mllp_msg)
-        print("[RIS] ACK enviado por OMI^O23\n")
-        web_log("ACK enviado por OMI^O23")
-        if DEMO_DELAY:
-            time.sleep(DEMO_DELAY_SECONDS)
-    else:
-        print(f"[RIS] Mensaje no esperado: {msh9}")
-
-# Envío de resultados ORU^R01
+    sampled = log.begin_message()
+    log.debug("Recibido mensaje HL7:\n%s", hl7)
+    # Se tokeniza el mensaje una vez; los campos se leen por ruta ('ORC.2') sin hl7apy
+    try:
+        msg = tokenize(hl7)
+    except ValueError as e:
+        PARSE_ERRORS.inc()
+        log.error("Error al parsear mensaje HL7: %s", e)
+        return
+    msh9 = msg.msh_9
+    msg_ctrl_id = msg.control_id
+    # Reintentos y reproducciones repiten el MSH-10: se responde con el ACK guardado sin
+    # volver a procesar (ni a generar otro ORU^R01)
+    key = hl7_dedup.message_key(f'{msg.sending_app}^{msg.sending_facility}', msg_ctrl_id)
+    code = duplicados.claim(key)
+    if code is not None:
+        code = code or 'AA'  # El original aún se está procesando y se confirmará con AA
+        conn.sendall(ACKS.frame(msg_ctrl_id, code))
+        log.info("Duplicado %s (%s): ACK %s reenviado sin procesar", msg_ctrl_id, msh9, code)
+        return
+    # Los mensajes de un mismo paciente (PID-3) pasan por el mismo carril y se procesan en
+    # orden aunque lleguen por conexiones distintas (el ADT^A04 antes que su OMI^O23);
+    # se espera al carril para que los ACK de una conexión salgan en orden
+    paciente = msg['PID.3.1'] or msg_ctrl_id
+    carriles.submit(paciente, procesar_mensaje, msg, conn, key, paciente, sampled).result()
 
-# Función que envía los resultados de los estudios al HIS en mensajes ORU^R01
-def enviar_resultados():
-    procesadas = set()  # Conjunto para llevar registro de órdenes ya procesadas
-    while True:
-        for i, orden in enumerate(ordenes):
-            if orden['order_id'] in procesadas:
-                continue
-            if 'CT' in orden['estudio']:
-                obx5 = 'Tomografía de tórax: sin hallazgos patológicos.'
-                obr4 = '71250^CT TORAX SIN CONTRASTE^CPT4'
-                estudio = 'TOMOGRAFIA TORAX'
-            else:
-                obx5 = 'Radiografía de tórax: sin infiltrados ni consolidaciones.'
-                obr4 = '71020^RADIOGRAFIA TORAX^CPT4'
-                estudio = 'RADIOGRAFIA TORAX'
-            oru_id = f'ORU{i+1:04d}'
-            oru_msg = build_oru_r01(oru_id, orden['order_id'], estudio, obr4, obx5)
-            print(f"[RIS] Enviando ORU^R01 al HIS (orden {orden['order_id']}):\n{oru_msg}\n")
-            web_log(f"Enviando ORU^R01 al HIS (orden {orden['order_id']}):\n{oru_msg}")
-            ack = send_mllp_message(HIS_MLLP_SERVER_HOST, HIS_MLLP_SERVER_PORT, oru_msg)
-            print(f"[RIS] ACK recibido por ORU^R01:\n{ack}\n")
-            web_log(f"ACK recibido por ORU^R01:\n{ack}")
-            procesadas.add(orden['order_id'])
-            if DEMO_DELAY:
-                time.sleep(DEMO_DELAY_SECONDS)
-        time.sleep(2)  # Espera antes de revisar si hay nuevas órdenes
-
-# Envío de logs al monitor web
-
-# Función para enviar mensajes de log al monitor web
-# msg: mensaje a enviar, source: fuente del mensaje (por defecto 'RIS')
-def web_log(msg, source='RIS'):
+# Procesa un mensaje ya comprobado (no duplicado) en el carril de su paciente y envía el ACK
+# key: clave del índice de duplicados, sampled: decisión de muestreo del log del mensaje
+def procesar_mensaje(msg, conn, key, paciente, sampled):
+    log.begin_message(sampled)
+    msh9 = msg.msh_9
+    msg_ctrl_id = msg.control_id
     try:
-        requests.post('http://localhost:5000/log', json={'source': source, 'msg': msg})
+        if msh9.startswith('ADT^A04'):
+            log.info("Paciente registrado en RIS.")
+            conn.sendall(ACKS.frame(msg_ctrl_id, 'AA'))
+            log.info("ACK enviado por ADT^A04")
+        elif msh9.startswith('OMI^O23'):
+            order_id = msg['ORC.2']
+            estudio = msg['OBR.4']
+            log.info("Nueva orden recibida: %s - %s", order_id, estudio)
+            # La traza del HIS (ZTR) acompaña a la orden hasta el ORU^R01
+            trace_id, stamps = hl7_trace.read_trace(msg)
+            stamps['ris_recv'] = hl7_trace.now_us()
+            # Primero el ACK y después la orden al despachador: el HIS nunca recibe el
+            # ORU^R01 de una orden que aún no tiene confirmada
+            conn.sendall(ACKS.frame(msg_ctrl_id, 'AA'))
+            log.info("ACK enviado por OMI^O23")
+            resultados.submit({
+                'order_id': order_id,
+                'estudio': estudio,
+                'paciente': paciente,  # Carril del envío del ORU^R01 (orden por paciente)
+                'trace_id': trace_id or order_id,
+                'stamps': stamps,
+                'log': sampled,  # El ORU^R01 se registra (o no) igual que su OMI^O23
+            }, pacing.hl7_time(msg.msh_field(7)))
+        elif msg.message_type == 'ADT':
+            # Resto de eventos ADT (p. ej. ADT^A01 del alimentador adt_feeder.py): solo ACK
+            conn.sendall(ACKS.frame(msg_ctrl_id, 'AA'))
+            log.info("ACK enviado por %s", msh9)
+        else:
+            log.warning("Mensaje no esperado: %s", msh9)
+            duplicados.forget(key)
+            return
     except Exception:
-        pass
+        duplicados.forget(key)  # Sin ACK: un reintento debe procesarse de nuevo
+        raise
+    duplicados.complete(key, 'AA')
+
+# Envío de resultados ORU^R01
+
+# Función que envía el resultado de una orden al HIS en un mensaje ORU^R01
+# orden: dict con 'order_id' y 'estudio' (OBR-4 de la OMI^O23), oru_id: MSH-10 del ORU
+# Si la orden trae marcas de traza ('trace_id', 'stamps') se añaden oru_build y oru_send
+# y viajan al HIS en el ZTR del ORU; los tramos del RIS se registran en hl7_trace.recorder
+# Devuelve el ACK del HIS (None si cerró la conexión sin responder)
+def enviar_resultado(orden, oru_id):
+    stamps = orden.get('stamps', {})
+    stamps['oru_build'] = hl7_trace.now_us()
+    if 'CT' in orden['estudio']:
+        obx5 = 'Tomografía de tórax: sin hallazgos patológicos.'
+        obr4 = '71250^CT TORAX SIN CONTRASTE^CPT4'
+        estudio = 'TOMOGRAFIA TORAX'
+    else:
+        obx5 = 'Radiografía de tórax: sin infiltrados ni consolidaciones.'
+        obr4 = '71020^RADIOGRAFIA TORAX^CPT4'
+        estudio = 'RADIOGRAFIA TORAX'
+    oru_msg = build_oru_r01(oru_id, orden['order_id'], estudio, obr4, obx5)
+    stamps['oru_send'] = hl7_trace.now_us()
+    oru_msg = hl7_trace.with_trace(oru_msg, orden.get('trace_id', orden['order_id']), stamps)
+    hl7_trace.recorder.record(stamps)
+    log.debug("Enviando ORU^R01 al HIS (orden %s):\n%s", orden['order_id'], oru_msg)
+    ack = send_mllp_message(HIS_MLLP_SERVER_HOST, HIS_MLLP_SERVER_PORT, oru_msg)
+    log.debug("ACK recibido por ORU^R01:\n%s", ack)
+    return ack
+
+# Despachador de resultados: on_ris_message encola cada OMI^O23 y, cuando el pacer lo
+# indica, un hilo la pasa al carril de su paciente, que genera y envía su ORU^R01; así los
+# ORU^R01 de un paciente salen en orden y los de pacientes distintos en paralelo.
+# depth: órdenes en espera; stats(): procesadas, errores y latencia (recepción -> ACK del ORU)
+# store: registro compartido de órdenes (ris_prefork.OrderStore) con received()/done()
+# oru_prefix: prefijo del MSH-10 de los ORU^R01; los trabajadores prefork usan uno propio
+# para que dos procesos no envíen al HIS el mismo MSH-10
+class ResultDispatcher:
+    def __init__(self, workers=RESULT_WORKERS, history=1000, pacer=None, store=None, oru_prefix='ORU'):
+        self.workers = workers
+        self.oru_prefix = oru_prefix
+        self.pacer = pacer or pacing.from_spec(PACING)
+        self.store = store
+        self.queue = pacing.DelayQueue()
+        self.procesadas = 0
+        self.errores = 0
+        self.latencias = deque(maxlen=history)  # (order_id, segundos) de las últimas órdenes
+        self._oru_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._started = False
+        self.carriles = None  # Ejecutor por paciente, creado en start()
+
+    # Arranca el hilo que saca las órdenes a su hora y los carriles de envío (una sola vez)
+    def start(self):
+        with self._lock:
+            if self._started:
+                return self
+            self._started = True
+        self.carriles = partitioned.PartitionedExecutor(self.workers, 'ris-resultados', on_hot=carril_caliente)
+        threading.Thread(target=self._scheduler, name="RIS-resultados", daemon=True).start()
+        return self
+
+    # Encola una orden recibida para enviar su resultado en el instante que fije el pacer
+    # event_time: hora original de la orden (MSH-7 en segundos), usada por el modo replay
+    # No bloquea: se llama desde on_ris_message
+    def submit(self, orden, event_time=None):
+        orden['recibida'] = time.monotonic()
+        if self.store is not None:
+            self.store.received(orden['order_id'], orden['estudio'])
+        self.queue.put(orden, self.pacer.due(event_time))
+
+    # Órdenes esperando su instante de envío o en los carriles
+    @property
+    def depth(self):
+        return self.queue.qsize() + (sum(self.carriles.depths()) if self.carriles else 0)
+
+    # Resumen de la cola y de la latencia por orden
+    def stats(self):
+        with self._lock:
+            valores = [lat for _, lat in self.latencias]
+            procesadas, errores = self.procesadas, self.errores
+        return {
+            'pendientes': self.depth,
+            'procesadas': procesadas,
+            'errores': errores,
+            'latencia_media': sum(valores) / len(valores) if valores else 0.0,
+            'latencia_max': max(valores, default=0.0),
+        }
+
+    # Saca cada orden de la cola cuando vence y la pasa al carril de su paciente
+    def _scheduler(self):
+        while True:
+            orden = self.queue.get()
+            self.carriles.submit(orden.get('paciente', orden['order_id']), self._send, orden)
+
+    def _send(self, orden):
+        log.begin_message(orden.get('log'))
+        try:
+            ack = enviar_resultado(orden, f'{self.oru_prefix}{next(self._oru_ids):04d}')
+            code = ack_code(ack) if ack else None
+            if code not in ('AA', 'CA'):  # Rechazo (AE/AR...) o sin ACK: cuenta como error
+                raise ValueError(f"ACK {code or 'ausente'} del HIS")
+            latencia = time.monotonic() - orden['recibida']
+            with self._lock:
+                self.procesadas += 1
+                self.latencias.append((orden['order_id'], latencia))
+            if self.store is not None:
+                self.store.done(orden['order_id'], 'sent')
+        except Exception as e:
+            with self._lock:
+                self.errores += 1
+            log.error("Error enviando resultado de la orden %s: %s", orden['order_id'], e)
+            if self.store is not None:
+                self.store.done(orden['order_id'], 'error')
+
+# Aviso de partición caliente: un paciente (o unos pocos) acapara un carril
+def carril_caliente(lane, depth, top):
+    log.warning("Carril %s caliente: %s tareas en cola; pacientes más frecuentes: %s", lane, depth, top)
+
+carriles = partitioned.PartitionedExecutor(RIS_LANES, 'ris', hot_depth=RIS_HOT_DEPTH,
+                                           on_hot=carril_caliente)  # Mensajes entrantes
+resultados = ResultDispatcher()  # Órdenes pendientes de enviar su ORU^R01
+duplicados = hl7_dedup.DuplicateIndex(DEDUP_WINDOW, max_entries=DEDUP_MAX_ENTRIES)  # MSH-10 ya procesados
+RESULT_QUEUE = metrics.gauge('ris_result_queue_depth', 'Órdenes esperando el envío de su ORU^R01')
+RESULT_QUEUE.set_function(lambda: resultados.depth)
+RESULTS = metrics.counter('ris_results_total', 'Órdenes cuyo ORU^R01 se envió o falló', ('result',))
+RESULTS.labels('sent').set_function(lambda: resultados.procesadas)
+RESULTS.labels('error').set_function(lambda: resultados.errores)
+
+# Registro del RIS: consola y monitor web (los cuerpos HL7 van en DEBUG)
+# HL7_LOG_LEVEL / HL7_WEB_LOG_LEVEL / HL7_LOG_SAMPLE ajustan niveles y muestreo
+log = sim_log.SimLogger('RIS')
 
 # MAIN
 if __name__ == "__main__":
     # Inicia el servidor MLLP para recibir mensajes RIS en el puerto configurado
     mllp_server(RIS_MLLP_SERVER_PORT, on_ris_message)
-    print("[RIS] Esperando mensajes del HIS... (Ctrl+C para salir)")
-    # Hilo para enviar resultados después de recibir órdenes
-    threading.Thread(target=enviar_resultados, daemon=True).start()
-    while True:
-        time.sleep(DEMO_DELAY_SECONDS)
+    metrics.serve(METRICS_PORT)
+    log.info("Métricas en http://localhost:%s/metrics", METRICS_PORT)
+    log.info("Ritmo de resultados: %s", resultados.pacer)
+    log.info("Esperando mensajes del HIS... (Ctrl+C para salir)")
+    # Hilos que envían el resultado de cada orden en cuanto se recibe
+    resultados.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n[RIS] Latencia por tramo:")
+        for linea in hl7_trace.recorder.summary():
+            print(f"[RIS]   {linea}")
@@ -0,0 +1,125 @@
+"""
+Registro por niveles para los simuladores HIS y RIS.
+Cada simulador tiene dos destinos, consola y monitor web (web_log_shipper), cada uno con
+su nivel. Los cuerpos de mensaje se registran en DEBUG y los eventos en INFO; los
+argumentos se pasan sin formatear (estilo %s) y solo se formatean si algún destino
+acepta ese nivel. Con muestreo (sample_every = N) solo uno de cada N mensajes recibidos
+registra sus líneas DEBUG/INFO; WARNING y ERROR se registran siempre.
+Los niveles se pueden fijar con variables de entorno (p. ej. HL7_LOG_LEVEL=WARNING para
+carga) o con configure().
+"""
+# Importación de librerías estándar
+import itertools  # Contador del muestreo
+import logging  # Niveles, handlers y formateo diferido
+import os  # Configuración por variables de entorno
+import sys  # Salida por consola
+import threading  # Decisión de muestreo por hilo (un mensaje por hilo a la vez)
+from web_log_shipper import shipper as log_shipper  # Envío de logs al monitor en segundo plano
+
+DEBUG = logging.DEBUG  # Cuerpos de mensajes HL7
+INFO = logging.INFO  # Eventos (orden recibida, ACK enviado...)
+WARNING = logging.WARNING  # Situaciones anómalas (ACK distinto de AA...)
+ERROR = logging.ERROR  # Errores (parseo, envío)
+OFF = logging.CRITICAL + 10  # Destino desactivado
+
+# Configuración por defecto (variables de entorno)
+CONSOLE_LEVEL = os.environ.get('HL7_LOG_LEVEL', 'DEBUG')  # Nivel de la consola
+WEB_LEVEL = os.environ.get('HL7_WEB_LOG_LEVEL', 'DEBUG')  # Nivel del monitor web
+SAMPLE_EVERY = int(os.environ.get('HL7_LOG_SAMPLE', '1'))  # Registrar 1 de cada N mensajes
+
+_local = threading.local()  # _local.sampled: si el mensaje en curso del hilo se registra
+
+
+# Convierte 'INFO', 'off', 20... en un nivel numérico
+def parse_level(level):
+    if isinstance(level, int):
+        return level
+    name = str(level).strip().upper()
+    if name == 'OFF':
+        return OFF
+    if name.isdigit():
+        return int(name)
+    value = logging.getLevelName(name)
+    if not isinstance(value, int):
+        raise ValueError(f"Nivel de log desconocido: {level}")
+    return value
+
+
+# Destino que envía cada registro al monitor web a través de web_log_shipper
+class WebLogHandler(logging.Handler):
+    def __init__(self, source, level=DEBUG, shipper=log_shipper):
+        super().__init__(level)
+        self.source = source
+        self.shipper = shipper
+
+    def emit(self, record):
+        try:
+            self.shipper.log(self.format(record), self.source)
+        except Exception:
+            self.handleError(record)
+
+
+# Registro de un simulador (source: 'HIS' o 'RIS')
+# begin_message() decide al empezar cada mensaje si se muestrea; debug()/info() no hacen
+# nada (ni formatean) si el mensaje no se muestrea o ningún destino acepta el nivel.
+# enabled(nivel) permite saltarse también el cálculo de argumentos costosos.
+class SimLogger:
+    def __init__(self, source, console_level=CONSOLE_LEVEL, web_level=WEB_LEVEL,
+                 sample_every=SAMPLE_EVERY, stream=None, shipper=log_shipper):
+        self.source = source
+        self.logger = logging.getLogger(f'hl7sim.{source}')
+        self.logger.propagate = False
+        self._shipper = shipper
+        self._counter = itertools.count()
+        self.sample_every = 1
+        self.configure(console_level, web_level, sample_every, stream)
+
+    # Cambia los niveles de consola/web y el muestreo (None deja el valor actual)
+    def configure(self, console_level=None, web_level=None, sample_every=None, stream=None):
+        console_level = parse_level(console_level if console_level is not None
+                                    else getattr(self, 'console_level', CONSOLE_LEVEL))
+        web_level = parse_level(web_level if web_level is not None
+                                else getattr(self, 'web_level', WEB_LEVEL))
+        if sample_every is not None:
+            self.sample_every = max(int(sample_every), 1)
+        self.console_level, self.web_level = console_level, web_level
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+        console = logging.StreamHandler(stream or sys.stdout)
+        console.setLevel(console_level)
+        console.setFormatter(logging.Formatter(f'[{self.source}] %(message)s'))
+        web = WebLogHandler(self.source, web_level, self._shipper)
+        web.setFormatter(logging.Formatter('%(message)s'))
+        self.logger.addHandler(console)
+        self.logger.addHandler(web)
+        self.logger.setLevel(min(console_level, web_level))
+
+    # Marca el inicio de un mensaje en este hilo; devuelve True si se registrará
+    # sampled: decisión ya tomada para ese mensaje (p. ej. al seguir una orden en otro hilo)
+    def begin_message(self, sampled=None):
+        if sampled is None:
+            sampled = self.sample_every == 1 or next(self._counter) % self.sample_every == 0
+        _local.sampled = sampled
+        return sampled
+
+    # True si una línea de ese nivel se registraría ahora en algún destino
+    def enabled(self, level):
+        if level < WARNING and not getattr(_local, 'sampled', True):
+            return False
+        return self.logger.isEnabledFor(level)
+
+    def debug(self, msg, *args):
+        if self.enabled(DEBUG):
+            self.logger.debug(msg, *args)
+
+    def info(self, msg, *args):
+        if self.enabled(INFO):
+            self.logger.info(msg, *args)
+
+    def warning(self, msg, *args):
+        if self.enabled(WARNING):
+            self.logger.warning(msg, *args)
+
+    def error(self, msg, *args):
+        if self.enabled(ERROR):
+            self.logger.error(msg, *args)
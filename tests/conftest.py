@@ -0,0 +1,7 @@
+"""
+Configuración de pytest: los módulos del proyecto están en la raíz del repositorio.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -0,0 +1,56 @@
+"""
+Pruebas del alimentador de ADT (adt_feeder.py) contra una base SQLite local.
+"""
+import socket
+
+import adt_db
+import adt_feeder
+import mllp
+
+
+# Puerto local sin nadie escuchando (se reserva y se libera)
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+def _feeder(tmp_path, n=10):
+    conn = adt_db.connect_sqlite(str(tmp_path / 'adt.db'))
+    adt_db.populate_sqlite(conn, n)
+    pool = mllp.MLLPConnectionPool(timeout=1.0)
+    return conn, adt_feeder.ADTFeeder(conn, 'localhost', _free_port(), poll_interval=0.01, pool=pool)
+
+
+def test_ris_caido_no_detiene_el_alimentador(tmp_path):
+    conn, feeder = _feeder(tmp_path)
+    assert feeder.poll_once() == 10
+    assert feeder.failed == 1
+    assert feeder.sent == 0
+    assert feeder.high_water == 0  # La marca de agua se queda antes de la fila fallida
+    flags = {flag for flag, in conn.execute('SELECT MESSAGE_SENT_FLAG FROM ADT_MESSAGES')}
+    assert flags == {adt_feeder.FLAG_PENDING}
+
+
+def test_run_reintenta_tras_el_intervalo(tmp_path):
+    conn, feeder = _feeder(tmp_path)
+    feeder.run(once=True)  # No lanza la excepción de conexión rechazada
+    feeder.run(once=True)
+    assert feeder.failed == 2
+    assert feeder.high_water == 0
+
+
+def test_ack_que_no_llega_se_abandona(tmp_path):
+    port = _free_port()
+    server = mllp.MLLPServer('localhost', port, lambda hl7, conn: None, name='MUDO').start()
+    try:
+        conn = adt_db.connect_sqlite(str(tmp_path / 'adt.db'))
+        adt_db.populate_sqlite(conn, 3)
+        pool = mllp.MLLPConnectionPool(timeout=0.3)
+        feeder = adt_feeder.ADTFeeder(conn, 'localhost', port, pool=pool)
+        assert feeder.poll_once() == 3
+        assert feeder.failed == 3
+        assert feeder.high_water == 0
+        assert sum(c.in_flight for c in pool._clients[('localhost', port)]) == 0
+    finally:
+        server.stop()
@@ -0,0 +1,13 @@
+"""
+Pruebas del índice de duplicados (hl7_dedup.py).
+"""
+import hl7_dedup
+
+
+def test_gauge_cuenta_el_indice_sqlite(tmp_path):
+    memoria = hl7_dedup.DuplicateIndex()
+    memoria.claim(hl7_dedup.message_key('HIS', 'M0'))
+    indice = hl7_dedup.SQLiteDuplicateIndex(str(tmp_path / 'dedup.db'))
+    for n in range(3):
+        assert indice.claim(hl7_dedup.message_key('HIS', f'M{n}')) is None
+    assert indice.size_gauge.labels().get() == 3
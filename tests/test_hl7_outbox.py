@@ -0,0 +1,94 @@
+"""
+Pruebas del diario de la cola de salida (hl7_outbox.py).
+"""
+import errno
+import os
+
+import pytest
+
+import hl7_outbox
+
+MSG = 'MSH|^~\\&|HIS|HOSP|RIS|RAD|20250101120000||ADT^A04|{}|P|2.5\rPID|||123456'
+
+
+# Fichero que acepta como mucho n bytes por write() o falla con el error indicado
+class FakeFile:
+    def __init__(self, real, chunk=3, error=None):
+        self.real = real
+        self.chunk = chunk
+        self.error = error
+
+    def write(self, data):
+        if self.error is not None:
+            raise self.error
+        return self.real.write(bytes(data[:self.chunk]))
+
+    def fileno(self):
+        return self.real.fileno()
+
+    def close(self):
+        self.real.close()
+
+
+def _outbox(tmp_path):
+    # Puerto sin servidor: el emisor reintenta, pero el diario se escribe igual
+    return hl7_outbox.Outbox(str(tmp_path), 'localhost', 1, retry_interval=60)
+
+
+def test_escrituras_parciales_se_completan(tmp_path):
+    outbox = _outbox(tmp_path)
+    outbox._file = FakeFile(outbox._file)
+    outbox.start()
+    for i in range(3):
+        outbox.put(MSG.format(f'M{i}'))
+    outbox.close()
+    records, good = hl7_outbox.read_segment(outbox._path(outbox._segment))
+    assert [payload.decode() for _, payload in records] == [MSG.format(f'M{i}') for i in range(3)]
+    assert good == os.path.getsize(outbox._path(outbox._segment))
+
+
+def test_disco_lleno_falla_los_pendientes_y_cierra_la_cola(tmp_path):
+    outbox = _outbox(tmp_path)
+    error = OSError(errno.ENOSPC, 'No space left on device')
+    outbox._file = FakeFile(outbox._file, error=error)
+    outbox.start()
+    with pytest.raises(OSError) as info:
+        outbox.put(MSG.format('M1'))
+    assert info.value is error
+    with pytest.raises(OSError):
+        outbox.put(MSG.format('M2'))
+    with pytest.raises(OSError):
+        outbox.flush()
+    assert outbox.pending == 0
+    outbox.close()
+
+
+def test_ack_perdido_se_reintenta_tras_el_plazo(tmp_path):
+    import socket
+    import mllp
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        port = s.getsockname()[1]
+    vistos = []
+
+    # Servidor que pierde el primer ACK de M1 y confirma todo lo demás
+    def on_message(hl7, conn):
+        ctrl_id = mllp.control_id(hl7)
+        vistos.append(ctrl_id)
+        if ctrl_id == 'M1' and vistos.count('M1') == 1:
+            return
+        conn.sendall(mllp.frame(f'MSH|^~\\&|RIS|RAD|HIS|HOSP|20250101120000||ACK|A{ctrl_id}|P|2.5\r'
+                                f'MSA|AA|{ctrl_id}'))
+
+    server = mllp.MLLPServer('localhost', port, on_message, name='PIERDE-ACK').start()
+    outbox = hl7_outbox.Outbox(str(tmp_path), 'localhost', port, window=2,
+                               retry_interval=0.05, ack_timeout=0.3).start()
+    try:
+        futures = [outbox.put(MSG.format(f'M{i}')) for i in range(1, 5)]
+        for future in futures:
+            assert mllp.ack_code(future.result(5)) == 'AA'
+        assert vistos.count('M1') == 2
+        assert outbox.pending == 0
+    finally:
+        outbox.close()
+        server.stop()
@@ -0,0 +1,29 @@
+"""
+Pruebas de paridad entre las plantillas ER7 (hl7_templates.py) y hl7apy.
+"""
+import adt_db
+import adt_pipeline
+import hl7_templates
+
+
+# Filas de ADT_MESSAGES como dicts {columna: valor}
+def _rows(conn):
+    cursor = conn.execute('SELECT * FROM ADT_MESSAGES')
+    columns = [d[0] for d in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor]
+
+
+def test_adt_a01_con_msh_7_nulo_igual_que_hl7apy(tmp_path):
+    conn = adt_db.connect_sqlite(str(tmp_path / 'adt.db'))
+    adt_db.populate_sqlite(conn, 3)
+    conn.execute('UPDATE ADT_MESSAGES SET MSH_DATETIME_OF_MESSAGE = NULL')
+    for row in _rows(conn):
+        fields = adt_pipeline.row_fields(row)
+        er7 = hl7_templates.ADT_A01.render(fields)
+        assert er7 == adt_pipeline.build_adt_a01(fields).to_er7()
+        assert er7.split('\r')[0].split('|')[6] == ''  # MSH-7 sigue vacío
+
+
+def test_plantillas_de_simulador_rellenan_msh_7():
+    er7 = hl7_templates.render('ACK', {'msa_1': 'AA', 'msa_2': 'MSG0001'})
+    assert len(er7.split('|')[6]) == 14
@@ -0,0 +1,56 @@
+"""
+Pruebas del pool de conexiones MLLP (mllp.py).
+"""
+import threading
+import time
+
+import mllp
+
+
+# Cliente falso: conectar con 'lento' tarda hasta que se libera el evento
+class FakeClient:
+    liberar = threading.Event()
+
+    def __init__(self, host, port, timeout=None):
+        if host == 'lento':
+            FakeClient.liberar.wait(5)
+        self.host = host
+        self.closed = False
+        self.in_flight = 0
+
+    def close(self):
+        self.closed = True
+
+
+def test_par_lento_no_bloquea_el_pool(monkeypatch):
+    monkeypatch.setattr(mllp, 'MLLPClient', FakeClient)
+    pool = mllp.MLLPConnectionPool()
+    hilo = threading.Thread(target=pool.get, args=('lento', 1))
+    hilo.start()
+    try:
+        time.sleep(0.1)  # El hilo ya está conectando con 'lento'
+        inicio = time.monotonic()
+        assert pool.get('rapido', 1).host == 'rapido'
+        assert time.monotonic() - inicio < 1.0
+    finally:
+        FakeClient.liberar.set()
+        hilo.join()
+    assert len(pool._clients[('lento', 1)]) == 1
+
+
+def test_conexiones_de_mas_se_cierran(monkeypatch):
+    creadas = []
+
+    class Registrado(FakeClient):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            creadas.append(self)
+
+    monkeypatch.setattr(mllp, 'MLLPClient', Registrado)
+    pool = mllp.MLLPConnectionPool(max_connections=1)
+    existente = FakeClient('rapido', 1)
+    # Al entrar el pool está vacío; mientras se conecta, otro hilo añade la única permitida
+    vistas = iter([[], [existente]])
+    monkeypatch.setattr(pool, '_open_clients', lambda host, port: next(vistas))
+    assert pool.get('rapido', 1) is existente
+    assert len(creadas) == 1 and creadas[0].closed
@@ -0,0 +1,36 @@
+"""
+Pruebas de los carriles por paciente del RIS (partitioned.py en ris_simulator.py).
+"""
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import his_simulator
+import ris_simulator
+
+
+# Conexión falsa: el ACK tarda en escribirse, como con un HIS lento
+class SlowConn:
+    def __init__(self, delay=0.005):
+        self.delay = delay
+        self.acks = 0
+
+    def sendall(self, data):
+        time.sleep(self.delay)
+        self.acks += 1
+
+
+def test_carga_sesgada_marca_el_carril_caliente(monkeypatch):
+    avisos = []
+    monkeypatch.setattr(ris_simulator.log, 'warning', lambda fmt, *args: avisos.append(fmt % args))
+    run = uuid.uuid4().hex[:8]
+    mensajes = [his_simulator.build_adt_a04(f'T{run}{i:05d}',
+                                            dict(his_simulator.PACIENTE, id='CALIENTE' if i % 10 else f'P{i}'))
+                for i in range(400)]
+    conn = SlowConn()
+    # Tantos hilos como callbacks simultáneos del servidor MLLP
+    with ThreadPoolExecutor(ris_simulator.DEFAULT_HANDLER_WORKERS) as pool:
+        list(pool.map(lambda hl7: ris_simulator.on_ris_message(hl7, conn), mensajes))
+    assert conn.acks == len(mensajes)
+    calientes = [a for a in avisos if 'caliente' in a]
+    assert calientes and 'CALIENTE' in calientes[0]
@@ -0,0 +1,44 @@
+"""
+Pruebas del despachador de resultados ORU^R01 del RIS (ResultDispatcher en ris_simulator.py).
+"""
+import ris_simulator
+
+
+# ACK del HIS con el código MSA-1 indicado
+def _ack(code):
+    return f'MSH|^~\\&|HIS|HOSP|RIS|RAD|20250101120000||ACK|A1|P|2.5\rMSA|{code}|ORU0001'
+
+
+# Registro de órdenes falso (ris_prefork.OrderStore)
+class FakeStore:
+    def __init__(self):
+        self.estados = {}
+
+    def done(self, order_id, status):
+        self.estados[order_id] = status
+
+
+def _orden(n):
+    return {'order_id': f'ORD{n}', 'estudio': 'RX', 'recibida': 0.0}
+
+
+def test_trabajadores_prefork_no_repiten_msh_10(monkeypatch):
+    enviados = []
+    monkeypatch.setattr(ris_simulator, 'enviar_resultado', lambda orden, oru_id: enviados.append(oru_id) or _ack('AA'))
+    for worker in range(2):
+        despachador = ris_simulator.ResultDispatcher(oru_prefix=f'ORU{worker}-')
+        for n in range(3):
+            despachador._send(_orden(n))
+    assert len(set(enviados)) == 6
+
+
+def test_ack_rechazado_o_ausente_cuenta_como_error(monkeypatch):
+    acks = iter([_ack('AA'), _ack('AE'), None, _ack('CA')])
+    monkeypatch.setattr(ris_simulator, 'enviar_resultado', lambda orden, oru_id: next(acks))
+    store = FakeStore()
+    despachador = ris_simulator.ResultDispatcher(store=store)
+    for n in range(4):
+        despachador._send(_orden(n))
+    assert despachador.procesadas == 2
+    assert despachador.errores == 2
+    assert store.estados == {'ORD0': 'sent', 'ORD1': 'error', 'ORD2': 'error', 'ORD3': 'sent'}
@@ -0,0 +1,148 @@
+"""
+Envío de logs al monitor web en segundo plano.
+Los simuladores encolan cada registro sin esperar a la red; un hilo los agrupa y los
+envía en un único POST a /log/batch cada flush_interval segundos o cada max_batch
+registros, reutilizando una sola sesión HTTP keep-alive. Si la cola se llena o el
+monitor no responde, los registros se vuelcan a disco (spill_path) o se descartan.
+"""
+# Importación de librerías estándar y de terceros
+import atexit  # Para vaciar la cola al salir
+import datetime  # Para el timestamp de cada registro
+import json  # Para volcar registros a disco
+import os  # Para gestionar el fichero de volcado
+import queue  # Cola entre los simuladores y el hilo de envío
+import threading  # Hilo de envío
+import time  # Para medir el intervalo de envío
+import requests  # Cliente HTTP hacia el monitor
+import metrics  # Estado de la cola en /metrics
+
+# Configuración por defecto
+MONITOR_URL = 'http://localhost:5000'  # Monitor web (web_monitor.py)
+FLUSH_INTERVAL = 0.2  # Segundos máximos que un registro espera en la cola
+MAX_BATCH = 500  # Registros máximos por POST
+MAX_QUEUE = 10000  # Registros en memoria antes de volcar/descartar
+HTTP_TIMEOUT = 2  # Segundos máximos por POST
+
+
+# Agrupador y emisor de logs hacia el monitor
+# log() nunca bloquea: si la cola está llena el registro va al fichero de volcado
+# (si se configuró) o se descarta y se cuenta en dropped.
+class LogShipper:
+    def __init__(self, url=MONITOR_URL, flush_interval=FLUSH_INTERVAL, max_batch=MAX_BATCH,
+                 max_queue=MAX_QUEUE, spill_path=None, timeout=HTTP_TIMEOUT):
+        self.url = url.rstrip('/') + '/log/batch'
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.spill_path = spill_path
+        self.timeout = timeout
+        self.sent = 0  # Registros entregados al monitor
+        self.dropped = 0  # Registros perdidos (cola llena o monitor caído sin volcado)
+        self.spilled = 0  # Registros volcados a disco
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._session = requests.Session()
+        self._spill_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+    # Encola un registro para el monitor (no bloquea)
+    def log(self, msg, source):
+        if self._thread is None:
+            self._start()
+        record = {'source': source, 'msg': msg,
+                  'timestamp': datetime.datetime.now().strftime('%H:%M:%S')}
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._overflow([record])
+
+    # Espera (como máximo timeout segundos) a que la cola se vacíe
+    def flush(self, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='web-log-shipper',
+                                                daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    # Hilo de envío: junta registros hasta max_batch o flush_interval y los envía juntos
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if self._post(batch):
+                self._drain_spill()
+            else:
+                self._overflow(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    # Envía un lote al monitor; devuelve False si no se pudo entregar
+    def _post(self, batch):
+        try:
+            response = self._session.post(self.url, json=batch, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException:
+            return False
+        self.sent += len(batch)
+        return True
+
+    # Registros que no caben en memoria o que el monitor no aceptó
+    def _overflow(self, records):
+        if not self.spill_path:
+            self.dropped += len(records)
+            return
+        try:
+            with self._spill_lock, open(self.spill_path, 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.spilled += len(records)
+        except OSError:
+            self.dropped += len(records)
+
+    # Reenvía lo volcado a disco cuando el monitor vuelve a responder
+    def _drain_spill(self):
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        pending = self.spill_path + '.sending'
+        with self._spill_lock:
+            try:
+                os.replace(self.spill_path, pending)
+            except OSError:
+                return
+        online = True  # Tras el primer fallo el resto vuelve al fichero sin reintentar
+        with open(pending, encoding='utf-8') as f:
+            batch = []
+            for line in f:
+                batch.append(json.loads(line))
+                if len(batch) >= self.max_batch:
+                    online = online and self._post(batch)
+                    if not online:
+                        self._overflow(batch)
+                    batch = []
+            if batch and not (online and self._post(batch)):
+                self._overflow(batch)
+        os.remove(pending)
+
+
+# Emisor por defecto compartido por los simuladores (el hilo arranca con el primer log)
+shipper = LogShipper()
+
+QUEUE_DEPTH = metrics.gauge('web_log_queue_depth', 'Registros de log esperando envío al monitor')
+QUEUE_DEPTH.set_function(lambda: shipper._queue.qsize())
+RECORDS = metrics.counter('web_log_records_total', 'Registros de log por destino final', ('result',))
+RECORDS.labels('sent').set_function(lambda: shipper.sent)
+RECORDS.labels('dropped').set_function(lambda: shipper.dropped)
+RECORDS.labels('spilled').set_function(lambda: shipper.spilled)
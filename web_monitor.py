@@ -2,11 +2,72 @@
 from flask import Flask, render_template, request  # Flask para la web, render_template para HTML, request para POST
 from flask_socketio import SocketIO, emit  # SocketIO para comunicación en tiempo real
 import datetime  # Para timestamp de los logs
+import json  # Para leer lotes en formato JSON lines
+import threading  # Para proteger el buffer de logs pendientes
+import metrics  # Registro de métricas y formato de /metrics
 
 # Inicialización de la aplicación Flask y SocketIO
 app = Flask(__name__)
 socketio = SocketIO(app, cors_allowed_origins="*")  # Permite conexiones desde cualquier origen
 
+# Difusión agrupada: los logs recibidos se acumulan y se envían a los navegadores como un
+# único evento 'new_logs' (lista de registros) a lo sumo BROADCAST_FPS veces por segundo
+BROADCAST_FPS = 10  # Envíos por segundo hacia los navegadores
+MAX_PENDING_LOGS = 5000  # Registros acumulados como máximo entre dos envíos (se descartan los más antiguos)
+
+# Agrupador de logs para Socket.IO
+class LogCoalescer:
+    def __init__(self, fps=BROADCAST_FPS, max_pending=MAX_PENDING_LOGS):
+        self.fps = fps
+        self.max_pending = max_pending
+        self.dropped = 0  # Registros descartados por exceso entre dos envíos
+        self._pending = []
+        self._lock = threading.Lock()
+        self._task = None
+
+    # Añade registros al siguiente envío
+    def add(self, records):
+        if self._task is None:
+            self._start()
+        with self._lock:
+            self._pending.extend(records)
+            exceso = len(self._pending) - self.max_pending
+            if exceso > 0:
+                del self._pending[:exceso]
+                self.dropped += exceso
+
+    def _start(self):
+        with self._lock:
+            if self._task is None:
+                self._task = socketio.start_background_task(self._run)
+
+    # Tarea de fondo: envía lo acumulado como un solo evento por intervalo
+    def _run(self):
+        while True:
+            socketio.sleep(1.0 / self.fps)
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if batch:
+                socketio.emit('new_logs', batch)
+                BROADCASTS.inc()
+
+coalescer = LogCoalescer()
+
+# Métricas del monitor
+LOGS_RECEIVED = metrics.counter('web_monitor_logs_received_total', 'Registros de log recibidos', ('source',))
+REQUESTS = metrics.counter('web_monitor_requests_total', 'Peticiones POST de logs recibidas', ('route',))
+BROADCASTS = metrics.counter('web_monitor_broadcasts_total', 'Eventos new_logs enviados a los navegadores')
+PENDING = metrics.gauge('web_monitor_pending_logs', 'Registros esperando el siguiente envío')
+PENDING.set_function(lambda: len(coalescer._pending))
+DROPPED = metrics.counter('web_monitor_dropped_logs_total', 'Registros descartados por exceso')
+DROPPED.set_function(lambda: coalescer.dropped)
+
+# Función para completar un registro recibido con la hora de llegada si no trae la de origen
+def _stamp(data, now):
+    data.setdefault('timestamp', now)
+    LOGS_RECEIVED.labels(data.get('source', '')).inc()
+    return data
+
 # Ruta principal: muestra la interfaz web de monitorización
 def index():
     return render_template('monitor.html')  # Renderiza la plantilla HTML
@@ -16,10 +77,40 @@ app.route('/')(index)
 @app.route('/log', methods=['POST'])
 def log():
     data = request.json  # Recibe JSON con {'source': 'HIS'/'RIS', 'msg': 'texto'}
-    data['timestamp'] = datetime.datetime.now().strftime('%H:%M:%S')  # Agrega hora
-    socketio.emit('new_log', data)  # Envía el log a todos los clientes conectados
+    REQUESTS.labels('/log').inc()
+    if not isinstance(data, dict):
+        return {'status': 'error', 'error': 'Se esperaba un objeto JSON'}, 400
+    now = datetime.datetime.now().strftime('%H:%M:%S')  # Agrega hora
+    coalescer.add([_stamp(data, now)])  # Se envía a los clientes en el siguiente lote
     return {'status': 'ok'}  # Respuesta simple
 
+# Ruta para recibir varios logs en un solo POST, usada por web_log_shipper.py
+# Acepta una lista JSON (application/json) o un registro JSON por línea (JSON lines)
+@app.route('/log/batch', methods=['POST'])
+def log_batch():
+    REQUESTS.labels('/log/batch').inc()
+    if request.is_json:
+        records = request.get_json()
+        if isinstance(records, dict):
+            records = [records]
+    else:
+        try:
+            records = [json.loads(line) for line in request.get_data(as_text=True).splitlines()
+                       if line.strip()]
+        except ValueError:
+            return {'status': 'error', 'error': 'JSON lines no válido'}, 400
+    # Cada registro debe ser un objeto JSON; el lote se rechaza entero si alguno no lo es
+    if not isinstance(records, list) or not all(isinstance(data, dict) for data in records):
+        return {'status': 'error', 'error': 'Se esperaba una lista de objetos JSON'}, 400
+    now = datetime.datetime.now().strftime('%H:%M:%S')
+    coalescer.add([_stamp(data, now) for data in records])
+    return {'status': 'ok', 'count': len(records)}
+
+# Ruta de métricas en formato de texto de Prometheus
+@app.route('/metrics')
+def metrics_endpoint():
+    return metrics.render(), 200, {'Content-Type': metrics.CONTENT_TYPE}
+
 # Punto de entrada principal: inicia el servidor web en modo debug
 if __name__ == '__main__':
     socketio.run(app, host='0.0.0.0', port=5000, debug=True)